@@ -1,156 +1,759 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 from flask_cors import CORS
-from google.cloud import bigquery
-from google.oauth2 import service_account
 import os
-import json
-import base64
-from datetime import datetime
+import contextvars
+import functools
+import select
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from urllib.parse import urlsplit, parse_qsl
+
+import fact_cube
+import pendings_cube
+import queries
+import response_encoding
+from response_encoding import Columns
+from async_jobs import DONE, ERROR, JobRegistry
+from cache import ResultCache
+from cache_warmer import CacheWarmer
+from circuit_breaker import CircuitBreaker
+from distinct_sketch import DailySketches
+from quantile_sketch import DailyQuantiles, LogBuckets
+from monthly_store import MonthlyStore
+from job_scheduler import BATCH, INTERACTIVE, JobScheduler, is_quota_error, priority
+from query_runner import SingleFlight, current_deadline, query_budget, run_all
+from query_stats import QueryStats
+from response_snapshot import ResponseSnapshot
+from shared_cache import store_from_env, store_key
+from warehouse import warehouse_from_env
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# Inicializar cliente de BigQuery
-# En producción usa GOOGLE_CREDENTIALS_B64 (service account en base64)
-# En local usa Application Default Credentials (gcloud auth)
-_creds_b64 = os.environ.get('GOOGLE_CREDENTIALS_B64')
-if _creds_b64:
-    _creds_json = json.loads(base64.b64decode(_creds_b64).decode('utf-8'))
-    _credentials = service_account.Credentials.from_service_account_info(
-        _creds_json,
-        scopes=['https://www.googleapis.com/auth/bigquery']
+# Backend de warehouse: BigQuery en producción, DuckDB sobre Parquet en local (ver warehouse.py)
+warehouse = warehouse_from_env()
+
+# Queries idénticas concurrentes comparten un único job de BigQuery (ver query_runner.py)
+query_flight = SingleFlight()
+
+# Costo y latencia de cada job, expuestos en /api/debug/queries (ver query_stats.py)
+query_stats = QueryStats(max_records=int(os.environ.get('QUERY_STATS_MAX_RECORDS', 500)))
+
+
+# Todos los jobs pasan por el planificador: límite de concurrencia, token bucket de
+# lanzamientos, reintentos por cuota y prioridad de requests sobre precalentamiento
+# (ver job_scheduler.py)
+job_scheduler = JobScheduler(
+    max_concurrent=int(os.environ.get('JOB_MAX_CONCURRENT', 12)),
+    rate=float(os.environ.get('JOB_SUBMIT_RATE', 10)),
+    burst=int(os.environ.get('JOB_SUBMIT_BURST', 20)),
+    max_retries=int(os.environ.get('JOB_QUOTA_MAX_RETRIES', 4)),
+    base_backoff=float(os.environ.get('JOB_QUOTA_BACKOFF_SECONDS', 1)),
+)
+
+
+# Circuit breaker: tras errores seguidos de cuota o deadline deja de lanzar jobs, los
+# endpoints sirven su última respuesta buena (stale) y se prueba el warehouse en background
+# La sonda va siempre al warehouse remoto: con WAREHOUSE=snapshot un SELECT 1 correría en
+# el DuckDB local y cerraría el circuito aunque BigQuery siga caído
+probe_warehouse = getattr(warehouse, 'remote', warehouse)
+warehouse_breaker = CircuitBreaker(
+    probe=lambda: probe_warehouse.submit(queries.warehouse_probe()).result(timeout=30),
+    failure_threshold=int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5)),
+    open_seconds=int(os.environ.get('BREAKER_OPEN_SECONDS', 30)),
+    max_open_seconds=int(os.environ.get('BREAKER_MAX_OPEN_SECONDS', 300)),
+)
+
+
+def _on_job_result(endpoint, job, error, wall_ms):
+    query_stats.record_job(endpoint, job, error, wall_ms)
+    if error is None:
+        warehouse_breaker.record_success()
+    elif is_quota_error(error):
+        warehouse_breaker.record_failure(error)
+
+
+def submit_query(query):
+    """
+    Lanza la query (queries.Query) o se suma a una idéntica en vuelo.
+    Devuelve un handle con .rows()
+    """
+    # Las queries que el snapshot local resuelve no dependen del estado de BigQuery
+    if not (hasattr(warehouse, 'is_local') and warehouse.is_local(query)):
+        warehouse_breaker.check()
+    endpoint = query_stats.current_endpoint()
+    return query_flight.submit(
+        query.key,
+        lambda: job_scheduler.submit(lambda: warehouse.submit(query)),
+        on_result=lambda job, error, wall_ms: _on_job_result(endpoint, job, error, wall_ms),
+        deadline=current_deadline(),
+    )
+
+
+def _record_cancellation(reason, jobs_cancelled):
+    endpoint = query_stats.current_endpoint()
+    query_stats.record_cancellation(endpoint, reason, jobs_cancelled)
+    if reason == 'deadline':
+        warehouse_breaker.record_failure(f"deadline vencido en {endpoint}")
+
+
+def run_query(query):
+    """Ejecuta la query dentro del deadline del request y devuelve la lista de filas"""
+    with query_stats.waiting():
+        return run_all(submit_query, {'query': query}, on_cancel=_record_cancellation)['query']
+
+
+# Deadline (segundos) para los jobs de cada endpoint; vencido, o si el cliente se
+# desconecta, los jobs que nadie más espera se cancelan (ver query_runner.query_budget).
+# Se configura por endpoint con QUERY_DEADLINE_<NOMBRE>_SECONDS, p. ej. QUERY_DEADLINE_MONTH_DETAIL_SECONDS
+QUERY_DEFAULT_DEADLINE = int(os.environ.get('QUERY_DEADLINE_SECONDS', 120))
+QUERY_DEADLINES = {
+    name: int(os.environ.get(f'QUERY_DEADLINE_{name.upper()}_SECONDS', QUERY_DEFAULT_DEADLINE))
+    for name in (
+        'monthly', 'sellers', 'recurrence', 'month_detail', 'nextsteps', 'pendings_summary',
+        'pendings_monthly', 'pendings_comparison', 'mtd', 'fact_cube', 'pendings_cube', 'daily_sketches',
+        'pendings_latency', 'latency_sketches',
+    )
+}
+
+
+def run_queries(endpoint, queries):
+    """
+    Lanza todas las queries (dict nombre -> query) por adelantado y las espera en paralelo
+    con el deadline del endpoint. Devuelve dict nombre -> filas.
+    """
+    with query_stats.waiting(), query_budget(QUERY_DEADLINES.get(endpoint, QUERY_DEFAULT_DEADLINE)):
+        return run_all(submit_query, queries, on_cancel=_record_cancellation)
+
+# Caché de resultados por endpoint + parámetros (ver cache.py).
+# Las entradas se vencen cuando cambia la versión de sus tablas fuente (ver CACHE_SOURCES);
+# el TTL es solo un tope por si no se puede leer la metadata.
+CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_TTL_SECONDS', 6 * 3600))
+CACHE_TTLS = {
+    'monthly': CACHE_DEFAULT_TTL,
+    'sellers': CACHE_DEFAULT_TTL,
+    'recurrence': CACHE_DEFAULT_TTL,
+    'month_detail': CACHE_DEFAULT_TTL,
+    'nextsteps': CACHE_DEFAULT_TTL,
+    'pendings_summary': CACHE_DEFAULT_TTL,
+    'pendings_monthly': CACHE_DEFAULT_TTL,
+    'pendings_comparison': CACHE_DEFAULT_TTL,
+    'mtd': min(CACHE_DEFAULT_TTL, 900),  # incluye el día en curso
+    'fact_cube': min(CACHE_DEFAULT_TTL, 900),
+    'pendings_cube': CACHE_DEFAULT_TTL,
+    'daily_sketches': min(CACHE_DEFAULT_TTL, 900),
+    'pendings_latency': CACHE_DEFAULT_TTL,
+    'latency_sketches': CACHE_DEFAULT_TTL,
+}
+# Almacén compartido por los workers (SQLite en el host por defecto, Redis entre hosts):
+# un resultado lo calcula un solo worker y los demás lo adoptan (ver shared_cache.py)
+# Tablas de las que depende cada entrada: al cambiar una solo se vencen (y se recalculan)
+# las entradas que la leen
+EVENTS, PENDINGS = queries.EVENTS_TABLE, queries.PENDINGS_TABLE
+CACHE_SOURCES = {
+    'monthly': (EVENTS,),
+    'sellers': (EVENTS,),
+    'recurrence': (EVENTS,),
+    'month_detail': (EVENTS,),
+    'nextsteps': (EVENTS,),
+    'pendings_summary': (PENDINGS, EVENTS),
+    'pendings_monthly': (PENDINGS, EVENTS),
+    'pendings_comparison': (PENDINGS, EVENTS),
+    'mtd': (EVENTS,),
+    'fact_cube': (EVENTS,),
+    'pendings_cube': (PENDINGS, EVENTS),
+    'daily_sketches': (EVENTS, PENDINGS),
+    'pendings_latency': (PENDINGS, EVENTS),
+    'latency_sketches': (PENDINGS, EVENTS),
+}
+
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('CACHE_MAX_ENTRIES', 256)),
+    stale_ttl=int(os.environ.get('CACHE_STALE_SECONDS', 6 * 3600)),
+    store=store_from_env(
+        namespace=os.environ.get('CACHE_STORE_NAMESPACE') or store_key(sorted(warehouse.describe().items()))
+    ),
+    lease_ttl=int(os.environ.get('CACHE_LEASE_SECONDS', 300)),
+    sources=CACHE_SOURCES,
+)
+
+
+# Vistas con caché: endpoint de Flask -> (nombre en caché, params, vista), para recalcularlas
+# fuera de un request (ver refresh_url)
+_cached_views = {}
+
+
+def _cache_entry(name, params, view, path, kwargs, query_args):
+    """Clave de caché y función de cálculo de una vista para una ruta + query string"""
+    args = {p: query_args[p] for p in params if p in query_args}
+    key = (name, tuple(sorted(kwargs.items())), tuple(sorted(args.items())))
+
+    def compute():
+        # Contexto propio para poder recalcular también desde el thread de revalidación
+        with app.test_request_context(path, query_string=args), query_stats.scope(name), \
+                query_budget(QUERY_DEADLINES.get(name, QUERY_DEFAULT_DEADLINE)):
+            return _view_payload(view(**kwargs))
+
+    return key, compute
+
+
+def _view_payload(result):
+    """
+    (payload, status) de lo que devuelve una vista con caché: el payload tal cual (puede
+    tener Columns, se serializa al responder) o un jsonify(...), con o sin status.
+    """
+    payload, status = result if isinstance(result, tuple) else (result, None)
+    if isinstance(payload, app.response_class):
+        status = status or payload.status_code
+        payload = payload.get_json()
+    return payload, status or 200
+
+
+def _client_disconnected_probe(environ):
+    """
+    Función que indica si el cliente cerró la conexión (socket legible sin datos), o None
+    si el servidor no expone el socket (gunicorn y el servidor de desarrollo sí lo hacen).
+    """
+    sock = environ.get('gunicorn.socket') or environ.get('werkzeug.socket')
+    if sock is None:
+        return None
+
+    def disconnected():
+        try:
+            if sock.fileno() == -1:
+                return True
+            readable, _, _ = select.select([sock], [], [], 0)
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b''
+        except ConnectionError:
+            return True
+        except (OSError, ValueError):  # p. ej. sockets TLS, que no admiten MSG_PEEK
+            return False
+    return disconnected
+
+
+def _is_cacheable(value):
+    return value[1] == 200
+
+
+# Modo asincrónico (?async=1): el cálculo corre en un pool propio y el request responde
+# 202 con un handle para consultar en /api/jobs/<id> (ver async_jobs.py)
+async_jobs = JobRegistry(
+    max_workers=int(os.environ.get('ASYNC_JOB_WORKERS', 4)),
+    result_ttl=int(os.environ.get('ASYNC_JOB_RESULT_TTL_SECONDS', 600)),
+)
+
+
+def _stale_payload(value, age_s):
+    """Última respuesta buena, marcada con stale y su antigüedad, mientras el warehouse está limitado"""
+    payload, status = value
+    if isinstance(payload, dict):
+        payload = {**payload, 'stale': True, 'stale_age_s': round(age_s)}
+    return (payload, status), 'stale-fallback'
+
+
+def _serve_cached(key, compute, ttl):
+    """
+    ((payload, status), estado de caché) de una vista con caché. Las entradas vigentes se
+    sirven normalmente; si la entrada venció y el circuito del warehouse está abierto (o
+    el recálculo falla con el circuito abierto) sirve la última respuesta buena, o 503 si
+    no hay ninguna.
+    """
+    # Entrada vencida con el circuito abierto: la última respuesta buena, sin intentar calcular
+    if warehouse_breaker.is_open() and not result_cache.contains(key):
+        last_good = result_cache.last_good(key)
+        if last_good:
+            return _stale_payload(*last_good)
+    value, estado = result_cache.get_or_compute(key, compute, ttl, should_cache=_is_cacheable)
+    if value[1] >= 500 and warehouse_breaker.is_open():
+        last_good = result_cache.last_good(key)
+        if last_good:
+            return _stale_payload(*last_good)
+        value = (value[0], 503)
+    return value, estado
+
+
+def _response_body(key, value, columnar, encoding):
+    """(bytes, Content-Encoding) de value serializado, guardado junto a su entrada de caché"""
+    def build():
+        return response_encoding.encode(response_encoding.dumps(value[0], columnar), encoding)
+    return result_cache.derived(key, value, ('columnar' if columnar else 'rows', encoding), build)
+
+
+def _json_response(body, content_encoding):
+    response = app.response_class(body, mimetype='application/json')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def cached_endpoint(name, params=()):
+    """
+    Cachea la respuesta JSON de un endpoint por nombre + argumentos de la ruta + los
+    parámetros de query string listados en params. Solo se cachean respuestas 200. La
+    vista puede devolver el payload directamente (p. ej. con Columns) en lugar de jsonify.
+    Con ?async=1 y sin respuesta en caché devuelve 202 y calcula en background.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            key, compute = _cache_entry(name, params, view, request.path, kwargs, request.args)
+            ttl = CACHE_TTLS.get(name, CACHE_DEFAULT_TTL)
+            if request.args.get('async') == '1' and not result_cache.contains(key):
+                def compute_async():
+                    with priority(INTERACTIVE):
+                        return result_cache.get_or_compute(key, compute, ttl, should_cache=_is_cacheable)[0]
+                job = async_jobs.submit(key, name, compute_async)
+                response = jsonify({**job.describe(), 'status_url': f'/api/jobs/{job.id}'})
+                response.status_code = 202
+                response.headers['Location'] = f'/api/jobs/{job.id}'
+                return response
+            with priority(INTERACTIVE), query_budget(cancelled=_client_disconnected_probe(request.environ)):
+                value, estado = _serve_cached(key, compute, ttl)
+            status = value[1]
+            # ?format=columnar: un array por campo; el cuerpo va serializado y comprimido
+            response = _json_response(*_response_body(
+                key, value, request.args.get('format') == 'columnar',
+                response_encoding.negotiate(request.headers.get('Accept-Encoding'))
+            ))
+            response.status_code = status
+            response.headers['X-Cache'] = estado.upper()
+            if status == 503:
+                response.headers['Retry-After'] = str(warehouse_breaker.open_seconds)
+            return response
+        _cached_views[view.__name__] = (name, params, view)
+        return wrapper
+    return decorator
+
+
+def _url_entry(url):
+    """(nombre en caché, clave, compute) de la vista con caché que responde url"""
+    parts = urlsplit(url)
+    endpoint, kwargs = app.url_map.bind('localhost').match(parts.path)
+    name, params, view = _cached_views[endpoint]
+    return (name, *_cache_entry(name, params, view, parts.path, kwargs, dict(parse_qsl(parts.query))))
+
+
+def refresh_url(url):
+    """Recalcula y guarda en caché la respuesta de url (ruta + query string) sin servirla"""
+    name, key, compute = _url_entry(url)
+    payload, status = result_cache.refresh(
+        key, compute, CACHE_TTLS.get(name, CACHE_DEFAULT_TTL), should_cache=_is_cacheable
+    )
+    # 404 = período sin datos, no es un error del recálculo
+    if status >= 500:
+        raise RuntimeError(f"{url} devolvió {status}: {payload.get('error') if payload else ''}")
+    return status
+
+
+# Agregados mensuales persistidos: cada refresco de monthly solo consulta los meses abiertos
+monthly_store = MonthlyStore(
+    os.environ.get('MONTHLY_STORE_PATH', 'monthly_aggregates.sqlite'),
+    late_months=int(os.environ.get('MONTHLY_LATE_ARRIVAL_MONTHS', 1)),
+    source=repr(sorted(warehouse.describe().items())),
+)
+
+
+def _compute_fact_cube():
+    with query_stats.scope('fact_cube'):
+        return fact_cube.FactCube(run_queries('fact_cube', {'cube': queries.fact_cube()})['cube'])
+
+
+FACT_CUBE_KEY = ('fact_cube', (), ())
+
+
+def get_fact_cube():
+    """Cubo de hechos compartido por monthly, sellers, recurrence y MTD: un scan por refresco"""
+    cube, _ = result_cache.get_or_compute(FACT_CUBE_KEY, _compute_fact_cube, CACHE_TTLS['fact_cube'])
+    return cube
+
+
+def refresh_fact_cube():
+    return result_cache.refresh(FACT_CUBE_KEY, _compute_fact_cube, CACHE_TTLS['fact_cube'])
+
+
+def _compute_pendings_cube():
+    with query_stats.scope('pendings_cube'):
+        return pendings_cube.PendingsCube(run_queries('pendings_cube', {'cube': queries.pendings_cube()})['cube'])
+
+
+PENDINGS_CUBE_KEY = ('pendings_cube', (), ())
+
+
+def get_pendings_cube():
+    """Cubo compartido por summary, monthly (ambos filtros) y comparison de pendings: un job por refresco"""
+    cube, _ = result_cache.get_or_compute(PENDINGS_CUBE_KEY, _compute_pendings_cube, CACHE_TTLS['pendings_cube'])
+    return cube
+
+
+def refresh_pendings_cube():
+    return result_cache.refresh(PENDINGS_CUBE_KEY, _compute_pendings_cube, CACHE_TTLS['pendings_cube'])
+
+
+# Sellers únicos por rango de fechas (?from=&to=): sketches diarios fusionables en proceso.
+# exact = universo de ids por día (exacto); approx = HyperLogLog (2^HLL_PRECISION bytes por día)
+HLL_PRECISION = int(os.environ.get('HLL_PRECISION', 12))
+DISTINCT_SKETCH_MODE = os.environ.get('DISTINCT_SKETCH_MODE', 'exact')
+
+
+def _compute_daily_sketches():
+    with query_stats.scope('daily_sketches'):
+        return DailySketches(run_query(queries.daily_sellers()), precision=HLL_PRECISION)
+
+
+DAILY_SKETCHES_KEY = ('daily_sketches', (), ())
+
+
+def get_daily_sketches():
+    sketches, _ = result_cache.get_or_compute(
+        DAILY_SKETCHES_KEY, _compute_daily_sketches, CACHE_TTLS['daily_sketches']
     )
-    client = bigquery.Client(credentials=_credentials, project='meli-bi-data')
-else:
-    client = bigquery.Client()
+    return sketches
+
+
+def refresh_daily_sketches():
+    return result_cache.refresh(DAILY_SKETCHES_KEY, _compute_daily_sketches, CACHE_TTLS['daily_sketches'])
+
+
+# Percentiles de latencia hasta el pago por rango: histogramas diarios de buckets
+# logarítmicos (error relativo LATENCY_SKETCH_ALPHA), fusionables en proceso
+LATENCY_BUCKETS = LogBuckets(alpha=float(os.environ.get('LATENCY_SKETCH_ALPHA', 0.01)))
+
+
+def _compute_latency_sketches():
+    with query_stats.scope('latency_sketches'):
+        rows = run_queries('latency_sketches', {
+            'latency': queries.pendings_latency(LATENCY_BUCKETS.gamma, LATENCY_BUCKETS.min_value)
+        })['latency']
+        return DailyQuantiles(rows, LATENCY_BUCKETS)
+
+
+LATENCY_SKETCHES_KEY = ('latency_sketches', (), ())
+
+
+def get_latency_sketches():
+    sketches, _ = result_cache.get_or_compute(
+        LATENCY_SKETCHES_KEY, _compute_latency_sketches, CACHE_TTLS['latency_sketches']
+    )
+    return sketches
+
+
+def refresh_latency_sketches():
+    return result_cache.refresh(LATENCY_SKETCHES_KEY, _compute_latency_sketches, CACHE_TTLS['latency_sketches'])
+
+
+RANGE_PARAMS = ('from', 'to', 'mode')
+
+
+def date_range_args():
+    """
+    (desde, hasta, exact) de ?from=YYYY-MM-DD&to=YYYY-MM-DD&mode=exact|approx, o None si el
+    request no pide un rango. ValueError si los parámetros son inválidos.
+    """
+    desde, hasta = request.args.get('from'), request.args.get('to')
+    if desde is None and hasta is None:
+        return None
+    mode = request.args.get('mode', DISTINCT_SKETCH_MODE)
+    if mode not in ('exact', 'approx'):
+        raise ValueError(f"mode inválido: {mode!r} (usar exact o approx)")
+    desde, hasta = queries.parse_date_range(desde, hasta)
+    return desde, hasta, mode == 'exact'
+
+
+def range_payload(desde, hasta, exact):
+    return {'from': desde.isoformat(), 'to': hasta.isoformat(), 'mode': 'exact' if exact else 'approx'}
+
+
+def warm_urls():
+    """Todas las respuestas que pide el dashboard, con los mismos parámetros que el frontend"""
+    urls = [
+        '/api/metrics/monthly',
+        '/api/metrics/sellers',
+        '/api/metrics/sellers/recurrence',
+        '/api/metrics/nextsteps',
+        '/api/pendings/summary',
+        '/api/pendings/monthly',
+        '/api/pendings/monthly?filter=event',
+        '/api/pendings/monthly?filter=fiscal',
+        '/api/pendings/comparison',
+        '/api/pendings/latency',
+    ]
+    urls += [f'/api/metrics/mtd?months={n}' for n in range(2, 7)]
+    # Meses más recientes primero: son los más consultados
+    for mes_idx in reversed(get_fact_cube().months()):
+        periodo = fact_cube.month_label(mes_idx)
+        urls += [f'/api/metrics/month/{periodo}?filter=event', f'/api/metrics/month/{periodo}?filter=fiscal']
+    return urls
+
+
+# Snapshot en disco de las respuestas: un proceso nuevo (p. ej. tras un deploy) lo carga en
+# background y sirve al instante mientras recalcula (ver response_snapshot.py)
+RESPONSE_SNAPSHOT_PATH = os.environ.get('RESPONSE_SNAPSHOT_PATH', 'response_snapshot.json.gz')
+response_snapshot = ResponseSnapshot(
+    RESPONSE_SNAPSHOT_PATH, namespace=repr(sorted(warehouse.describe().items()))
+) if RESPONSE_SNAPSHOT_PATH else None
+
+
+def save_response_snapshot():
+    names = {name for name, _, _ in _cached_views.values()}
+    return response_snapshot.save(result_cache.export(names))
+
+
+def restore_response(key, value, created_at, tags):
+    result_cache.restore(key, value, created_at, CACHE_TTLS.get(key[0], CACHE_DEFAULT_TTL), tags)
+
+
+def _affected(name, changed):
+    """True si la entrada name depende de alguna tabla de changed (None = todas cambiaron)"""
+    return changed is None or any(table in changed for table in CACHE_SOURCES.get(name, ()))
+
+
+# Precalentamiento: al detectar una carga nueva de las tablas (metadata del warehouse)
+# recalcula las respuestas que dependen de las tablas que cambiaron, primero el cubo y
+# después los endpoints. Con WAREHOUSE=snapshot antes sincroniza el snapshot local de eventos.
+warm_stages = [
+    lambda changed: [(name, fn) for name, fn in (('fact_cube', refresh_fact_cube),
+                                                 ('pendings_cube', refresh_pendings_cube),
+                                                 ('daily_sketches', refresh_daily_sketches),
+                                                 ('latency_sketches', refresh_latency_sketches))
+                     if _affected(name, changed)],
+    lambda changed: [(url, functools.partial(refresh_url, url)) for url in warm_urls()
+                     if _affected(_url_entry(url)[0], changed)],
+]
+if hasattr(warehouse, 'snapshot'):
+    def sync_event_snapshot():
+        with job_scheduler.slot(BATCH):
+            return warehouse.sync()
+    warm_stages.insert(0, lambda changed: [('event_snapshot', sync_event_snapshot)]
+                       if changed is None or EVENTS in changed else [])
+if response_snapshot is not None:
+    warm_stages.append(lambda changed: [('response_snapshot', save_response_snapshot)])
+
+cache_warmer = CacheWarmer(
+    warehouse,
+    stages=warm_stages,
+    interval=int(os.environ.get('CACHE_WARM_INTERVAL_SECONDS', 60)),
+    max_age=int(os.environ.get('CACHE_WARM_MAX_AGE_SECONDS', result_cache.stale_ttl // 2)),
+    concurrency=int(os.environ.get('CACHE_WARM_CONCURRENCY', 2)),
+    cache=result_cache,
+)
+
 
 @app.route('/ping', methods=['GET'])
 def ping():
     return jsonify({'status': 'ok'})
 
+def readiness():
+    """
+    Listo para recibir tráfico: el snapshot de respuestas ya se cargó (si lo había) o, sin
+    snapshot, terminó el primer precalentamiento
+    """
+    if response_snapshot is not None:
+        if not response_snapshot.loaded.is_set():
+            return False
+        if response_snapshot.status()['loaded_entries']:
+            return True
+    return not cache_warmer_enabled or bool(cache_warmer.status()['last_run'])
+
+
 @app.route('/api/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
+    """Liveness: responde mientras el proceso esté vivo; ready y snapshot informan la readiness"""
+    return jsonify({
+        'status': 'ok',
+        'timestamp': datetime.now().isoformat(),
+        'warehouse': warehouse.name,
+        'ready': readiness(),
+        'response_snapshot': response_snapshot.status() if response_snapshot is not None else None,
+    })
+
+
+@app.route('/api/health/ready', methods=['GET'])
+def health_ready():
+    """Readiness probe: 503 hasta tener respuestas para servir sin esperar a BigQuery"""
+    ready = readiness()
+    return jsonify({'ready': ready}), 200 if ready else 503
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Contadores de hits/misses de la caché y de queries coalescidas"""
+    stats = result_cache.stats()
+    stats['queries'] = dict(query_flight.stats)
+    stats['warmer'] = cache_warmer.status()
+    stats['monthly_store'] = monthly_store.status()
+    stats['async_jobs'] = async_jobs.status()
+    stats['scheduler'] = job_scheduler.status()
+    stats['circuit_breaker'] = warehouse_breaker.status()
+    if result_cache.store is not None:
+        stats['shared_store'] = result_cache.store.status()
+    if response_snapshot is not None:
+        stats['response_snapshot'] = response_snapshot.status()
+    if hasattr(warehouse, 'snapshot'):
+        stats['event_snapshot'] = warehouse.snapshot.status()
+    return jsonify(stats)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_async_job(job_id):
+    """Estado de un job de ?async=1; cuando termina incluye la respuesta del endpoint en result"""
+    job = async_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': f'Job {job_id} no encontrado o expirado'}), 404
+
+    body = job.describe()
+    if job.status == DONE:
+        payload, status = job.value
+        body['result'] = payload
+        return _json_response(response_encoding.dumps(body), None), status
+    if job.status == ERROR:
+        body['error'] = job.error
+        return jsonify(body), 500
+    return jsonify(body), 202
+
+# Paneles de /api/batch: nombre en caché -> ruta del endpoint y dato compartido que usa
+# (se calcula una vez antes de los paneles en lugar de una vez por panel)
+BATCH_PANELS = {
+    'monthly': ('/api/metrics/monthly', None),
+    'sellers': ('/api/metrics/sellers', get_fact_cube),
+    'recurrence': ('/api/metrics/sellers/recurrence', get_fact_cube),
+    'mtd': ('/api/metrics/mtd', get_fact_cube),
+    'nextsteps': ('/api/metrics/nextsteps', None),
+    'pendings_summary': ('/api/pendings/summary', get_pendings_cube),
+    'pendings_monthly': ('/api/pendings/monthly', get_pendings_cube),
+    'pendings_comparison': ('/api/pendings/comparison', get_pendings_cube),
+    'pendings_latency': ('/api/pendings/latency', get_latency_sketches),
+}
+
+
+@app.route('/api/batch', methods=['GET'])
+def get_batch():
+    """
+    Varios paneles en un solo request: ?panels=monthly,sellers,recurrence.
+    Cada panel usa la misma caché que su endpoint (y los parámetros de query string que
+    este acepta); los que faltan se calculan en paralelo.
+    """
+    panels = [p for p in request.args.get('panels', '').split(',') if p]
+    unknown = [p for p in panels if p not in BATCH_PANELS]
+    if not panels or unknown:
+        return jsonify({
+            'error': f"panels inválido: {','.join(unknown) or '(vacío)'}",
+            'panels_disponibles': list(BATCH_PANELS),
+        }), 400
+
+    adapter = app.url_map.bind('localhost')
+    entries = {}
+    shared = []
+    for panel in dict.fromkeys(panels):
+        path, depends_on = BATCH_PANELS[panel]
+        endpoint, kwargs = adapter.match(path)
+        name, params, view = _cached_views[endpoint]
+        key, compute = _cache_entry(name, params, view, path, kwargs, request.args)
+        entries[panel] = (key, compute)
+        if depends_on is not None and depends_on not in shared and not result_cache.contains(key):
+            shared.append(depends_on)
+
+    columnar = request.args.get('format') == 'columnar'
+    panel_bodies, status, cache = {}, {}, {}
+    with priority(INTERACTIVE), query_budget(cancelled=_client_disconnected_probe(request.environ)):
+        try:
+            for compute_shared in shared:
+                compute_shared()
+        except Exception:
+            pass  # cada panel vuelve a intentarlo y reporta su error en el payload
+
+        # Los threads del pool no heredan el contexto (prioridad, deadline, desconexión)
+        with ThreadPoolExecutor(max_workers=len(entries), thread_name_prefix='batch') as pool:
+            futures = {
+                panel: pool.submit(contextvars.copy_context().run, _serve_cached, key, compute,
+                                   CACHE_TTLS.get(key[0], CACHE_DEFAULT_TTL))
+                for panel, (key, compute) in entries.items()
+            }
+            for panel, future in futures.items():
+                try:
+                    value, estado = future.result()
+                except Exception as e:
+                    value, estado = ({'error': str(e)}, 500), 'miss'
+                # JSON de cada panel ya serializado en su entrada de caché; se comprime el total
+                panel_bodies[panel], _ = _response_body(entries[panel][0], value, columnar, 'identity')
+                status[panel] = value[1]
+                cache[panel] = estado
+
+    body = b'{"panels":{%s},"status":%s,"cache":%s}' % (
+        b','.join(response_encoding.dumps(panel) + b':' + panel_body for panel, panel_body in panel_bodies.items()),
+        response_encoding.dumps(status),
+        response_encoding.dumps(cache),
+    )
+    return _json_response(*response_encoding.encode(
+        body, response_encoding.negotiate(request.headers.get('Accept-Encoding'))
+    ))
+
+@app.route('/api/debug/queries', methods=['GET'])
+def debug_queries():
+    """Últimos jobs ejecutados y percentiles de costo/latencia por endpoint"""
+    limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    return jsonify(query_stats.snapshot(limit=limit))
 
 @app.route('/api/metrics/monthly', methods=['GET'])
+@cached_endpoint('monthly', params=RANGE_PARAMS)
 def get_monthly_metrics():
-    """Obtiene métricas mensuales de emisiones y pagos"""
-    query = """
-    WITH monthly_metrics AS (
-      SELECT
-        EXTRACT(YEAR FROM EVENT_DATE) as anio,
-        EXTRACT(MONTH FROM EVENT_DATE) as mes,
-        FORMAT_DATE('%Y-%m', EVENT_DATE) as periodo,
-
-        -- Emisiones
-        COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') as cantidad_emisiones,
-        COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-          THEN CUS_CUST_ID END) as sellers_que_emitieron,
-
-        -- Pagos
-        COUNTIF(EVENT_TYPE = 'Payment') as cantidad_pagos,
-        COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment'
-          THEN CUS_CUST_ID END) as sellers_que_pagaron,
-
-        -- Pagos correctos (YEAR/MONTH = mes inmediatamente anterior a EVENT_DATE)
-        COUNTIF(EVENT_TYPE = 'Payment'
-          AND CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0')) = FORMAT_DATE('%Y-%m', DATE_SUB(DATE_TRUNC(EVENT_DATE, MONTH), INTERVAL 1 MONTH))
-        ) as cantidad_pagos_correctos,
-        COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment'
-          AND CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0')) = FORMAT_DATE('%Y-%m', DATE_SUB(DATE_TRUNC(EVENT_DATE, MONTH), INTERVAL 1 MONTH))
-          THEN CUS_CUST_ID END) as sellers_pagos_correctos,
-
-        -- Conversión
-        ROUND(COUNTIF(EVENT_TYPE = 'Payment') * 100.0 /
-          NULLIF(COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'), 0), 2) as tasa_conversion_eventos_pct,
-        ROUND(COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment' THEN CUS_CUST_ID END) * 100.0 /
-          NULLIF(COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-          THEN CUS_CUST_ID END), 0), 2) as tasa_conversion_sellers_pct,
-
-        -- Volumen
-        ROUND(SUM(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT ELSE 0 END), 2) as volumen_pagos,
-        ROUND(AVG(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT END), 2) as ticket_promedio_pago,
-
-        -- Promedios
-        ROUND(COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') * 1.0 /
-          NULLIF(COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-          THEN CUS_CUST_ID END), 0), 2) as emisiones_promedio_por_seller,
-        ROUND(COUNTIF(EVENT_TYPE = 'Payment') * 1.0 /
-          NULLIF(COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment' THEN CUS_CUST_ID END), 0), 2) as pagos_promedio_por_seller
-
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_DATE IS NOT NULL
-        AND EVENT_DATE <= CURRENT_DATE()
-        AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
-      GROUP BY anio, mes, periodo
-    ),
-    previous_month AS (
-      SELECT
-        periodo,
-        LAG(cantidad_emisiones) OVER (ORDER BY periodo) as prev_emisiones,
-        LAG(cantidad_pagos) OVER (ORDER BY periodo) as prev_pagos,
-        LAG(sellers_que_emitieron) OVER (ORDER BY periodo) as prev_sellers_emiten,
-        LAG(sellers_que_pagaron) OVER (ORDER BY periodo) as prev_sellers_pagan,
-        LAG(volumen_pagos) OVER (ORDER BY periodo) as prev_volumen
-      FROM monthly_metrics
-    )
-    SELECT
-      m.*,
-      ROUND((m.cantidad_emisiones - p.prev_emisiones) * 100.0 / NULLIF(p.prev_emisiones, 0), 2) as mom_emisiones_pct,
-      ROUND((m.cantidad_pagos - p.prev_pagos) * 100.0 / NULLIF(p.prev_pagos, 0), 2) as mom_pagos_pct,
-      ROUND((m.sellers_que_emitieron - p.prev_sellers_emiten) * 100.0 / NULLIF(p.prev_sellers_emiten, 0), 2) as mom_sellers_emiten_pct,
-      ROUND((m.sellers_que_pagaron - p.prev_sellers_pagan) * 100.0 / NULLIF(p.prev_sellers_pagan, 0), 2) as mom_sellers_pagan_pct,
-      ROUND((m.volumen_pagos - p.prev_volumen) * 100.0 / NULLIF(p.prev_volumen, 0), 2) as mom_volumen_pct
-    FROM monthly_metrics m
-    LEFT JOIN previous_month p ON m.periodo = p.periodo
-    ORDER BY m.periodo ASC
     """
+    Obtiene métricas mensuales de emisiones y pagos.
+    Con ?from=&to= devuelve los totales del rango (ver get_range_metrics).
+    """
+    try:
+        rango = date_range_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if rango:
+        return get_range_metrics(*rango)
 
     try:
-        query_job = client.query(query)
-        results = query_job.result()
-
-        data = []
-        for row in results:
-            data.append({
-                'periodo': row.periodo,
-                'anio': row.anio,
-                'mes': row.mes,
-                'emisiones': {
-                    'cantidad': row.cantidad_emisiones,
-                    'sellers_unicos': row.sellers_que_emitieron,
-                    'promedio_por_seller': float(row.emisiones_promedio_por_seller) if row.emisiones_promedio_por_seller else None
-                },
-                'pagos': {
-                    'cantidad': row.cantidad_pagos,
-                    'sellers_unicos': row.sellers_que_pagaron,
-                    'promedio_por_seller': float(row.pagos_promedio_por_seller) if row.pagos_promedio_por_seller else None,
-                    'volumen_total': float(row.volumen_pagos) if row.volumen_pagos else 0,
-                    'ticket_promedio': float(row.ticket_promedio_pago) if row.ticket_promedio_pago else None,
-                    'pagos_correctos': row.cantidad_pagos_correctos,
-                    'sellers_pagos_correctos': row.sellers_pagos_correctos
-                },
-                'conversion': {
-                    'eventos_pct': float(row.tasa_conversion_eventos_pct) if row.tasa_conversion_eventos_pct else None,
-                    'sellers_pct': float(row.tasa_conversion_sellers_pct) if row.tasa_conversion_sellers_pct else None
-                },
-                'mom_growth': {
-                    'emisiones_pct': float(row.mom_emisiones_pct) if row.mom_emisiones_pct else None,
-                    'pagos_pct': float(row.mom_pagos_pct) if row.mom_pagos_pct else None,
-                    'sellers_emiten_pct': float(row.mom_sellers_emiten_pct) if row.mom_sellers_emiten_pct else None,
-                    'sellers_pagan_pct': float(row.mom_sellers_pagan_pct) if row.mom_sellers_pagan_pct else None,
-                    'volumen_pct': float(row.mom_volumen_pct) if row.mom_volumen_pct else None
-                }
-            })
+        monthly_store.refresh(
+            lambda desde: run_query(queries.monthly_aggregates(desde)),
+            datetime.now(timezone.utc).date()
+        )
+        results = fact_cube.monthly_rows(monthly_store.totals())
+
+        data = Columns.from_rows(results, {
+            'periodo': lambda row: row.periodo,
+            'anio': lambda row: row.anio,
+            'mes': lambda row: row.mes,
+            'emisiones': {
+                'cantidad': lambda row: row.cantidad_emisiones,
+                'sellers_unicos': lambda row: row.sellers_que_emitieron,
+                'promedio_por_seller': lambda row: float(row.emisiones_promedio_por_seller) if row.emisiones_promedio_por_seller else None,
+            },
+            'pagos': {
+                'cantidad': lambda row: row.cantidad_pagos,
+                'sellers_unicos': lambda row: row.sellers_que_pagaron,
+                'promedio_por_seller': lambda row: float(row.pagos_promedio_por_seller) if row.pagos_promedio_por_seller else None,
+                'volumen_total': lambda row: float(row.volumen_pagos) if row.volumen_pagos else 0,
+                'ticket_promedio': lambda row: float(row.ticket_promedio_pago) if row.ticket_promedio_pago else None,
+                'pagos_correctos': lambda row: row.cantidad_pagos_correctos,
+                'sellers_pagos_correctos': lambda row: row.sellers_pagos_correctos,
+            },
+            'conversion': {
+                'eventos_pct': lambda row: float(row.tasa_conversion_eventos_pct) if row.tasa_conversion_eventos_pct else None,
+                'sellers_pct': lambda row: float(row.tasa_conversion_sellers_pct) if row.tasa_conversion_sellers_pct else None,
+            },
+            'mom_growth': {
+                'emisiones_pct': lambda row: float(row.mom_emisiones_pct) if row.mom_emisiones_pct else None,
+                'pagos_pct': lambda row: float(row.mom_pagos_pct) if row.mom_pagos_pct else None,
+                'sellers_emiten_pct': lambda row: float(row.mom_sellers_emiten_pct) if row.mom_sellers_emiten_pct else None,
+                'sellers_pagan_pct': lambda row: float(row.mom_sellers_pagan_pct) if row.mom_sellers_pagan_pct else None,
+                'volumen_pct': lambda row: float(row.mom_volumen_pct) if row.mom_volumen_pct else None,
+            },
+        })
 
         # Calcular summary
-        total_emisiones = sum(d['emisiones']['cantidad'] for d in data)
-        total_pagos = sum(d['pagos']['cantidad'] for d in data)
-        total_volumen = sum(d['pagos']['volumen_total'] for d in data)
+        total_emisiones = sum(data.column('emisiones', 'cantidad'))
+        total_pagos = sum(data.column('pagos', 'cantidad'))
+        total_volumen = sum(data.column('pagos', 'volumen_total'))
 
-        mejor_mes = max(data, key=lambda x: x['conversion']['sellers_pct'] if x['conversion']['sellers_pct'] else 0)
+        sellers_pct = data.column('conversion', 'sellers_pct')
+        mejor_mes = max(range(len(data)), key=lambda i: sellers_pct[i] if sellers_pct[i] else 0)
 
-        return jsonify({
+        return {
             'data': data,
             'summary': {
                 'total_emisiones': total_emisiones,
@@ -158,10 +761,39 @@ def get_monthly_metrics():
                 'total_volumen': total_volumen,
                 'conversion_promedio': round((total_pagos / total_emisiones * 100) if total_emisiones > 0 else 0, 2),
                 'mejor_mes': {
-                    'periodo': mejor_mes['periodo'],
-                    'conversion_sellers': mejor_mes['conversion']['sellers_pct']
+                    'periodo': data.column('periodo')[mejor_mes],
+                    'conversion_sellers': sellers_pct[mejor_mes]
                 }
             }
+        }
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def get_range_metrics(desde, hasta, exact):
+    """Emisiones, pagos y sellers únicos de un rango de fechas arbitrario, sin ir al warehouse"""
+    try:
+        sketches = get_daily_sketches()
+        emisiones, sellers_emitieron = sketches.count('emision', desde, hasta, exact)
+        pagos, sellers_pagaron = sketches.count('pago', desde, hasta, exact)
+
+        return jsonify({
+            'range': range_payload(desde, hasta, exact),
+            'emisiones': {
+                'cantidad': emisiones,
+                'sellers_unicos': sellers_emitieron,
+                'promedio_por_seller': round(emisiones / sellers_emitieron, 2) if sellers_emitieron else None
+            },
+            'pagos': {
+                'cantidad': pagos,
+                'sellers_unicos': sellers_pagaron,
+                'promedio_por_seller': round(pagos / sellers_pagaron, 2) if sellers_pagaron else None
+            },
+            'conversion': {
+                'eventos_pct': round(pagos / emisiones * 100, 2) if emisiones else None,
+                'sellers_pct': round(sellers_pagaron / sellers_emitieron * 100, 2) if sellers_emitieron else None
+            }
         })
 
     except Exception as e:
@@ -169,335 +801,90 @@ def get_monthly_metrics():
 
 
 @app.route('/api/metrics/sellers', methods=['GET'])
+@cached_endpoint('sellers')
 def get_sellers_metrics():
     """Obtiene métricas de sellers nuevos vs recurrentes separadas por emisiones y pagos"""
-
-    # Query para emisiones
-    query_emisiones = """
-    WITH seller_first_emission AS (
-      SELECT
-        CUS_CUST_ID,
-        MIN(DATE_TRUNC(EVENT_DATE, MONTH)) as primer_mes_emision
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    )
-    SELECT
-      FORMAT_DATE('%Y-%m', DATE_TRUNC(e.EVENT_DATE, MONTH)) as periodo,
-      COUNT(DISTINCT e.CUS_CUST_ID) as sellers_emiten_total,
-      COUNT(DISTINCT CASE WHEN DATE_TRUNC(e.EVENT_DATE, MONTH) = f.primer_mes_emision
-        THEN e.CUS_CUST_ID END) as sellers_emiten_nuevos,
-      COUNT(DISTINCT CASE WHEN DATE_TRUNC(e.EVENT_DATE, MONTH) != f.primer_mes_emision
-        THEN e.CUS_CUST_ID END) as sellers_emiten_recurrentes
-    FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS` e
-    INNER JOIN seller_first_emission f ON e.CUS_CUST_ID = f.CUS_CUST_ID
-    WHERE e.EVENT_TYPE = 'SERPRO-Emission' AND e.SERPRO_STATUS = 'success'
-      AND e.EVENT_DATE IS NOT NULL
-      AND e.EVENT_DATE <= CURRENT_DATE()
-    GROUP BY periodo
-    ORDER BY periodo ASC
-    """
-
-    # Query para pagos
-    query_pagos = """
-    WITH seller_first_payment AS (
-      SELECT
-        CUS_CUST_ID,
-        MIN(DATE_TRUNC(EVENT_DATE, MONTH)) as primer_mes_pago
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    )
-    SELECT
-      FORMAT_DATE('%Y-%m', DATE_TRUNC(e.EVENT_DATE, MONTH)) as periodo,
-      COUNT(DISTINCT e.CUS_CUST_ID) as sellers_pagan_total,
-      COUNT(DISTINCT CASE WHEN DATE_TRUNC(e.EVENT_DATE, MONTH) = f.primer_mes_pago
-        THEN e.CUS_CUST_ID END) as sellers_pagan_nuevos,
-      COUNT(DISTINCT CASE WHEN DATE_TRUNC(e.EVENT_DATE, MONTH) != f.primer_mes_pago
-        THEN e.CUS_CUST_ID END) as sellers_pagan_recurrentes
-    FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS` e
-    INNER JOIN seller_first_payment f ON e.CUS_CUST_ID = f.CUS_CUST_ID
-    WHERE e.EVENT_TYPE = 'Payment'
-      AND e.EVENT_DATE IS NOT NULL
-      AND e.EVENT_DATE <= CURRENT_DATE()
-    GROUP BY periodo
-    ORDER BY periodo ASC
-    """
-
     try:
-        # Ejecutar ambas queries
-        emisiones_job = client.query(query_emisiones)
-        pagos_job = client.query(query_pagos)
-
-        emisiones_results = list(emisiones_job.result())
-        pagos_results = list(pagos_job.result())
+        cube = get_fact_cube()
 
         # Crear diccionarios indexados por periodo
-        emisiones_dict = {row.periodo: row for row in emisiones_results}
-        pagos_dict = {row.periodo: row for row in pagos_results}
+        emisiones_dict = {row.periodo: row for row in fact_cube.sellers_rows(cube, 'emision')}
+        pagos_dict = {row.periodo: row for row in fact_cube.sellers_rows(cube, 'pago')}
 
         # Obtener todos los períodos únicos
         periodos = sorted(set(emisiones_dict.keys()) | set(pagos_dict.keys()))
 
-        # Combinar datos
-        data = []
-        for periodo in periodos:
-            emision_row = emisiones_dict.get(periodo)
-            pago_row = pagos_dict.get(periodo)
-
-            data.append({
-                'periodo': periodo,
-                'emisiones': {
-                    'total': emision_row.sellers_emiten_total if emision_row else 0,
-                    'nuevos': emision_row.sellers_emiten_nuevos if emision_row else 0,
-                    'recurrentes': emision_row.sellers_emiten_recurrentes if emision_row else 0,
-                    'pct_nuevos': round((emision_row.sellers_emiten_nuevos / emision_row.sellers_emiten_total * 100) if emision_row and emision_row.sellers_emiten_total > 0 else 0, 2),
-                    'pct_recurrentes': round((emision_row.sellers_emiten_recurrentes / emision_row.sellers_emiten_total * 100) if emision_row and emision_row.sellers_emiten_total > 0 else 0, 2)
-                },
-                'pagos': {
-                    'total': pago_row.sellers_pagan_total if pago_row else 0,
-                    'nuevos': pago_row.sellers_pagan_nuevos if pago_row else 0,
-                    'recurrentes': pago_row.sellers_pagan_recurrentes if pago_row else 0,
-                    'pct_nuevos': round((pago_row.sellers_pagan_nuevos / pago_row.sellers_pagan_total * 100) if pago_row and pago_row.sellers_pagan_total > 0 else 0, 2),
-                    'pct_recurrentes': round((pago_row.sellers_pagan_recurrentes / pago_row.sellers_pagan_total * 100) if pago_row and pago_row.sellers_pagan_total > 0 else 0, 2)
-                }
-            })
+        def bloque(rows):
+            return {
+                'total': lambda periodo: rows[periodo].total if periodo in rows else 0,
+                'nuevos': lambda periodo: rows[periodo].nuevos if periodo in rows else 0,
+                'recurrentes': lambda periodo: rows[periodo].recurrentes if periodo in rows else 0,
+                'pct_nuevos': lambda periodo: round(
+                    (rows[periodo].nuevos / rows[periodo].total * 100) if periodo in rows and rows[periodo].total > 0 else 0, 2),
+                'pct_recurrentes': lambda periodo: round(
+                    (rows[periodo].recurrentes / rows[periodo].total * 100) if periodo in rows and rows[periodo].total > 0 else 0, 2),
+            }
 
-        return jsonify({'data': data})
+        # Combinar datos
+        return {'data': Columns.from_rows(periodos, {
+            'periodo': lambda periodo: periodo,
+            'emisiones': bloque(emisiones_dict),
+            'pagos': bloque(pagos_dict),
+        })}
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/metrics/sellers/recurrence', methods=['GET'])
+@cached_endpoint('recurrence')
 def get_sellers_recurrence():
     """Métricas de recurrencia de sellers: totalmente nuevos, recurrentes (mes anterior + actual), sin recurrencia"""
-
-    query_emisiones = """
-    WITH seller_first_emission AS (
-      SELECT CUS_CUST_ID,
-        MIN(DATE_TRUNC(EVENT_DATE, MONTH)) as primer_mes_emision
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    ),
-    monthly_emissions AS (
-      SELECT DISTINCT
-        DATE_TRUNC(EVENT_DATE, MONTH) as mes,
-        CUS_CUST_ID
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-        AND EVENT_DATE IS NOT NULL AND EVENT_DATE <= CURRENT_DATE()
-    )
-    SELECT
-      FORMAT_DATE('%Y-%m', m.mes) as periodo,
-      COUNT(DISTINCT m.CUS_CUST_ID) as sellers_total,
-      COUNT(DISTINCT CASE WHEN m.mes = f.primer_mes_emision
-        THEN m.CUS_CUST_ID END) as sellers_totalmente_nuevos,
-      COUNT(DISTINCT CASE
-        WHEN m.mes != f.primer_mes_emision AND prev.CUS_CUST_ID IS NOT NULL
-        THEN m.CUS_CUST_ID END) as sellers_recurrentes,
-      COUNT(DISTINCT CASE
-        WHEN m.mes != f.primer_mes_emision AND prev.CUS_CUST_ID IS NULL
-        THEN m.CUS_CUST_ID END) as sellers_sin_recurrencia
-    FROM monthly_emissions m
-    INNER JOIN seller_first_emission f ON m.CUS_CUST_ID = f.CUS_CUST_ID
-    LEFT JOIN monthly_emissions prev
-      ON m.CUS_CUST_ID = prev.CUS_CUST_ID
-      AND prev.mes = DATE_SUB(m.mes, INTERVAL 1 MONTH)
-    GROUP BY periodo
-    ORDER BY periodo ASC
-    """
-
-    query_pagos = """
-    WITH seller_first_payment AS (
-      SELECT CUS_CUST_ID,
-        MIN(DATE_TRUNC(EVENT_DATE, MONTH)) as primer_mes_pago
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    ),
-    monthly_payments AS (
-      SELECT DISTINCT
-        DATE_TRUNC(EVENT_DATE, MONTH) as mes,
-        CUS_CUST_ID
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE IS NOT NULL AND EVENT_DATE <= CURRENT_DATE()
-    )
-    SELECT
-      FORMAT_DATE('%Y-%m', m.mes) as periodo,
-      COUNT(DISTINCT m.CUS_CUST_ID) as sellers_total,
-      COUNT(DISTINCT CASE WHEN m.mes = f.primer_mes_pago
-        THEN m.CUS_CUST_ID END) as sellers_totalmente_nuevos,
-      COUNT(DISTINCT CASE
-        WHEN m.mes != f.primer_mes_pago AND prev.CUS_CUST_ID IS NOT NULL
-        THEN m.CUS_CUST_ID END) as sellers_recurrentes,
-      COUNT(DISTINCT CASE
-        WHEN m.mes != f.primer_mes_pago AND prev.CUS_CUST_ID IS NULL
-        THEN m.CUS_CUST_ID END) as sellers_sin_recurrencia
-    FROM monthly_payments m
-    INNER JOIN seller_first_payment f ON m.CUS_CUST_ID = f.CUS_CUST_ID
-    LEFT JOIN monthly_payments prev
-      ON m.CUS_CUST_ID = prev.CUS_CUST_ID
-      AND prev.mes = DATE_SUB(m.mes, INTERVAL 1 MONTH)
-    GROUP BY periodo
-    ORDER BY periodo ASC
-    """
-
     try:
-        emisiones_job = client.query(query_emisiones)
-        pagos_job = client.query(query_pagos)
+        cube = get_fact_cube()
 
-        emisiones_results = list(emisiones_job.result())
-        pagos_results = list(pagos_job.result())
-
-        emisiones_dict = {row.periodo: row for row in emisiones_results}
-        pagos_dict = {row.periodo: row for row in pagos_results}
+        emisiones_dict = {row.periodo: row for row in fact_cube.recurrence_rows(cube, 'emision')}
+        pagos_dict = {row.periodo: row for row in fact_cube.recurrence_rows(cube, 'pago')}
 
         periodos = sorted(set(emisiones_dict.keys()) | set(pagos_dict.keys()))
 
-        data = []
-        for periodo in periodos:
-            e = emisiones_dict.get(periodo)
-            p = pagos_dict.get(periodo)
-
-            data.append({
-                'periodo': periodo,
-                'emisiones': {
-                    'total': e.sellers_total if e else 0,
-                    'totalmente_nuevos': e.sellers_totalmente_nuevos if e else 0,
-                    'recurrentes': e.sellers_recurrentes if e else 0,
-                    'sin_recurrencia': e.sellers_sin_recurrencia if e else 0,
-                },
-                'pagos': {
-                    'total': p.sellers_total if p else 0,
-                    'totalmente_nuevos': p.sellers_totalmente_nuevos if p else 0,
-                    'recurrentes': p.sellers_recurrentes if p else 0,
-                    'sin_recurrencia': p.sellers_sin_recurrencia if p else 0,
-                }
-            })
+        def bloque(rows):
+            return {
+                'total': lambda periodo: rows[periodo].sellers_total if periodo in rows else 0,
+                'totalmente_nuevos': lambda periodo: rows[periodo].sellers_totalmente_nuevos if periodo in rows else 0,
+                'recurrentes': lambda periodo: rows[periodo].sellers_recurrentes if periodo in rows else 0,
+                'sin_recurrencia': lambda periodo: rows[periodo].sellers_sin_recurrencia if periodo in rows else 0,
+            }
 
-        return jsonify({'data': data})
+        return {'data': Columns.from_rows(periodos, {
+            'periodo': lambda periodo: periodo,
+            'emisiones': bloque(emisiones_dict),
+            'pagos': bloque(pagos_dict),
+        })}
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/metrics/month/<periodo>', methods=['GET'])
+@cached_endpoint('month_detail', params=('filter',))
 def get_month_detail(periodo):
     """
     Obtiene métricas detalladas de un mes específico con comparación vs período anterior.
     Usa una sola query BigQuery (con ARRAY_AGG para top_periodos) para minimizar jobs.
     periodo formato: YYYY-MM
     """
-    import time
-    from flask import request
-    from datetime import datetime
-    from dateutil.relativedelta import relativedelta
 
     filter_type = request.args.get('filter', 'event')  # 'event' o 'fiscal'
 
-    # Calcular período anterior
     try:
-        current_date = datetime.strptime(periodo, '%Y-%m')
-        previous_date = current_date - relativedelta(months=1)
-        periodo_anterior = previous_date.strftime('%Y-%m')
-    except Exception:
-        periodo_anterior = None
-
-    def build_combined_query(cur, prev, tipo_filtro):
-        """Una sola query que obtiene métricas de current + previous + top_periodos."""
-        if tipo_filtro == 'fiscal':
-            slot_expr = f"CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0'))"
-            filter_clause = f"{slot_expr} IN ('{cur}', '{prev}')"
-            cur_cond = f"{slot_expr} = '{cur}'"
-            prev_cond = f"{slot_expr} = '{prev}'"
-        else:
-            slot_expr = "FORMAT_DATE('%Y-%m', EVENT_DATE)"
-            filter_clause = f"{slot_expr} IN ('{cur}', '{prev}')"
-            cur_cond = f"{slot_expr} = '{cur}'"
-            prev_cond = f"{slot_expr} = '{prev}'"
-
-        top_periodos_cte = ""
-        top_periodos_join = "NULL as top_periodos"
-        if tipo_filtro == 'event':
-            top_periodos_cte = """
-            ,fiscal_groups AS (
-              SELECT
-                CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0')) as periodo_fiscal,
-                COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') as emisiones,
-                COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-                  THEN CUS_CUST_ID END) as sellers
-              FROM base
-              WHERE slot = 'current' AND YEAR IS NOT NULL AND MONTH IS NOT NULL
-              GROUP BY periodo_fiscal
-            ),
-            top_fiscal AS (
-              SELECT ARRAY_AGG(
-                STRUCT(periodo_fiscal, emisiones, sellers)
-                ORDER BY emisiones DESC LIMIT 10
-              ) as top_list
-              FROM fiscal_groups
-            )"""
-            top_periodos_join = "tf.top_list as top_periodos"
-
-        cross_join = "CROSS JOIN top_fiscal tf" if tipo_filtro == 'event' else ""
-
-        return f"""
-        WITH base AS (
-          SELECT
-            EVENT_TYPE, SERPRO_STATUS, CUS_CUST_ID, TOTAL_AMOUNT, YEAR, MONTH, EVENT_DATE,
-            CASE
-              WHEN {cur_cond} THEN 'current'
-              WHEN {prev_cond} THEN 'previous'
-            END as slot
-          FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-          WHERE {filter_clause}
-        ),
-        metrics AS (
-          SELECT
-            slot,
-            COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-              THEN CUS_CUST_ID END) as sellers_emitieron,
-            COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment'
-              THEN CUS_CUST_ID END) as sellers_pagaron,
-            COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') as cantidad_emisiones,
-            COUNTIF(EVENT_TYPE = 'Payment') as cantidad_pagos,
-            COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'error') as emisiones_error,
-            COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'already_paid') as emisiones_ya_pagadas,
-            ROUND(SUM(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT ELSE 0 END), 2) as volumen_total,
-            ROUND(AVG(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT END), 2) as ticket_promedio,
-            MIN(EVENT_DATE) as fecha_primera_actividad,
-            MAX(EVENT_DATE) as fecha_ultima_actividad
-          FROM base
-          WHERE slot IS NOT NULL
-          GROUP BY slot
-        ){top_periodos_cte}
-        SELECT m.*, {top_periodos_join}
-        FROM metrics m
-        {cross_join}
-        """
-
-    def run_with_retry(query, max_retries=3):
-        for attempt in range(max_retries):
-            try:
-                job = client.query(query)
-                return list(job.result())
-            except Exception as e:
-                is_quota = '403' in str(e) and 'Quota' in str(e)
-                if is_quota and attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                    continue
-                raise
+        query = queries.month_detail(periodo, filter_type)
+        periodo_anterior = queries.previous_periodo(periodo)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     try:
-        query = build_combined_query(periodo, periodo_anterior or '', filter_type)
-        rows = run_with_retry(query)
+        rows = run_query(query)
 
         current_row = next((r for r in rows if r.slot == 'current'), None)
         previous_row = next((r for r in rows if r.slot == 'previous'), None)
@@ -523,14 +910,12 @@ def get_month_detail(periodo):
                 )
             }
 
-        top_periodos = []
-        if filter_type == 'event' and current_row.top_periodos:
-            for p in current_row.top_periodos:
-                top_periodos.append({
-                    'periodo_fiscal': p.get('periodo_fiscal') if isinstance(p, dict) else p['periodo_fiscal'],
-                    'emisiones': p.get('emisiones') if isinstance(p, dict) else p['emisiones'],
-                    'sellers': p.get('sellers') if isinstance(p, dict) else p['sellers'],
-                })
+        top_periodos = Columns.from_rows(
+            current_row.top_periodos if filter_type == 'event' and current_row.top_periodos else [], {
+                'periodo_fiscal': lambda p: p.get('periodo_fiscal') if isinstance(p, dict) else p['periodo_fiscal'],
+                'emisiones': lambda p: p.get('emisiones') if isinstance(p, dict) else p['emisiones'],
+                'sellers': lambda p: p.get('sellers') if isinstance(p, dict) else p['sellers'],
+            })
 
         data = {
             'periodo': periodo,
@@ -562,7 +947,7 @@ def get_month_detail(periodo):
             'top_periodos_fiscales': top_periodos
         }
 
-        return jsonify(data)
+        return data
 
     except Exception as e:
         import traceback
@@ -574,136 +959,48 @@ def get_month_detail(periodo):
 
 
 @app.route('/api/metrics/nextsteps', methods=['GET'])
+@cached_endpoint('nextsteps', params=('cohorts', 'depth'))
 def get_nextsteps_metrics():
     """
     Obtiene métricas para decisiones estratégicas (next steps)
-    """
-    # Métricas de cohortes y retención
-    cohort_query = """
-    WITH seller_first_month AS (
-      SELECT
-        CUS_CUST_ID,
-        FORMAT_DATE('%Y-%m', MIN(EVENT_DATE)) as cohort_mes
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    ),
-    monthly_activity AS (
-      SELECT DISTINCT
-        e.CUS_CUST_ID,
-        FORMAT_DATE('%Y-%m', DATE_TRUNC(e.EVENT_DATE, MONTH)) as mes_actividad,
-        c.cohort_mes,
-        DATE_DIFF(DATE_TRUNC(e.EVENT_DATE, MONTH), DATE_TRUNC(PARSE_DATE('%Y-%m', c.cohort_mes), MONTH), MONTH) as meses_desde_cohort
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS` e
-      INNER JOIN seller_first_month c ON e.CUS_CUST_ID = c.CUS_CUST_ID
-      WHERE e.EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
-        AND e.EVENT_DATE <= CURRENT_DATE()
-    )
-    SELECT
-      cohort_mes,
-      COUNT(DISTINCT CUS_CUST_ID) as sellers_cohort,
-      COUNT(DISTINCT CASE WHEN meses_desde_cohort = 0 THEN CUS_CUST_ID END) as mes_0,
-      COUNT(DISTINCT CASE WHEN meses_desde_cohort = 1 THEN CUS_CUST_ID END) as mes_1,
-      COUNT(DISTINCT CASE WHEN meses_desde_cohort = 2 THEN CUS_CUST_ID END) as mes_2,
-      COUNT(DISTINCT CASE WHEN meses_desde_cohort = 3 THEN CUS_CUST_ID END) as mes_3
-    FROM monthly_activity
-    GROUP BY cohort_mes
-    ORDER BY cohort_mes DESC
-    LIMIT 6
-    """
-
-    # Métricas de engagement (días activos)
-    engagement_query = """
-    SELECT
-      COUNTIF(dias_activos = 1) as sellers_1_dia,
-      COUNTIF(dias_activos BETWEEN 2 AND 3) as sellers_2_3_dias,
-      COUNTIF(dias_activos BETWEEN 4 AND 7) as sellers_4_7_dias,
-      COUNTIF(dias_activos >= 8) as sellers_8_plus_dias
-    FROM (
-      SELECT
-        CUS_CUST_ID,
-        COUNT(DISTINCT DATE(EVENT_DATE)) as dias_activos
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
-        AND EVENT_DATE <= CURRENT_DATE()
-      GROUP BY CUS_CUST_ID
-    )
-    """
 
-    # Métricas de períodos pendientes por usuario
-    pending_query = """
-    WITH emisiones AS (
-      SELECT
-        CUS_CUST_ID,
-        CONCAT(YEAR, '-', LPAD(MONTH, 2, '0')) as periodo_fiscal
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-        AND YEAR IS NOT NULL AND MONTH IS NOT NULL
-      GROUP BY CUS_CUST_ID, periodo_fiscal
-    ),
-    pagos AS (
-      SELECT
-        CUS_CUST_ID,
-        CONCAT(YEAR, '-', LPAD(MONTH, 2, '0')) as periodo_fiscal
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND YEAR IS NOT NULL AND MONTH IS NOT NULL
-      GROUP BY CUS_CUST_ID, periodo_fiscal
-    ),
-    pendientes_por_seller AS (
-      SELECT
-        e.CUS_CUST_ID,
-        COUNT(*) as periodos_pendientes
-      FROM emisiones e
-      LEFT JOIN pagos p ON e.CUS_CUST_ID = p.CUS_CUST_ID AND e.periodo_fiscal = p.periodo_fiscal
-      WHERE p.periodo_fiscal IS NULL
-        AND e.periodo_fiscal <= FORMAT_DATE('%Y-%m', DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH))
-      GROUP BY e.CUS_CUST_ID
-    )
-    SELECT
-      COUNTIF(periodos_pendientes = 0) as sellers_0_pendientes,
-      COUNTIF(periodos_pendientes = 1) as sellers_1_pendiente,
-      COUNTIF(periodos_pendientes BETWEEN 2 AND 3) as sellers_2_3_pendientes,
-      COUNTIF(periodos_pendientes BETWEEN 4 AND 6) as sellers_4_6_pendientes,
-      COUNTIF(periodos_pendientes >= 7) as sellers_7_plus_pendientes,
-      ROUND(AVG(periodos_pendientes), 2) as promedio_pendientes
-    FROM pendientes_por_seller
+    Query params:
+    - cohorts: cantidad de cohortes más recientes (default 6, 0 = todas)
+    - depth: meses de retención por cohorte, mes_0..mes_<depth> (default 3)
+    Ambos se limitan a los meses con datos.
     """
-
     try:
-        print("Ejecutando query de cohortes...")
-        cohort_job = client.query(cohort_query)
-        cohort_results = list(cohort_job.result())
-        print(f"Cohortes obtenidas: {len(cohort_results)}")
-
-        print("Ejecutando query de engagement...")
-        engagement_job = client.query(engagement_query)
-        engagement_results = list(engagement_job.result())
-        print(f"Engagement results: {len(engagement_results)}")
+        n_cohorts = max(0, int(request.args.get('cohorts', 6)))
+        depth = max(0, int(request.args.get('depth', 3)))
+    except ValueError:
+        return jsonify({'error': 'cohorts y depth deben ser enteros'}), 400
 
-        print("Ejecutando query de pendientes...")
-        pending_job = client.query(pending_query)
-        pending_results = list(pending_job.result())
-        print(f"Pendientes results: {len(pending_results)}")
+    try:
+        cube = get_fact_cube()
+        n_months = cube.seller_index.n_months
+        n_cohorts = min(n_cohorts, n_months)
+        depth = min(depth, max(0, n_months - 1))
+
+        print("Ejecutando queries de engagement y pendientes...")
+        results = run_queries('nextsteps', {
+            'engagement': queries.nextsteps_engagement(),
+            'pending': queries.nextsteps_pending(),
+        })
+        # Cohortes: operaciones de bits sobre el índice de actividad del cubo (sin self-joins)
+        cohort_results = fact_cube.cohort_rows(cube, n_cohorts, depth)
+        engagement_results = results['engagement']
+        pending_results = results['pending']
+        print(f"Cohortes: {len(cohort_results)}, engagement: {len(engagement_results)}, pendientes: {len(pending_results)}")
 
         # Procesar cohortes
-        cohorts = []
-        for row in cohort_results:
-            retention_mes_1 = round(row.mes_1 * 100.0 / row.sellers_cohort, 2) if row.sellers_cohort > 0 else 0
-            retention_mes_2 = round(row.mes_2 * 100.0 / row.sellers_cohort, 2) if row.sellers_cohort > 0 else 0
-            retention_mes_3 = round(row.mes_3 * 100.0 / row.sellers_cohort, 2) if row.sellers_cohort > 0 else 0
-
-            cohorts.append({
-                'cohort_mes': row.cohort_mes,
-                'sellers_cohort': row.sellers_cohort,
-                'retention': {
-                    'mes_0': 100.0,
-                    'mes_1': retention_mes_1,
-                    'mes_2': retention_mes_2,
-                    'mes_3': retention_mes_3
-                }
-            })
+        def retention(k):
+            return lambda row: round(getattr(row, f'mes_{k}') * 100.0 / row.sellers_cohort, 2) if row.sellers_cohort > 0 else 0
+
+        cohorts = Columns.from_rows(cohort_results, {
+            'cohort_mes': lambda row: row.cohort_mes,
+            'sellers_cohort': lambda row: row.sellers_cohort,
+            'retention': {'mes_0': lambda row: 100.0, **{f'mes_{k}': retention(k) for k in range(1, depth + 1)}},
+        })
 
         # Procesar engagement
         if engagement_results:
@@ -744,11 +1041,11 @@ def get_nextsteps_metrics():
             }
 
         print("Todas las queries completadas exitosamente")
-        return jsonify({
+        return {
             'cohorts': cohorts,
             'engagement': engagement,
             'pendientes': pendientes
-        })
+        }
 
     except Exception as e:
         print(f"ERROR en nextsteps: {str(e)}")
@@ -758,66 +1055,21 @@ def get_nextsteps_metrics():
 
 
 @app.route('/api/pendings/summary', methods=['GET'])
+@cached_endpoint('pendings_summary', params=RANGE_PARAMS)
 def get_pendings_summary():
     """
-    Obtiene resumen general de notificaciones (pendings)
-    """
-    query = """
-    WITH pendings_totals AS (
-      SELECT
-        COUNTIF(event = 'created' AND reason = 'success') as total_enviadas,
-        COUNTIF(event = 'deleted' AND reason IN ('success', 'success_web')) as total_pagadas_desde_notif,
-        COUNTIF(event = 'deleted' AND reason = 'dismiss') as total_descartadas,
-        COUNT(DISTINCT user_id) as sellers_unicos
-      FROM `meli-bi-data.SBOX_SBOXMERCH.DIM_PENDINGS`
-      WHERE content_id = 'mp.sellers.generic_pendings.das_payment_pendings'
-    ),
-    tiempo_pago AS (
-      SELECT
-        AVG(TIMESTAMP_DIFF(published, created_at, DAY)) as dias_promedio
-      FROM `meli-bi-data.SBOX_SBOXMERCH.DIM_PENDINGS`
-      WHERE content_id = 'mp.sellers.generic_pendings.das_payment_pendings'
-        AND event = 'deleted'
-        AND reason IN ('success', 'success_web')
-    ),
-    pagos_reales AS (
-      SELECT
-        COUNT(*) as total_pagos_reales,
-        COUNT(DISTINCT CUS_CUST_ID) as sellers_pagos_reales,
-        COUNTIF(FROM_VALUE = 'pending') as total_pagos_from_value,
-        COUNT(DISTINCT CASE WHEN FROM_VALUE = 'pending' THEN CUS_CUST_ID END) as sellers_pagos_from_value
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE IS NOT NULL
-        AND EVENT_DATE <= CURRENT_DATE()
-        AND (CAST(YEAR AS INT64) > 2025 OR (CAST(YEAR AS INT64) = 2025 AND CAST(MONTH AS INT64) >= 12))
-    )
-    SELECT
-      p.total_enviadas,
-      p.total_pagadas_desde_notif,
-      p.total_descartadas,
-      pr.total_pagos_reales,
-      pr.total_pagos_from_value,
-      pr.sellers_pagos_from_value,
-      p.sellers_unicos,
-      pr.sellers_pagos_reales,
-      ROUND((p.total_pagadas_desde_notif * 100.0 / NULLIF(p.total_enviadas, 0)), 2) as tasa_conversion_notif,
-      ROUND((p.total_pagadas_desde_notif * 100.0 / NULLIF(pr.total_pagos_reales, 0)), 2) as tasa_conversion_pagos,
-      ROUND((pr.total_pagos_from_value * 100.0 / NULLIF(pr.total_pagos_reales, 0)), 2) as tasa_from_value,
-      ROUND(tp.dias_promedio, 1) as tiempo_promedio_dias
-    FROM pendings_totals p
-    CROSS JOIN tiempo_pago tp
-    CROSS JOIN pagos_reales pr
+    Obtiene resumen general de notificaciones (pendings).
+    Con ?from=&to= devuelve sellers notificados y pagos del rango (ver distinct_sketch.py).
     """
-
     try:
-        query_job = client.query(query)
-        results = list(query_job.result())
-
-        if not results:
-            return jsonify({'error': 'No se encontraron datos'}), 404
+        rango = date_range_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if rango:
+        return get_pendings_range_summary(*rango)
 
-        row = results[0]
+    try:
+        row = pendings_cube.summary_row(get_pendings_cube())
 
         return jsonify({
             'total_enviadas': row.total_enviadas,
@@ -838,7 +1090,26 @@ def get_pendings_summary():
         return jsonify({'error': str(e)}), 500
 
 
+def get_pendings_range_summary(desde, hasta, exact):
+    try:
+        sketches = get_daily_sketches()
+        eventos_pendings, sellers_unicos = sketches.count('pendings', desde, hasta, exact)
+        total_pagos_reales, sellers_pagos_reales = sketches.count('pago', desde, hasta, exact)
+
+        return jsonify({
+            'range': range_payload(desde, hasta, exact),
+            'eventos_pendings': eventos_pendings,
+            'sellers_unicos': sellers_unicos,
+            'total_pagos_reales': total_pagos_reales,
+            'sellers_pagos_reales': sellers_pagos_reales
+        })
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/pendings/monthly', methods=['GET'])
+@cached_endpoint('pendings_monthly', params=('filter',))
 def get_pendings_monthly():
     """
     Obtiene evolución mensual de notificaciones.
@@ -846,279 +1117,159 @@ def get_pendings_monthly():
     ?filter=fiscal → agrupa pagos por período fiscal (YEAR/MONTH de la tabla)
     Las notificaciones siempre se agrupan por created_at (DIM_PENDINGS).
     """
-    from flask import request
     filter_type = request.args.get('filter', 'event')
-
-    if filter_type == 'fiscal':
-        pagos_periodo_expr = "CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0'))"
-    else:
-        pagos_periodo_expr = "FORMAT_DATE('%Y-%m', EVENT_DATE)"
-
-    query = f"""
-    WITH enviadas AS (
-      SELECT
-        FORMAT_TIMESTAMP('%Y-%m', created_at) as periodo,
-        COUNT(*) as total,
-        COUNT(DISTINCT user_id) as sellers_unicos
-      FROM `meli-bi-data.SBOX_SBOXMERCH.DIM_PENDINGS`
-      WHERE content_id = 'mp.sellers.generic_pendings.das_payment_pendings'
-        AND event = 'created'
-      GROUP BY periodo
-    ),
-    pagos_reales AS (
-      SELECT
-        {pagos_periodo_expr} as periodo,
-        COUNT(*) as total,
-        COUNT(DISTINCT CUS_CUST_ID) as sellers_unicos,
-        COUNTIF(FROM_VALUE = 'pending') as total_from_value,
-        COUNT(DISTINCT CASE WHEN FROM_VALUE = 'pending' THEN CUS_CUST_ID END) as sellers_from_value
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE IS NOT NULL
-        AND EVENT_DATE <= CURRENT_DATE()
-        AND (CAST(YEAR AS INT64) > 2025 OR (CAST(YEAR AS INT64) = 2025 AND CAST(MONTH AS INT64) >= 12))
-      GROUP BY periodo
-    ),
-    all_periods AS (
-      SELECT DISTINCT periodo FROM (
-        SELECT periodo FROM enviadas
-        UNION DISTINCT
-        SELECT periodo FROM pagos_reales
-      )
-    )
-    SELECT
-      a.periodo,
-      IFNULL(e.total, 0) as notificaciones_enviadas,
-      IFNULL(e.sellers_unicos, 0) as sellers_enviadas,
-      IFNULL(pr.total, 0) as pagos_reales,
-      IFNULL(pr.sellers_unicos, 0) as sellers_pagos_reales,
-      IFNULL(pr.total_from_value, 0) as pagos_from_value,
-      IFNULL(pr.sellers_from_value, 0) as sellers_from_value,
-      ROUND((IFNULL(pr.total, 0) * 100.0 / NULLIF(IFNULL(e.total, 0), 0)), 2) as tasa_conversion_total,
-      ROUND((IFNULL(pr.total_from_value, 0) * 100.0 / NULLIF(IFNULL(pr.total, 0), 0)), 2) as tasa_from_value
-    FROM all_periods a
-    LEFT JOIN enviadas e ON a.periodo = e.periodo
-    LEFT JOIN pagos_reales pr ON a.periodo = pr.periodo
-    WHERE a.periodo IS NOT NULL
-    ORDER BY a.periodo
-    """
-
     try:
-        query_job = client.query(query)
-        results = query_job.result()
-
-        data = []
-        for row in results:
-            data.append({
-                'periodo': row.periodo,
-                'notificaciones_enviadas': row.notificaciones_enviadas,
-                'sellers_enviadas': row.sellers_enviadas,
-                'pagos_reales': row.pagos_reales,
-                'sellers_pagos_reales': row.sellers_pagos_reales,
-                'pagos_from_value': row.pagos_from_value,
-                'sellers_from_value': row.sellers_from_value,
-                'tasa_conversion_total': float(row.tasa_conversion_total) if row.tasa_conversion_total else 0,
-                'tasa_from_value': float(row.tasa_from_value) if row.tasa_from_value else 0,
-            })
-
-        return jsonify({'data': data})
+        results = pendings_cube.monthly_rows(get_pendings_cube(), filter_type)
+
+        return {'data': Columns.from_rows(results, {
+            'periodo': lambda row: row.periodo,
+            'notificaciones_enviadas': lambda row: row.notificaciones_enviadas,
+            'sellers_enviadas': lambda row: row.sellers_enviadas,
+            'pagos_reales': lambda row: row.pagos_reales,
+            'sellers_pagos_reales': lambda row: row.sellers_pagos_reales,
+            'pagos_from_value': lambda row: row.pagos_from_value,
+            'sellers_from_value': lambda row: row.sellers_from_value,
+            'tasa_conversion_total': lambda row: float(row.tasa_conversion_total) if row.tasa_conversion_total else 0,
+            'tasa_from_value': lambda row: float(row.tasa_from_value) if row.tasa_from_value else 0,
+        })}
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/pendings/comparison', methods=['GET'])
+@cached_endpoint('pendings_comparison')
 def get_pendings_comparison():
     """
     Compara notificaciones vs pagos reales en BT_MP_DAS_TAX_EVENTS
     Para ver cuántos de los que "pagaron desde notificación" realmente completaron el pago fiscal
     """
-    query = """
-    WITH pagos_desde_notif AS (
-      SELECT
-        FORMAT_TIMESTAMP('%Y-%m', published) as periodo,
-        COUNT(*) as total_pagos_notif,
-        COUNT(DISTINCT user_id) as sellers_pagos_notif
-      FROM `meli-bi-data.SBOX_SBOXMERCH.DIM_PENDINGS`
-      WHERE content_id = 'mp.sellers.generic_pendings.das_payment_pendings'
-        AND event = 'deleted'
-        AND reason IN ('success', 'success_web')
-      GROUP BY periodo
-    ),
-    pagos_reales AS (
-      SELECT
-        FORMAT_DATE('%Y-%m', EVENT_DATE) as periodo,
-        COUNT(*) as total_pagos_reales,
-        COUNT(DISTINCT CUS_CUST_ID) as sellers_pagos_reales
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE EVENT_TYPE = 'Payment'
-        AND EVENT_DATE IS NOT NULL
-        AND EVENT_DATE <= CURRENT_DATE()
-        AND (CAST(YEAR AS INT64) > 2025 OR (CAST(YEAR AS INT64) = 2025 AND CAST(MONTH AS INT64) >= 12))
-      GROUP BY periodo
-    )
-    SELECT
-      COALESCE(n.periodo, r.periodo) as periodo,
-      IFNULL(n.total_pagos_notif, 0) as pagos_desde_notif,
-      IFNULL(n.sellers_pagos_notif, 0) as sellers_notif,
-      IFNULL(r.total_pagos_reales, 0) as pagos_reales_tax,
-      IFNULL(r.sellers_pagos_reales, 0) as sellers_tax,
-      ROUND((IFNULL(n.total_pagos_notif, 0) * 100.0 / NULLIF(IFNULL(r.total_pagos_reales, 0), 0)), 2) as pct_notif_vs_real
-    FROM pagos_desde_notif n
-    FULL OUTER JOIN pagos_reales r ON n.periodo = r.periodo
-    WHERE COALESCE(n.periodo, r.periodo) IS NOT NULL
-    ORDER BY periodo
+    try:
+        results = pendings_cube.comparison_rows(get_pendings_cube())
+
+        return {'data': Columns.from_rows(results, {
+            'periodo': lambda row: row.periodo,
+            'pagos_desde_notif': lambda row: row.pagos_desde_notif,
+            'sellers_notif': lambda row: row.sellers_notif,
+            'pagos_reales_tax': lambda row: row.pagos_reales_tax,
+            'sellers_tax': lambda row: row.sellers_tax,
+            'pct_notif_vs_real': lambda row: float(row.pct_notif_vs_real) if row.pct_notif_vs_real else 0,
+        })}
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/pendings/latency', methods=['GET'])
+@cached_endpoint('pendings_latency', params=('from', 'to'))
+def get_pendings_latency():
+    """
+    Percentiles (p50/p75/p90/p99, en días) por mes del tiempo hasta el pago:
+      - pagada_desde_notif: de la creación del pending a su deleted success/success_web
+      - pago_real: de la creación del pending enviado al primer Payment del seller
+    Cada pago se fecha por su día. Con ?from=YYYY-MM-DD&to=YYYY-MM-DD se limita al rango
+    (los meses de los extremos quedan recortados); total es la distribución del rango.
+    Se responde fusionando sketches diarios (ver quantile_sketch.py).
     """
+    rango = None
+    if request.args.get('from') is not None or request.args.get('to') is not None:
+        try:
+            rango = queries.parse_date_range(request.args.get('from'), request.args.get('to'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
     try:
-        query_job = client.query(query)
-        results = query_job.result()
-
-        data = []
-        for row in results:
-            data.append({
-                'periodo': row.periodo,
-                'pagos_desde_notif': row.pagos_desde_notif,
-                'sellers_notif': row.sellers_notif,
-                'pagos_reales_tax': row.pagos_reales_tax,
-                'sellers_tax': row.sellers_tax,
-                'pct_notif_vs_real': float(row.pct_notif_vs_real) if row.pct_notif_vs_real else 0
-            })
-
-        return jsonify({'data': data})
+        sketches = get_latency_sketches()
+        span = sketches.span()
+        if span is None:
+            return {'range': None, 'unidad': 'dias', 'data': [], 'total': None}
+        primero, ultimo = (date.fromordinal(o) for o in span)
+        desde, hasta = rango or (primero, ultimo)
+
+        # Solo los meses del rango con datos: (periodo, {tipo: (muestras, valores)})
+        meses = []
+        for mes_idx in range(fact_cube.month_index(max(desde, primero)), fact_cube.month_index(min(hasta, ultimo)) + 1):
+            periodo = fact_cube.month_label(mes_idx)
+            inicio, fin = queries.parse_periodo(periodo)
+            meses.append((periodo, _latency_quantiles(sketches, max(inicio, desde), min(fin, hasta))))
+
+        return {
+            'range': {'from': desde.isoformat(), 'to': hasta.isoformat()},
+            'unidad': 'dias',
+            'data': Columns.from_rows(meses, {
+                'periodo': lambda mes: mes[0],
+                **{tipo: _latency_fields(tipo) for tipo in LATENCY_TIPOS},
+            }),
+            'total': {
+                tipo: _latency_stats(muestras, valores)
+                for tipo, (muestras, valores) in _latency_quantiles(sketches, desde, hasta).items()
+            },
+        }
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+LATENCY_PERCENTILES = (50, 75, 90, 99)
+LATENCY_TIPOS = ('pagada_desde_notif', 'pago_real')
+
+
+def _latency_quantiles(sketches, desde, hasta):
+    """{tipo: (muestras, [valor de cada percentil])} de las dos latencias en el rango"""
+    return {
+        tipo: sketches.quantiles(tipo, desde, hasta, [p / 100 for p in LATENCY_PERCENTILES])
+        for tipo in LATENCY_TIPOS
+    }
+
+
+def _round_days(value):
+    return round(value, 2) if value is not None else None
+
+
+def _latency_stats(muestras, valores):
+    return {'muestras': muestras, **{f'p{p}': _round_days(v) for p, v in zip(LATENCY_PERCENTILES, valores)}}
+
+
+def _latency_fields(tipo):
+    """Columnas {muestras, p50, ...} del tipo, para filas (periodo, {tipo: (muestras, valores)})"""
+    def percentile(i):
+        return lambda mes: _round_days(mes[1][tipo][1][i])
+    return {
+        'muestras': lambda mes: mes[1][tipo][0],
+        **{f'p{p}': percentile(i) for i, p in enumerate(LATENCY_PERCENTILES)},
+    }
+
+
 @app.route('/api/metrics/mtd', methods=['GET'])
+@cached_endpoint('mtd', params=('months',))
 def get_mtd_metrics():
     """
     Devuelve evolución diaria acumulada (MTD) para los últimos N meses.
     Permite comparar el ritmo diario entre meses en: emisiones, pagos y sellers únicos.
     """
-    from flask import request
-
     n_months = int(request.args.get('months', 3))
     n_months = max(2, min(n_months, 6))  # clamp 2-6
 
-    query = f"""
-    WITH month_offsets AS (
-      SELECT offset_val
-      FROM UNNEST(GENERATE_ARRAY(0, {n_months - 1})) AS offset_val
-    ),
-    months_to_analyze AS (
-      SELECT
-        FORMAT_DATE('%Y-%m', DATE_SUB(DATE_TRUNC(CURRENT_DATE(), MONTH), INTERVAL offset_val MONTH)) AS mes
-      FROM month_offsets
-    ),
-    filtered_events AS (
-      SELECT
-        FORMAT_DATE('%Y-%m', EVENT_DATE) AS mes,
-        EXTRACT(DAY FROM EVENT_DATE) AS dia,
-        EVENT_TYPE,
-        SERPRO_STATUS,
-        CUS_CUST_ID
-      FROM `WHOWNER.BT_MP_DAS_TAX_EVENTS`
-      WHERE FORMAT_DATE('%Y-%m', EVENT_DATE) IN (SELECT mes FROM months_to_analyze)
-        AND EVENT_DATE IS NOT NULL
-        AND EVENT_DATE <= CURRENT_DATE()
-        AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
-    ),
-    daily_counts AS (
-      SELECT
-        mes,
-        dia,
-        COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') AS emisiones_dia,
-        COUNTIF(EVENT_TYPE = 'Payment') AS pagos_dia
-      FROM filtered_events
-      GROUP BY mes, dia
-    ),
-    seller_first_day_emission AS (
-      SELECT mes, CUS_CUST_ID, MIN(dia) AS primer_dia
-      FROM filtered_events
-      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
-      GROUP BY mes, CUS_CUST_ID
-    ),
-    seller_first_day_payment AS (
-      SELECT mes, CUS_CUST_ID, MIN(dia) AS primer_dia
-      FROM filtered_events
-      WHERE EVENT_TYPE = 'Payment'
-      GROUP BY mes, CUS_CUST_ID
-    ),
-    new_sellers_per_day AS (
-      SELECT mes, primer_dia AS dia,
-        COUNT(*) AS nuevos_sellers_emisiones,
-        0 AS nuevos_sellers_pagos
-      FROM seller_first_day_emission
-      GROUP BY mes, dia
-
-      UNION ALL
-
-      SELECT mes, primer_dia AS dia,
-        0 AS nuevos_sellers_emisiones,
-        COUNT(*) AS nuevos_sellers_pagos
-      FROM seller_first_day_payment
-      GROUP BY mes, dia
-    ),
-    new_sellers_combined AS (
-      SELECT mes, dia,
-        SUM(nuevos_sellers_emisiones) AS nuevos_sellers_emisiones,
-        SUM(nuevos_sellers_pagos) AS nuevos_sellers_pagos
-      FROM new_sellers_per_day
-      GROUP BY mes, dia
-    ),
-    all_days AS (
-      SELECT m.mes, dia
-      FROM months_to_analyze m
-      CROSS JOIN UNNEST(GENERATE_ARRAY(1, 31)) AS dia
-      WHERE dia <= EXTRACT(DAY FROM LAST_DAY(DATE(CONCAT(m.mes, '-01'))))
-        AND (m.mes < FORMAT_DATE('%Y-%m', CURRENT_DATE())
-             OR (m.mes = FORMAT_DATE('%Y-%m', CURRENT_DATE()) AND dia <= EXTRACT(DAY FROM CURRENT_DATE())))
-    ),
-    combined AS (
-      SELECT
-        a.mes,
-        a.dia,
-        IFNULL(dc.emisiones_dia, 0) AS emisiones_dia,
-        IFNULL(dc.pagos_dia, 0) AS pagos_dia,
-        IFNULL(nsc.nuevos_sellers_emisiones, 0) AS nuevos_sellers_emisiones,
-        IFNULL(nsc.nuevos_sellers_pagos, 0) AS nuevos_sellers_pagos
-      FROM all_days a
-      LEFT JOIN daily_counts dc ON a.mes = dc.mes AND a.dia = dc.dia
-      LEFT JOIN new_sellers_combined nsc ON a.mes = nsc.mes AND a.dia = nsc.dia
-    )
-    SELECT
-      mes,
-      dia,
-      SUM(emisiones_dia) OVER (PARTITION BY mes ORDER BY dia) AS emisiones_acum,
-      SUM(pagos_dia) OVER (PARTITION BY mes ORDER BY dia) AS pagos_acum,
-      SUM(nuevos_sellers_emisiones) OVER (PARTITION BY mes ORDER BY dia) AS sellers_emisiones_acum,
-      SUM(nuevos_sellers_pagos) OVER (PARTITION BY mes ORDER BY dia) AS sellers_pagos_acum
-    FROM combined
-    ORDER BY mes ASC, dia ASC
-    """
-
     try:
-        query_job = client.query(query)
-        rows = list(query_job.result())
+        rows = fact_cube.mtd_rows(get_fact_cube(), n_months, datetime.now(timezone.utc).date())
 
-        data_by_mes = {}
+        rows_by_mes = {}
         for row in rows:
-            mes = row.mes
-            if mes not in data_by_mes:
-                data_by_mes[mes] = []
-            data_by_mes[mes].append({
-                'dia': row.dia,
-                'emisiones_acum': row.emisiones_acum,
-                'pagos_acum': row.pagos_acum,
-                'sellers_emisiones_acum': row.sellers_emisiones_acum,
-                'sellers_pagos_acum': row.sellers_pagos_acum,
+            rows_by_mes.setdefault(row.mes, []).append(row)
+
+        meses = sorted(rows_by_mes.keys())
+        data_by_mes = {
+            mes: Columns.from_rows(mes_rows, {
+                'dia': lambda row: row.dia,
+                'emisiones_acum': lambda row: row.emisiones_acum,
+                'pagos_acum': lambda row: row.pagos_acum,
+                'sellers_emisiones_acum': lambda row: row.sellers_emisiones_acum,
+                'sellers_pagos_acum': lambda row: row.sellers_pagos_acum,
             })
+            for mes, mes_rows in rows_by_mes.items()
+        }
 
-        meses = sorted(data_by_mes.keys())
-
-        return jsonify({'meses': meses, 'data': data_by_mes})
+        return {'meses': meses, 'data': data_by_mes}
 
     except Exception as e:
         import traceback
@@ -1126,5 +1277,14 @@ def get_mtd_metrics():
         return jsonify({'error': str(e)}), 500
 
 
+# Al final del módulo: el warmer necesita todas las rutas registradas
+if response_snapshot is not None:
+    response_snapshot.load_in_background(restore_response)
+
+cache_warmer_enabled = os.environ.get('CACHE_WARMER', '1') == '1'
+if cache_warmer_enabled:
+    cache_warmer.start()
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
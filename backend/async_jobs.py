@@ -0,0 +1,107 @@
+"""
+Jobs asincrónicos para endpoints pesados (?async=1).
+
+En lugar de bloquear un thread de gunicorn mientras corre el cálculo, el endpoint
+responde 202 con un handle y el cálculo sigue en un pool propio; el cliente consulta
+/api/jobs/<id> hasta que termina. Pedidos iguales en vuelo comparten el mismo job, y los
+resultados terminados se guardan result_ttl segundos.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+QUEUED, RUNNING, DONE, ERROR = 'queued', 'running', 'done', 'error'
+
+
+class Job:
+    __slots__ = ('id', 'key', 'name', 'status', 'created_at', 'started_at', 'finished_at', 'value', 'error')
+
+    def __init__(self, key, name):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.name = name
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.value = None
+        self.error = None
+
+    def describe(self):
+        end = self.finished_at or time.time()
+        return {
+            'job_id': self.id,
+            'endpoint': self.name,
+            'status': self.status,
+            'created_at': datetime.fromtimestamp(self.created_at).isoformat(),
+            'queued_s': round((self.started_at or end) - self.created_at, 2),
+            'elapsed_s': round(end - self.started_at, 2) if self.started_at else None,
+        }
+
+
+class JobRegistry:
+    """Jobs por id; un job terminado se olvida result_ttl segundos después de terminar."""
+
+    def __init__(self, max_workers=4, result_ttl=600, max_jobs=1000):
+        self.result_ttl = result_ttl
+        self.max_jobs = max_jobs
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='async-job')
+        self.stats = {'submitted': 0, 'coalesced': 0, 'expired': 0}
+
+    def _expire(self, now):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.result_ttl]
+        # Con demasiados jobs se descartan primero los terminados más viejos
+        finished = sorted((job.finished_at, job_id) for job_id, job in self._jobs.items()
+                          if job.finished_at is not None and job_id not in expired)
+        excess = len(self._jobs) - len(expired) - self.max_jobs
+        expired += [job_id for _, job_id in finished[:max(0, excess)]]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.stats['expired'] += len(expired)
+
+    def submit(self, key, name, compute):
+        """Devuelve el job en vuelo para key, o lanza uno nuevo que ejecuta compute()"""
+        with self._lock:
+            self._expire(time.time())
+            job = self._inflight.get(key)
+            if job is not None:
+                self.stats['coalesced'] += 1
+                return job
+            job = Job(key, name)
+            self._jobs[job.id] = job
+            self._inflight[key] = job
+            self.stats['submitted'] += 1
+        self._executor.submit(self._run, job, compute)
+        return job
+
+    def _run(self, job, compute):
+        job.started_at = time.time()
+        job.status = RUNNING
+        try:
+            job.value = compute()
+            job.status = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.status = ERROR
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._inflight.pop(job.key, None)
+
+    def get(self, job_id):
+        with self._lock:
+            self._expire(time.time())
+            return self._jobs.get(job_id)
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {'jobs': counts, 'result_ttl_s': self.result_ttl, **self.stats}
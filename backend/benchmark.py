@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los endpoints del backend.
+
+Recorre todas las rutas de app.py con el test client de Flask contra un warehouse falso
+(FakeWarehouse) cuyos jobs devuelven filas grabadas después de una latencia configurable.
+Las filas se graban una vez desde el warehouse configurado (WAREHOUSE / --data, ver
+warehouse.py) o se cargan de un archivo (--recording), así el benchmark no depende de
+BigQuery y la latencia de las queries es controlada.
+
+Mide por endpoint p50/p95/p99 con caché fría (cada request recalcula) y caliente,
+el throughput con N threads (como gunicorn --threads 8), el pico de RSS y el tiempo de
+post-procesamiento en Python (conversión de filas a JSON, ver query_stats.py).
+Los resultados se guardan en JSON para comparar corridas (--compare).
+
+    python synthetic_data.py --rows 1000000 --out data
+    python benchmark.py --data data --latency-ms 800 --output bench.json
+    python benchmark.py --data data --compare bench.json
+"""
+import argparse
+import json
+import os
+import pickle
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from query_stats import percentiles
+
+
+class FakeJob:
+    """Job con la interfaz de bigquery.QueryJob que devuelve filas fijas tras un delay."""
+
+    total_bytes_processed = None
+    total_bytes_billed = None
+    slot_millis = None
+    cache_hit = False
+
+    def __init__(self, rows, delay):
+        self.job_id = f"fake_{uuid.uuid4().hex[:12]}"
+        self.created = self.started = datetime.now(timezone.utc)
+        self.ended = None
+        self._rows = rows
+        self._delay = delay
+        self._cancelled = threading.Event()
+
+    def result(self, timeout=None):
+        if self._cancelled.wait(self._delay if timeout is None else min(self._delay, timeout)):
+            raise RuntimeError(f"Job {self.job_id} cancelado")
+        if timeout is not None and timeout < self._delay:
+            raise TimeoutError(f"Job {self.job_id} sin terminar tras {timeout}s")
+        self.ended = datetime.now(timezone.utc)
+        return list(self._rows)
+
+    def cancel(self):
+        self._cancelled.set()
+        return True
+
+
+class FakeWarehouse:
+    """
+    Warehouse con filas grabadas por query (Query.key -> filas) y latencia inyectada:
+    latency_ms * lognormal(0, jitter). Las queries que no están grabadas se ejecutan una
+    vez contra source (si hay) y se graban.
+    """
+
+    name = 'fake'
+
+    def __init__(self, recording=None, source=None, latency_ms=0, jitter=0.0, seed=0):
+        self.recording = dict(recording or {})
+        self.source = source
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+
+    def _rows(self, query):
+        with self._lock:
+            rows = self.recording.get(query.key)
+            if rows is None:
+                if self.source is None:
+                    raise KeyError(f"Query sin grabar y sin warehouse de origen: {query.sql[:80]}...")
+                rows = list(self.source.submit(query).result())
+                self.recording[query.key] = rows
+            delay = self.latency_ms / 1000.0
+            if self.jitter:
+                delay *= float(self._rng.lognormal(0.0, self.jitter))
+        return rows, delay
+
+    def submit(self, query):
+        rows, delay = self._rows(query)
+        return FakeJob(rows, delay)
+
+    def describe(self):
+        return {'backend': self.name, 'latency_ms': self.latency_ms, 'jitter': self.jitter,
+                'queries_grabadas': len(self.recording)}
+
+
+def _months_ago(n):
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - n
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def benchmark_urls():
+    """URL representativas de cada ruta (con las variantes de parámetros que cambian la query)"""
+    return [
+        '/ping',
+        '/api/health',
+        '/api/metrics/monthly',
+        '/api/metrics/sellers',
+        '/api/metrics/sellers/recurrence',
+        f'/api/metrics/month/{_months_ago(1)}',
+        f'/api/metrics/month/{_months_ago(1)}?filter=fiscal',
+        f'/api/metrics/month/{_months_ago(2)}',
+        '/api/metrics/nextsteps',
+        '/api/pendings/summary',
+        '/api/pendings/monthly',
+        '/api/pendings/monthly?filter=fiscal',
+        '/api/pendings/comparison',
+        '/api/metrics/mtd?months=3',
+        '/api/metrics/mtd?months=6',
+        '/api/cache/stats',
+        '/api/debug/queries',
+    ]
+
+
+def _check_coverage(app, urls):
+    """Avisa si hay rutas de la app sin URL en el benchmark"""
+    adapter = app.url_map.bind('localhost')
+    covered = {adapter.match(url.split('?')[0])[0] for url in urls}
+    missing = sorted(r.rule for r in app.url_map.iter_rules()
+                     if r.endpoint != 'static' and r.endpoint not in covered)
+    if missing:
+        print(f"⚠️  Rutas sin cubrir en el benchmark: {', '.join(missing)}")
+    return missing
+
+
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KB, macOS bytes
+    return round(peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024, 1)
+
+
+def _timed_get(client, url):
+    start = time.perf_counter()
+    response = client.get(url)
+    elapsed = (time.perf_counter() - start) * 1000
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} devolvió {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    return elapsed, response.headers.get('X-Cache')
+
+
+def measure_latency(app_module, urls, iterations, cold):
+    """Requests secuenciales por URL; con cold=True se vacía la caché antes de cada una"""
+    client = app_module.app.test_client()
+    results = {}
+    for url in urls:
+        samples = []
+        for _ in range(iterations):
+            if cold:
+                app_module.result_cache.clear()
+            elapsed, _ = _timed_get(client, url)
+            samples.append(round(elapsed, 2))
+        results[url] = {'n': len(samples), 'mean_ms': round(sum(samples) / len(samples), 2),
+                        **percentiles(samples)}
+    return results
+
+
+def measure_throughput(app_module, urls, threads, requests):
+    """
+    requests GETs repartidos entre threads, con las URL en round-robin y la caché vacía
+    al inicio (mezcla realista de misses, coalescing y hits).
+    """
+    app_module.result_cache.clear()
+    local = threading.local()
+
+    def one(i):
+        if not hasattr(local, 'client'):
+            local.client = app_module.app.test_client()
+        return _timed_get(local.client, urls[i % len(urls)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        samples = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    estados = {}
+    for _, estado in samples:
+        estados[estado or 'NONE'] = estados.get(estado or 'NONE', 0) + 1
+    return {
+        'threads': threads,
+        'requests': requests,
+        'wall_s': round(wall, 3),
+        'requests_per_s': round(requests / wall, 2),
+        'latency_ms': percentiles([round(ms, 2) for ms, _ in samples]),
+        'x_cache': estados,
+    }
+
+
+def postprocess_stats(app_module):
+    """Tiempo de post-procesamiento en Python por endpoint, medido por query_stats"""
+    snapshot = app_module.query_stats.snapshot(limit=1)
+    return {
+        endpoint: {'computes': data['computes'], 'postprocess_ms': data['postprocess_ms']}
+        for endpoint, data in snapshot['endpoints'].items()
+        if data['computes']
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return None
+
+
+def run(app_module, warehouse, urls, iterations, threads, requests):
+    app_module.warehouse = warehouse
+    _check_coverage(app_module.app, urls)
+
+    # Pasadas iniciales: graban las filas de todas las queries (fuera de la medición).
+    # La segunda graba las variantes incrementales (p. ej. monthly_store después de la carga completa)
+    latency_ms, warehouse.latency_ms = warehouse.latency_ms, 0
+    app_module.result_cache.clear()
+    measure_latency(app_module, urls, 2, cold=True)
+    warehouse.latency_ms = latency_ms
+    app_module.query_stats.clear()
+
+    result = {
+        'timestamp': datetime.now().isoformat(),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'warehouse': warehouse.describe(),
+        'config': {'iterations': iterations, 'threads': threads, 'requests': requests},
+        'cold': measure_latency(app_module, urls, iterations, cold=True),
+        'postprocess': postprocess_stats(app_module),
+    }
+    app_module.result_cache.clear()
+    measure_latency(app_module, urls, 1, cold=False)
+    result['warm'] = measure_latency(app_module, urls, iterations, cold=False)
+    result['throughput'] = measure_throughput(app_module, urls, threads, requests)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def compare(previous, current):
+    """Tabla de p50/p95 (caché fría) por URL entre dos corridas"""
+    print(f"\n{'URL':<50} {'p50 antes':>10} {'p50 ahora':>10} {'p95 antes':>10} {'p95 ahora':>10}")
+    for url, now in current['cold'].items():
+        before = previous.get('cold', {}).get(url)
+        if before is None:
+            continue
+        print(f"{url:<50} {before['p50']:>10.1f} {now['p50']:>10.1f} {before['p95']:>10.1f} {now['p95']:>10.1f}")
+    for key in ('requests_per_s',):
+        print(f"throughput {key}: {previous['throughput'][key]} -> {current['throughput'][key]}")
+    print(f"peak_rss_mb: {previous.get('peak_rss_mb')} -> {current.get('peak_rss_mb')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los endpoints del backend')
+    parser.add_argument('--data', help='directorio Parquet para grabar filas con DuckDB (ver synthetic_data.py)')
+    parser.add_argument('--recording', help='archivo de filas grabadas (pickle) a cargar')
+    parser.add_argument('--save-recording', help='guardar las filas grabadas en este archivo')
+    parser.add_argument('--latency-ms', type=float, default=500, help='latencia de cada job falso')
+    parser.add_argument('--jitter', type=float, default=0.3, help='sigma lognormal de la latencia')
+    parser.add_argument('--iterations', type=int, default=5, help='requests por URL en la medición de latencia')
+    parser.add_argument('--threads', type=int, default=8, help='threads concurrentes (gunicorn --threads)')
+    parser.add_argument('--requests', type=int, default=200, help='requests totales en la prueba de throughput')
+    parser.add_argument('--output', help='archivo JSON de resultados')
+    parser.add_argument('--compare', help='JSON de una corrida anterior para comparar')
+    args = parser.parse_args()
+
+    if args.data:
+        os.environ['WAREHOUSE'] = 'duckdb'
+        os.environ['WAREHOUSE_DATA_DIR'] = args.data
+    os.environ.setdefault('CACHE_WARMER', '0')
+    os.environ.setdefault('MONTHLY_STORE_PATH', os.path.join(tempfile.mkdtemp(), 'monthly_aggregates.sqlite'))
+    # Caché solo en memoria y sin snapshot: result_cache.clear() debe dejarla realmente en frío
+    os.environ.setdefault('CACHE_STORE', 'memory')
+    os.environ.setdefault('RESPONSE_SNAPSHOT_PATH', '')
+    import app as app_module
+
+    recording = None
+    if args.recording:
+        with open(args.recording, 'rb') as f:
+            recording = pickle.load(f)
+    source = None if recording and not args.data else app_module.warehouse
+    warehouse = FakeWarehouse(recording, source=source, latency_ms=args.latency_ms, jitter=args.jitter)
+
+    result = run(app_module, warehouse, benchmark_urls(), args.iterations, args.threads, args.requests)
+
+    if args.save_recording:
+        with open(args.save_recording, 'wb') as f:
+            pickle.dump(warehouse.recording, f)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"✅ Resultados en {args.output}")
+
+    print(f"\n{'URL':<50} {'fría p50':>9} {'p95':>9} {'p99':>9} {'caliente p50':>13}")
+    for url, cold in result['cold'].items():
+        warm = result['warm'][url]
+        print(f"{url:<50} {cold['p50']:>9.1f} {cold['p95']:>9.1f} {cold['p99']:>9.1f} {warm['p50']:>13.2f}")
+    tp = result['throughput']
+    print(f"\nThroughput ({tp['threads']} threads): {tp['requests_per_s']} req/s, "
+          f"p50 {tp['latency_ms']['p50']:.1f} ms, p99 {tp['latency_ms']['p99']:.1f} ms")
+    print(f"Peak RSS: {result['peak_rss_mb']} MB")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+
+if __name__ == '__main__':
+    main()
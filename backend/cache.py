@@ -0,0 +1,397 @@
+"""
+Caché en memoria de resultados de endpoints respaldados por BigQuery.
+
+Las entradas se indexan por (endpoint, parámetros) y cada endpoint define su TTL.
+Pasado el TTL la entrada sigue sirviéndose durante una ventana "stale" mientras se
+recalcula en background (stale-while-revalidate), así un dashboard caliente nunca
+espera a BigQuery. El tamaño está acotado con expulsión LRU.
+
+Cada entrada se etiqueta con la versión de las tablas fuente de su endpoint (sources) al
+empezar el cálculo; invalidate(versiones) vence solo las entradas cuyas tablas cambiaron.
+
+Con un almacén compartido (ver shared_cache.py) cada resultado calculado se publica ahí y
+un worker que no lo tiene fresco en memoria adopta la versión publicada por otro. Solo el
+worker que toma el lease de una clave lanza el cálculo; los demás esperan su publicación.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Entry:
+    __slots__ = ('value', 'created_at', 'fresh_until', 'stale_until', 'derived', 'version', 'tags')
+
+    def __init__(self, value, ttl, stale_ttl, now=None, version=0, tags=None):
+        now = time.time() if now is None else now
+        self.value = value
+        self.tags = tags or {}
+        self.derived = {}
+        self.created_at = now
+        self.fresh_until = now + ttl
+        self.stale_until = now + ttl + stale_ttl
+        self.version = version
+
+    @classmethod
+    def from_stored(cls, stored):
+        value, tags = stored.value
+        return cls(value, stored.fresh_until - stored.created_at, stored.stale_until - stored.fresh_until,
+                   now=stored.created_at, version=stored.version, tags=tags)
+
+
+class ResultCache:
+    """Caché LRU con TTL por entrada y revalidación en background."""
+
+    def __init__(self, max_entries=256, stale_ttl=3600, store=None, lease_ttl=300, sources=None):
+        self.max_entries = max_entries
+        self.stale_ttl = stale_ttl
+        # Nombre de endpoint -> tablas de las que depende, y última versión conocida de cada una
+        self.sources = sources or {}
+        self.table_versions = {}
+        self._invalidations = 0
+        self.store = store
+        self.lease_ttl = lease_ttl
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._evictions = 0
+
+    def _count(self, endpoint, name):
+        counters = self._counters.setdefault(
+            endpoint, {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'refresh_errors': 0,
+                       'shared_hits': 0, 'lease_waits': 0}
+        )
+        counters[name] += 1
+
+    def get_or_compute(self, key, compute, ttl, should_cache=lambda value: True):
+        """
+        Devuelve (valor, estado) con estado 'hit', 'stale' o 'miss'.
+        key[0] debe ser el nombre del endpoint (se usa para los contadores).
+        """
+        endpoint = key[0]
+        now = time.time()
+        if self.store is not None:
+            self._adopt(key, fresh_only=True)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                if now < entry.fresh_until:
+                    self._count(endpoint, 'hits')
+                    return entry.value, 'hit'
+                self._count(endpoint, 'stale_hits')
+                start_refresh = key not in self._refreshing
+                if start_refresh:
+                    self._refreshing.add(key)
+            else:
+                entry = None
+                self._count(endpoint, 'misses')
+
+        if entry is not None:
+            if start_refresh:
+                threading.Thread(
+                    target=self._refresh, args=(key, compute, ttl, should_cache), daemon=True
+                ).start()
+            return entry.value, 'stale'
+
+        return self._compute(key, compute, ttl, should_cache, since_version=0), 'miss'
+
+    def _compute(self, key, compute, ttl, should_cache, since_version):
+        """
+        compute() y guarda el resultado; con almacén compartido solo si este proceso toma el
+        lease de key; si no, devuelve lo que publique quien lo tiene (versión > since_version)
+        """
+        owner = None
+        if self.store is not None:
+            owner, published = self._lease_or_wait(key, since_version)
+            if published is not None:
+                return published.value
+        try:
+            tags = self._tags(key)
+            value = compute()
+            if should_cache(value):
+                self.set(key, value, ttl, tags)
+            return value
+        finally:
+            if owner is not None:
+                self._store_call(self.store.release_lease, key, owner)
+
+    def _refresh(self, key, compute, ttl, should_cache):
+        owner = None
+        try:
+            # Si otro worker ya está refrescando key, su publicación llega en el próximo acceso
+            if self.store is not None:
+                owner = self._store_call(self.store.acquire_lease, key, self.lease_ttl)
+                if owner is None:
+                    return
+            tags = self._tags(key)
+            value = compute()
+            if should_cache(value):
+                self.set(key, value, ttl, tags)
+            with self._lock:
+                self._count(key[0], 'refreshes')
+        except Exception as e:
+            print(f"Error refrescando caché {key}: {e}")
+            with self._lock:
+                self._count(key[0], 'refresh_errors')
+        finally:
+            if owner is not None:
+                self._store_call(self.store.release_lease, key, owner)
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh(self, key, compute, ttl, should_cache=lambda value: True):
+        """
+        Recalcula key ahora aunque siga fresca (p. ej. tras una carga nueva); propaga errores.
+        Si otro worker la está recalculando a la vez, usa su resultado.
+        """
+        since_version = 0
+        if self.store is not None:
+            since_version = self._store_call(self.store.version, key) or 0
+        value = self._compute(key, compute, ttl, should_cache, since_version)
+        with self._lock:
+            self._count(key[0], 'refreshes')
+        return value
+
+    def run_once(self, name, fn, ttl, done=lambda result: True):
+        """
+        Ejecuta fn() en un solo worker por name durante ttl segundos (p. ej. un
+        precalentamiento por carga de tablas). Devuelve (True, resultado) si lo ejecutó este
+        proceso, o (False, None) si ya lo hizo otro (esperando a que termine si estaba en
+        curso). Solo se marca como hecho si done(resultado).
+        """
+        if self.store is None:
+            return True, fn()
+        key = ('run_once', name)
+        if self._store_call(self.store.version, key):
+            return False, None
+        owner, published = self._lease_or_wait(key, since_version=0, lease_ttl=ttl)
+        if published is not None:
+            return False, None
+        try:
+            result = fn()
+            if done(result):
+                self._store_call(self.store.publish, key, (True, {}), ttl, 0)
+            return True, result
+        finally:
+            if owner is not None:
+                self._store_call(self.store.release_lease, key, owner)
+
+    def sync(self):
+        """Adopta las versiones publicadas por otros workers de las claves en memoria; devuelve cuántas"""
+        if self.store is None:
+            return 0
+        with self._lock:
+            keys = list(self._entries)
+        return sum(1 for key in keys if self._adopt(key) is not None)
+
+    def export(self, names):
+        """(clave, valor, created_at, tags) de las entradas en memoria de los endpoints names"""
+        with self._lock:
+            return [(key, entry.value, entry.created_at, entry.tags)
+                    for key, entry in self._entries.items() if key[0] in names]
+
+    def restore(self, key, value, created_at, ttl, tags=None):
+        """
+        Agrega una respuesta guardada (p. ej. del snapshot en disco) si no hay otra en memoria.
+        Se sirve aunque sea vieja: pasado su TTL, o si cambiaron sus tablas, queda stale y
+        el primer acceso la recalcula.
+        """
+        entry = _Entry(value, ttl, self.stale_ttl, now=created_at, tags=tags)
+        entry.stale_until = max(entry.stale_until, time.time() + self.stale_ttl)
+        with self._lock:
+            if key in self._entries:
+                return False
+            self._put(key, entry)
+            return True
+
+    def contains(self, key):
+        """True si key se puede servir ya (fresca o dentro de la ventana stale), sin contar un acceso"""
+        if self.store is not None:
+            self._adopt(key, fresh_only=True)
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() < entry.stale_until
+
+    def _store_call(self, fn, *args, default=None):
+        """Llamada al almacén compartido; si falla devuelve default y se sigue con la caché local"""
+        try:
+            return fn(*args)
+        except Exception as e:
+            print(f"Error en la caché compartida ({fn.__name__}): {e}")
+            return default
+
+    def _adopt(self, key, fresh_only=False, since_version=None):
+        """
+        Trae la entrada de key publicada por otro worker si es más nueva que la local.
+        Con fresh_only no consulta el almacén mientras la local siga fresca.
+        Devuelve la entrada (adoptada o ya local) con versión > since_version, o None.
+        """
+        with self._lock:
+            local = self._entries.get(key)
+        if fresh_only and local is not None and time.time() < local.fresh_until:
+            return None
+        if since_version is None:
+            since_version = local.version if local is not None else 0
+        stored = self._store_call(self.store.get, key, since_version)
+        if stored is None:
+            return None
+        entry = _Entry.from_stored(stored)
+        with self._lock:
+            current = self._entries.get(key)
+            if current is not None and current.version >= entry.version:
+                return current  # otro thread ya la adoptó
+            self._put(key, entry)
+            self._count(key[0], 'shared_hits')
+        return entry
+
+    def _lease_or_wait(self, key, since_version, lease_ttl=None):
+        """
+        (owner, None) si este proceso debe calcular key, o (None, entrada) si otro worker
+        publicó una versión > since_version mientras se esperaba su lease. Si el lease no se
+        libera en lease_ttl se calcula igual, sin lease.
+        """
+        lease_ttl = lease_ttl or self.lease_ttl
+        deadline = time.monotonic() + lease_ttl
+        waited = False
+        while True:
+            owner = self._store_call(self.store.acquire_lease, key, lease_ttl, default=False)
+            if owner is False:  # almacén caído: se calcula sin coordinar
+                return None, None
+            # Quien tenía el lease pudo publicar justo antes de soltarlo
+            published = self._adopt(key, since_version=since_version) if waited or owner is None else None
+            if published is not None:
+                if owner is not None:
+                    self._store_call(self.store.release_lease, key, owner)
+                return None, published
+            if owner is not None or time.monotonic() > deadline:
+                return owner, None
+            if not waited:
+                waited = True
+                with self._lock:
+                    self._count(key[0], 'lease_waits')
+            time.sleep(0.2)
+
+    def derived(self, key, value, name, build):
+        """
+        build() memorizado junto a la entrada de key (p. ej. el cuerpo ya serializado y
+        comprimido) mientras la entrada siga guardando value; si no, se calcula sin guardar.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.value is not value:
+                entry = None
+            elif name in entry.derived:
+                return entry.derived[name]
+        result = build()
+        if entry is not None:
+            with self._lock:
+                entry.derived[name] = result
+        return result
+
+    def last_good(self, key):
+        """
+        (valor, antigüedad en segundos) de la última respuesta guardada para key aunque
+        ya esté vencida (sigue en memoria hasta que la expulse el LRU), o None
+        """
+        if self.store is not None:
+            self._adopt(key, fresh_only=True)
+        with self._lock:
+            entry = self._entries.get(key)
+            return (entry.value, time.time() - entry.created_at) if entry is not None else None
+
+    def set(self, key, value, ttl, tags=None):
+        """tags: versiones de las tablas fuente con las que se calculó value (por defecto las actuales)"""
+        tags = self._tags(key) if tags is None else tags
+        entry = _Entry(value, ttl, self.stale_ttl, tags=tags)
+        if self.store is not None:
+            published = self._store_call(self.store.publish, key, (value, tags), ttl, self.stale_ttl)
+            if published is not None:
+                entry = _Entry(value, ttl, self.stale_ttl, now=published[1], version=published[0], tags=tags)
+        with self._lock:
+            self._put(key, entry)
+
+    def touch(self):
+        """
+        Renueva el TTL (desde ahora) de las entradas vigentes cuyas tablas fuente siguen en
+        la versión con la que se calcularon, sin recalcularlas; con almacén compartido se
+        republican. Las entradas sin versiones conocidas no se tocan. Devuelve las claves renovadas.
+        """
+        now = time.time()
+        with self._lock:
+            current = [
+                (key, entry) for key, entry in self._entries.items()
+                if now < entry.stale_until and entry.tags and all(
+                    version is not None and self.table_versions.get(table) == version
+                    for table, version in entry.tags.items()
+                )
+            ]
+        for key, entry in current:
+            self.set(key, entry.value, entry.fresh_until - entry.created_at, entry.tags)
+            # Mismo valor: los cuerpos ya serializados siguen sirviendo
+            with self._lock:
+                renewed = self._entries.get(key)
+                if renewed is not None and renewed.value is entry.value:
+                    renewed.derived = entry.derived
+        return [key for key, _ in current]
+
+    def _tags(self, key):
+        return {table: self.table_versions.get(table) for table in self.sources.get(key[0], ())}
+
+    def _outdated(self, entry):
+        """True si alguna tabla fuente de entry cambió de versión desde que se calculó"""
+        return any(
+            version is not None and self.table_versions.get(table) not in (None, version)
+            for table, version in entry.tags.items()
+        )
+
+    def invalidate(self, versions):
+        """
+        Registra las versiones actuales de las tablas fuente y vence (pasan a stale) las
+        entradas calculadas con otra versión de alguna de sus tablas. Devuelve las claves vencidas.
+        """
+        now = time.time()
+        with self._lock:
+            self.table_versions = dict(versions)
+            invalidated = []
+            for key, entry in self._entries.items():
+                if now < entry.fresh_until and self._outdated(entry):
+                    entry.fresh_until = now
+                    invalidated.append(key)
+            self._invalidations += len(invalidated)
+            return invalidated
+
+    def _put(self, key, entry):
+        # Una entrada calculada (o publicada) con tablas ya reemplazadas nace vencida
+        if self._outdated(entry):
+            entry.fresh_until = min(entry.fresh_until, time.time())
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {name: dict(c) for name, c in self._counters.items()}
+            totals = {}
+            for c in endpoints.values():
+                for name, value in c.items():
+                    totals[name] = totals.get(name, 0) + value
+            hits = totals.get('hits', 0) + totals.get('stale_hits', 0)
+            lookups = hits + totals.get('misses', 0)
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'table_versions': self.table_versions,
+                'hit_ratio': round(hits / lookups, 4) if lookups else None,
+                'shared_store': self.store.name if self.store is not None else None,
+                'totals': totals,
+                'endpoints': endpoints,
+            }
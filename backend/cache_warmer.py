@@ -0,0 +1,245 @@
+"""
+Precalentamiento de la caché de resultados.
+
+Un thread en background consulta cada interval segundos la versión de las tablas fuente
+(metadata del warehouse: última modificación y filas, sin escanear datos). Cuando detecta
+una carga nueva vence en la caché las entradas que dependen de las tablas que cambiaron y
+recalcula solo esas. Cuando el último calentamiento tiene más de max_age segundos y ninguna
+tabla cambió, renueva el TTL de las entradas (sus versiones siguen vigentes) sin volver al
+warehouse; solo si el warehouse no informa versiones recalcula todas las respuestas. Así
+ningún usuario paga el costo de las queries en frío.
+
+El trabajo se describe como etapas que se ejecutan en orden (p. ej. primero el cubo de
+hechos y después los endpoints que derivan de él); dentro de cada etapa las tareas corren
+con un máximo de concurrency en paralelo para no competir con el tráfico de usuarios.
+
+Una tarea que falla no repite el calentamiento completo: se reintenta sola en los chequeos
+siguientes, con backoff exponencial (interval, 2x, 4x... hasta max_age).
+
+Con una caché compartida entre workers (cache con almacén, ver cache.py) solo un worker
+calienta cada versión de las tablas; los demás adoptan lo que publicó.
+"""
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+
+class CacheWarmer:
+    """
+    stages: lista de callables stage(changed); cada uno devuelve la lista de tareas
+    (nombre, fn) de su etapa para el conjunto de tablas que cambiaron (None = todas) y se
+    evalúa recién cuando terminó la etapa anterior.
+    """
+
+    def __init__(self, warehouse, stages, interval=300, max_age=3 * 3600, concurrency=2, cache=None):
+        self.warehouse = warehouse
+        self.cache = cache
+        self.stages = stages
+        self.interval = interval
+        self.max_age = max_age
+        self.concurrency = concurrency
+        self._versions = None
+        self._last_warm = None
+        self._last_run = {}
+        self._last_retry = None
+        # nombre -> (etapa, fn, intentos, próximo reintento) de las tareas que fallaron
+        self._failed = {}
+        self._invalidated = 0
+        self._runs = 0
+        self._running = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def table_versions(self):
+        versions = getattr(self.warehouse, 'table_versions', None)
+        return versions() if versions else {}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='cache-warmer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Error en el precalentamiento de caché: {e}")
+            self._stop.wait(self.interval)
+
+    def check(self):
+        """Calienta la caché si cambió alguna tabla o si el último calentamiento es viejo"""
+        versions = self.table_versions()
+        changed = None
+        if versions != self._versions:
+            if self._versions is None:
+                reason = 'inicio'
+            else:
+                reason = 'tablas actualizadas'
+                changed = {t for t in set(versions) | set(self._versions) if versions.get(t) != self._versions.get(t)}
+            # Cada worker vence sus entradas locales; el recálculo lo hace uno solo
+            if self.cache is not None:
+                self._invalidated = len(self.cache.invalidate(versions))
+        elif self._last_warm is None or time.time() - self._last_warm > self.max_age:
+            reason = 'max_age'
+        else:
+            return self.retry_failed() is not None
+        if reason == 'max_age' and versions and self.cache is not None:
+            # Ninguna tabla cambió: se renuevan las entradas en lugar de recalcularlas
+            run = functools.partial(self.extend, reason, versions)
+        else:
+            run = functools.partial(self.warm, reason, versions, changed)
+        if self.cache is None or self.cache.store is None:
+            run()
+            return True
+        warmed, _ = self.cache.run_once(
+            ('warm', repr(sorted(versions.items()))), run,
+            ttl=self.max_age, done=lambda run: run is not None,
+        )
+        if not warmed:
+            self._adopt_shared(reason, versions)
+        return True
+
+    def _adopt_shared(self, reason, versions):
+        """Otro worker ya calentó esta versión de las tablas: se adoptan sus resultados"""
+        start = time.time()
+        synced = self.cache.sync()
+        self._versions = versions
+        self._last_warm = start
+        self._last_run = {
+            'reason': reason,
+            'invalidated': self._invalidated,
+            'started_at': datetime.fromtimestamp(start).isoformat(),
+            'duration_s': round(time.time() - start, 2),
+            'shared': True,
+            'synced': synced,
+        }
+
+    def _backoff(self, attempts):
+        return min(self.interval * 2 ** (attempts - 1), self.max_age)
+
+    def _run(self, stages):
+        """
+        Ejecuta en orden las etapas [(índice, callable que devuelve [(nombre, fn)])].
+        Devuelve (tareas, [(etapa, nombre, fn, error)]) o None si ya hay un calentamiento en curso.
+        """
+        with self._lock:
+            if self._running:
+                return None
+            self._running = True
+        tasks = 0
+        failed = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='warm') as pool:
+                for index, stage in stages:
+                    futures = [(name, fn, pool.submit(fn)) for name, fn in stage()]
+                    for name, fn, future in futures:
+                        tasks += 1
+                        try:
+                            future.result()
+                        except Exception as e:
+                            failed.append((index, name, fn, e))
+        finally:
+            with self._lock:
+                self._running = False
+        return tasks, failed
+
+    def warm(self, reason='manual', versions=None, changed=None):
+        """Recalcula las respuestas que dependen de las tablas changed (None = todas)"""
+        start = time.time()
+        result = self._run([(i, functools.partial(stage, changed)) for i, stage in enumerate(self.stages)])
+        if result is None:
+            return None
+        tasks, failed = result
+
+        self._versions = versions if versions is not None else self._versions
+        # El calentamiento cuenta aunque fallen tareas: solo esas se reintentan, con backoff
+        self._last_warm = start
+        self._failed = {name: (index, fn, 1, time.time() + self._backoff(1)) for index, name, fn, _ in failed}
+        self._runs += 1
+        self._last_run = {
+            'reason': reason,
+            'changed_tables': sorted(changed) if changed is not None else None,
+            'invalidated': self._invalidated,
+            'started_at': datetime.fromtimestamp(start).isoformat(),
+            'duration_s': round(time.time() - start, 2),
+            'tasks': tasks,
+            'errors': len(failed),
+            'error_messages': [f"{name}: {e}" for _, name, _, e in failed][:10],
+        }
+        print(f"🔥 Caché precalentada ({reason}): {tasks} respuestas en "
+              f"{self._last_run['duration_s']}s, {len(failed)} errores")
+        return self._last_run
+
+    def extend(self, reason, versions):
+        """Renueva el TTL de las entradas calculadas con las versiones actuales de sus tablas"""
+        start = time.time()
+        extended = self.cache.touch()
+        self._versions = versions
+        self._last_warm = start
+        self._runs += 1
+        self._last_run = {
+            'reason': reason,
+            'changed_tables': [],
+            'invalidated': 0,
+            'extended': len(extended),
+            'started_at': datetime.fromtimestamp(start).isoformat(),
+            'duration_s': round(time.time() - start, 2),
+            'tasks': 0,
+            'errors': 0,
+            'error_messages': [],
+        }
+        print(f"🔥 Caché renovada ({reason}): {len(extended)} respuestas sin cambios en sus tablas")
+        return self._last_run
+
+    def retry_failed(self):
+        """Reintenta las tareas fallidas cuyo backoff venció, en el orden de sus etapas"""
+        now = time.time()
+        due = {name: failed for name, failed in self._failed.items() if failed[3] <= now}
+        if not due:
+            return None
+        stages = [
+            (index, lambda index=index: [(name, f[1]) for name, f in due.items() if f[0] == index])
+            for index in sorted({f[0] for f in due.values()})
+        ]
+        result = self._run(stages)
+        if result is None:
+            return None
+        tasks, failed = result
+
+        for name in due:
+            self._failed.pop(name, None)
+        for index, name, fn, _ in failed:
+            attempts = due[name][2] + 1
+            self._failed[name] = (index, fn, attempts, time.time() + self._backoff(attempts))
+        self._last_retry = {
+            'started_at': datetime.fromtimestamp(now).isoformat(),
+            'duration_s': round(time.time() - now, 2),
+            'tasks': tasks,
+            'errors': len(failed),
+            'error_messages': [f"{name}: {e}" for _, name, _, e in failed][:10],
+        }
+        print(f"🔁 Reintento de precalentamiento: {tasks} tareas, {len(failed)} errores")
+        return self._last_retry
+
+    def status(self):
+        return {
+            'running': self._running,
+            'runs': self._runs,
+            'interval_s': self.interval,
+            'max_age_s': self.max_age,
+            'concurrency': self.concurrency,
+            'table_versions': self._versions,
+            'last_run': self._last_run or None,
+            'last_retry': self._last_retry,
+            'pending_retries': {
+                name: {'attempts': attempts, 'next_retry_at': datetime.fromtimestamp(at).isoformat()}
+                for name, (_, _, attempts, at) in list(self._failed.items())
+            },
+        }
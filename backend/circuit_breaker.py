@@ -0,0 +1,96 @@
+"""
+Circuit breaker del warehouse.
+
+Tras failure_threshold errores seguidos de cuota o de deadline el circuito se abre: las
+queries nuevas fallan al instante con CircuitOpenError (sin lanzar jobs) y los endpoints
+sirven su última respuesta buena marcada como stale. Mientras está abierto, un thread en
+background prueba el warehouse (half-open) cada open_seconds, duplicando la espera tras
+cada prueba fallida hasta max_open_seconds; la primera prueba exitosa lo cierra.
+"""
+import threading
+import time
+from datetime import datetime
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """El warehouse está limitado (circuito abierto): no se lanzan jobs nuevos."""
+
+
+class CircuitBreaker:
+    """probe() debe lanzar una query mínima y propagar el error si el warehouse sigue limitado."""
+
+    def __init__(self, probe, failure_threshold=5, open_seconds=30, max_open_seconds=300):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'short_circuited': 0, 'probes': 0, 'probe_failures': 0}
+
+    def is_open(self):
+        return self.state != CLOSED
+
+    def check(self):
+        """Lanza CircuitOpenError si no se deben lanzar jobs"""
+        if self.state != CLOSED:
+            with self._lock:
+                self._stats['short_circuited'] += 1
+            raise CircuitOpenError(
+                f"Warehouse limitado desde {datetime.fromtimestamp(self._opened_at).isoformat()} "
+                f"({self._last_error}); reintentando en background"
+            )
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self._last_error = str(error)[:200]
+            if self.state != CLOSED or self._failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self._opened_at = time.time()
+            self._stats['opened'] += 1
+        print(f"⚡ Circuito del warehouse abierto tras {self._failures} errores: {self._last_error}")
+        threading.Thread(target=self._probe_loop, name='circuit-probe', daemon=True).start()
+
+    def _probe_loop(self):
+        wait = self.open_seconds
+        while True:
+            time.sleep(wait)
+            self.state = HALF_OPEN
+            with self._lock:
+                self._stats['probes'] += 1
+            try:
+                self.probe()
+            except Exception as e:
+                with self._lock:
+                    self._stats['probe_failures'] += 1
+                    self._last_error = str(e)[:200]
+                self.state = OPEN
+                wait = min(wait * 2, self.max_open_seconds)
+                continue
+            with self._lock:
+                self.state = CLOSED
+                self._failures = 0
+            print(f"⚡ Circuito del warehouse cerrado tras {round(time.time() - self._opened_at)}s")
+            return
+
+    def status(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'failure_threshold': self.failure_threshold,
+                'opened_at': datetime.fromtimestamp(self._opened_at).isoformat() if self._opened_at else None,
+                'last_error': self._last_error,
+                **self._stats,
+            }
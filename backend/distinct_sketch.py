@@ -0,0 +1,104 @@
+"""
+Sketches diarios de sellers únicos para contar distintos en rangos de fechas arbitrarios.
+
+Los sellers únicos no se pueden sumar entre días o meses, así que cada pregunta nueva de
+rango era un COUNT(DISTINCT ...) sobre la tabla. DailySketches guarda, por día y tipo de
+evento (emision, emision_otro, pago y pendings), dos representaciones fusionables:
+
+  - exacta: los sellers del día como índices en un universo común (CSR de int32);
+    la unión de un rango marca un array booleano del tamaño del universo.
+  - aproximada: registros HyperLogLog (2^precision bytes por día y tipo); la unión de
+    un rango es el máximo elemento a elemento de los registros.
+
+Una vez construidos (queries.daily_sellers, un scan por refresco), cualquier rango se
+responde en O(días) en proceso, sin volver a BigQuery.
+"""
+import numpy as np
+
+
+def _hash64(ids):
+    """splitmix64 vectorizado: hash uniforme de 64 bits de cada id"""
+    z = ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def hll_registers(ids, precision):
+    """Registros HyperLogLog (uint8, 2^precision) de un array de ids enteros"""
+    registers = np.zeros(1 << precision, np.uint8)
+    if len(ids) == 0:
+        return registers
+    h = _hash64(np.asarray(ids, dtype=np.int64))
+    index = (h >> np.uint64(64 - precision)).astype(np.int64)
+    # Rango = posición del primer 1 en los 32 bits siguientes al índice (exacto en float64)
+    rest = ((h << np.uint64(precision)) >> np.uint64(32)).astype(np.float64)
+    rank = np.where(rest > 0, 32 - np.floor(np.log2(np.maximum(rest, 1))), 33).astype(np.uint8)
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_estimate(registers):
+    """Cardinalidad estimada de un conjunto de registros HyperLogLog"""
+    m = len(registers)
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # linear counting para cardinalidades chicas
+    return int(round(estimate))
+
+
+class DailySketches:
+    """Sellers únicos y cantidad de eventos por (tipo, día), fusionables por rango."""
+
+    def __init__(self, rows, precision=12):
+        """rows: (dia, tipo, eventos, sellers) de queries.daily_sellers()"""
+        self.precision = precision
+        by_tipo = {}
+        for row in rows:
+            ids = np.asarray(row.sellers or [], dtype=np.int64)
+            by_tipo.setdefault(row.tipo, []).append((row.dia.toordinal(), int(row.eventos), ids))
+
+        all_ids = [ids for days in by_tipo.values() for _, _, ids in days]
+        self.universe = np.unique(np.concatenate(all_ids)) if all_ids else np.zeros(0, np.int64)
+
+        # tipo -> (días ordinales, eventos, offsets CSR, índices en universe, registros HLL)
+        self._tipos = {}
+        for tipo, days in by_tipo.items():
+            days.sort(key=lambda d: d[0])
+            ordinals = np.array([d[0] for d in days], np.int64)
+            eventos = np.array([d[1] for d in days], np.int64)
+            sizes = np.array([len(d[2]) for d in days], np.int64)
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+            members = np.searchsorted(self.universe, np.concatenate([d[2] for d in days])).astype(np.int32)
+            registers = np.stack([hll_registers(d[2], precision) for d in days])
+            self._tipos[tipo] = (ordinals, eventos, offsets, members, registers)
+
+    def span(self):
+        """(primer día, último día) con datos, en ordinales"""
+        ordinals = [t[0] for t in self._tipos.values() if len(t[0])]
+        if not ordinals:
+            return None
+        return int(min(o[0] for o in ordinals)), int(max(o[-1] for o in ordinals))
+
+    def count(self, tipo, desde, hasta, exact=True):
+        """(eventos, sellers_unicos) del tipo entre desde y hasta (fechas, inclusive)"""
+        if tipo not in self._tipos:
+            return 0, 0
+        ordinals, eventos, offsets, members, registers = self._tipos[tipo]
+        lo = int(np.searchsorted(ordinals, desde.toordinal(), side='left'))
+        hi = int(np.searchsorted(ordinals, hasta.toordinal(), side='right'))
+        if lo >= hi:
+            return 0, 0
+        total_eventos = int(eventos[lo:hi].sum())
+        if exact:
+            seen = np.zeros(len(self.universe), bool)
+            seen[members[offsets[lo]:offsets[hi]]] = True
+            return total_eventos, int(np.count_nonzero(seen))
+        return total_eventos, hll_estimate(np.maximum.reduce(registers[lo:hi]))
+
+    def nbytes(self):
+        return int(self.universe.nbytes + sum(
+            sum(a.nbytes for a in arrays) for arrays in self._tipos.values()
+        ))
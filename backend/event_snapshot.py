@@ -0,0 +1,211 @@
+"""
+Snapshot local columnar de BT_MP_DAS_TAX_EVENTS.
+
+Copia de las columnas que usan las queries en archivos Arrow IPC sin comprimir, uno por
+mes de EVENT_DATE (events/YYYY-MM.arrow). Las fechas quedan como date32 (int32 de días) y
+EVENT_TYPE, SERPRO_STATUS, FROM_VALUE, YEAR y MONTH como categorías (dictionary), así
+el snapshot ocupa una fracción de la tabla y se lee con memory map sin copiar: varios
+workers de gunicorn que abren los mismos archivos comparten las páginas del SO.
+
+La sincronización es incremental por watermark de EVENT_DATE: solo se vuelven a bajar
+los meses desde el del watermark menos late_months (pagos con fecha retroactiva) y se
+reemplazan sus archivos; la historia más vieja no se vuelve a leer. La primera vez, o
+si cambia el warehouse de origen, se baja todo. Un lock de archivo serializa las
+sincronizaciones entre procesos.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from fact_cube import month_index, month_label
+
+SCHEMA = pa.schema([
+    ('CUS_CUST_ID', pa.int64()),
+    ('EVENT_DATE', pa.date32()),
+    ('EVENT_TYPE', pa.dictionary(pa.int8(), pa.string())),
+    ('SERPRO_STATUS', pa.dictionary(pa.int8(), pa.string())),
+    ('FROM_VALUE', pa.dictionary(pa.int8(), pa.string())),
+    ('YEAR', pa.dictionary(pa.int16(), pa.string())),
+    ('MONTH', pa.dictionary(pa.int8(), pa.string())),
+    ('TOTAL_AMOUNT', pa.float64()),
+])
+
+# Mientras se baja, cada mes se escribe con texto plano: el formato de archivo IPC exige un
+# único diccionario por columna, que se arma al publicar el mes completo
+_STAGING_SCHEMA = pa.schema([
+    pa.field(f.name, pa.string()) if pa.types.is_dictionary(f.type) else f for f in SCHEMA
+])
+
+
+def _normalize(batch):
+    """Castea un batch del warehouse al esquema de staging (date32, int64, float64, texto)"""
+    columns = [batch.column(batch.schema.get_field_index(f.name)).cast(f.type) for f in _STAGING_SCHEMA]
+    return pa.RecordBatch.from_arrays(columns, schema=_STAGING_SCHEMA)
+
+
+def _publish(staging_path, path):
+    """Convierte el staging de un mes al esquema final (categorías) y lo publica atómicamente"""
+    staged = ipc.open_file(pa.memory_map(staging_path, 'r')).read_all()
+    columns = []
+    for field in SCHEMA:
+        column = staged.column(field.name).combine_chunks()
+        if pa.types.is_dictionary(field.type):
+            column = column.dictionary_encode().cast(field.type)
+        columns.append(column)
+    tmp = path + '.tmp'
+    with ipc.new_file(tmp, SCHEMA) as writer:
+        writer.write_table(pa.Table.from_arrays(columns, schema=SCHEMA), max_chunksize=1 << 20)
+    os.replace(tmp, path)
+    os.remove(staging_path)
+
+
+class EventSnapshot:
+    """Snapshot de eventos en path, con sincronización incremental y lectura por mmap."""
+
+    def __init__(self, path, late_months=1, source=''):
+        self.path = path
+        self.late_months = late_months
+        self.source = source
+        self.events_dir = os.path.join(path, 'events')
+        os.makedirs(self.events_dir, exist_ok=True)
+        self._meta_path = os.path.join(path, 'meta.json')
+        self._lock = threading.Lock()
+        self._table = None
+        self._table_version = None
+        self._last_sync = None
+
+    def _meta(self):
+        try:
+            with open(self._meta_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_meta(self, meta):
+        tmp = self._meta_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, self._meta_path)
+
+    def _month_files(self):
+        return {
+            name[:-len('.arrow')]: os.path.join(self.events_dir, name)
+            for name in os.listdir(self.events_dir) if name.endswith('.arrow')
+        }
+
+    def ready(self):
+        """True si ya hubo al menos una sincronización completa para este origen"""
+        meta = self._meta()
+        return meta.get('source') == self.source and meta.get('watermark') is not None
+
+    def window_start(self, watermark):
+        """Primer día del mes más viejo que se vuelve a bajar en una sincronización incremental"""
+        idx = month_index(watermark) - self.late_months
+        return date(idx // 12, idx % 12 + 1, 1)
+
+    def sync(self, fetch, versions=None):
+        """
+        fetch(desde) devuelve un iterable de RecordBatch con las filas de
+        queries.event_snapshot(desde); desde=None pide la historia completa.
+        Con versions (table_versions del warehouse) no hace nada si ya se sincronizó esa versión.
+        """
+        with self._lock, open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            meta = self._meta()
+            full = not self.ready()
+            if not full and versions is not None and meta.get('versions') == versions:
+                return None
+
+            start = time.time()
+            watermark = None if full else date.fromisoformat(meta['watermark'])
+            desde = None if full else self.window_start(watermark)
+
+            # Un writer de staging por mes; los meses se publican juntos al final
+            writers, rows = {}, 0
+            try:
+                for batch in fetch(desde):
+                    if batch.num_rows == 0:
+                        continue
+                    batch = _normalize(batch)
+                    dates = batch.column(1)
+                    meses = pc.add(pc.multiply(pc.year(dates), 12), pc.subtract(pc.month(dates), 1))
+                    for mes in pc.unique(meses).to_pylist():
+                        if mes is None:
+                            continue
+                        part = batch.filter(pc.equal(meses, mes))
+                        if mes not in writers:
+                            staging = os.path.join(self.events_dir, f"{month_label(mes)}.staging")
+                            writers[mes] = ipc.new_file(staging, _STAGING_SCHEMA)
+                        writers[mes].write_batch(part)
+                        rows += part.num_rows
+                    batch_max = pc.max(dates).as_py()
+                    if batch_max is not None and (watermark is None or batch_max > watermark):
+                        watermark = batch_max
+            finally:
+                for writer in writers.values():
+                    writer.close()
+
+            fresh = {month_label(mes) for mes in writers}
+            for label in fresh:
+                _publish(os.path.join(self.events_dir, f"{label}.staging"),
+                         os.path.join(self.events_dir, f"{label}.arrow"))
+            # Meses de la ventana (o de toda la historia) que ya no tienen filas
+            for label, path in self._month_files().items():
+                if label not in fresh and (full or label >= desde.strftime('%Y-%m')):
+                    os.remove(path)
+
+            self._last_sync = {
+                'at': datetime.now().isoformat(),
+                'full': full,
+                'desde': desde.isoformat() if desde else None,
+                'months': len(fresh),
+                'rows': rows,
+                'duration_s': round(time.time() - start, 2),
+            }
+            self._write_meta({
+                'source': self.source,
+                'watermark': watermark.isoformat() if watermark else None,
+                'versions': versions,
+                'synced_at': self._last_sync['at'],
+            })
+            return self._last_sync
+
+    def table(self):
+        """
+        Tabla Arrow de todos los meses, mapeada en memoria (sin copiar). Se vuelve a abrir
+        solo cuando otra sincronización (de este u otro proceso) cambió el snapshot.
+        """
+        try:
+            version = os.stat(self._meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            if version != self._table_version:
+                batches = []
+                for _, path in sorted(self._month_files().items()):
+                    reader = ipc.open_file(pa.memory_map(path, 'r'))
+                    batches += [reader.get_batch(i) for i in range(reader.num_record_batches)]
+                self._table = pa.Table.from_batches(batches, schema=SCHEMA)
+                self._table_version = version
+            return self._table
+
+    def status(self):
+        meta = self._meta()
+        files = self._month_files()
+        return {
+            'path': self.path,
+            'late_months': self.late_months,
+            'ready': self.ready(),
+            'watermark': meta.get('watermark'),
+            'synced_at': meta.get('synced_at'),
+            'months': len(files),
+            'bytes': sum(os.path.getsize(p) for p in files.values()),
+            'last_sync': self._last_sync,
+        }
@@ -0,0 +1,182 @@
+"""
+Cubo de hechos de BT_MP_DAS_TAX_EVENTS para la pestaña General.
+
+Una sola query (queries.fact_cube, un solo scan de la tabla) devuelve dos granos vía GROUPING SETS:
+  - (tipo, mes, dia): conteos diarios de eventos, pagos correctos y montos.
+  - (tipo, mes, CUS_CUST_ID): actividad de cada seller en el mes y su primer día activo.
+
+El grano por seller se compacta en un SellerIndex (máscaras de bits de meses activos,
+ver seller_index.py). A partir del cubo se derivan en Python sellers, recurrence, las
+cohortes de nextsteps y MTD con la misma salida que las queries individuales que
+reemplaza. Las funciones *_rows devuelven filas con los mismos nombres de columna que
+devolvían esas queries.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from types import SimpleNamespace
+import calendar
+
+from seller_index import SellerIndex, ACTIVIDAD
+
+TIPOS = ('emision', 'emision_otro', 'pago')
+
+
+def round2(value):
+    """ROUND(x, 2) de BigQuery: redondeo half away from zero"""
+    if value is None:
+        return None
+    return float(Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+
+
+def _pct_change(cur, prev):
+    if prev is None or prev == 0 or cur is None:
+        return None
+    return round2((cur - prev) * 100.0 / prev)
+
+
+def _ratio(num, den, factor=1.0):
+    return round2(num * factor / den) if den else None
+
+
+def month_index(d):
+    """Índice correlativo de mes (año * 12 + mes - 1) para aritmética de meses"""
+    return d.year * 12 + d.month - 1
+
+
+def month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+class FactCube:
+    """Resultado de queries.fact_cube() indexado para derivar los endpoints de la pestaña General."""
+
+    def __init__(self, rows):
+        # (tipo, mes_idx) -> {dia: [eventos, pagos_correctos, monto_total, montos_informados]}
+        self.daily = {}
+        # (tipo, mes_idx) -> {dia: sellers cuyo primer día activo del mes fue ese día}
+        self.first_days = {}
+        # tipo -> ([CUS_CUST_ID], [mes_idx]), un par por seller-mes; se compacta en seller_index
+        pairs = {}
+        for row in rows:
+            mes_idx = month_index(row.mes)
+            if row.es_fila_diaria:
+                self.daily.setdefault((row.tipo, mes_idx), {})[row.dia] = [
+                    row.eventos, row.pagos_correctos, row.monto_total, row.montos_informados
+                ]
+            elif row.CUS_CUST_ID is not None:
+                first_days = self.first_days.setdefault((row.tipo, mes_idx), {})
+                first_days[row.primer_dia] = first_days.get(row.primer_dia, 0) + 1
+                sellers, meses = pairs.setdefault(row.tipo, ([], []))
+                sellers.append(row.CUS_CUST_ID)
+                meses.append(mes_idx)
+        self.seller_index = SellerIndex(pairs)
+
+    def months(self, tipos=TIPOS):
+        return sorted({m for (t, m) in self.daily if t in tipos})
+
+
+def monthly_rows(totals):
+    """
+    Filas de /api/metrics/monthly a partir de los totales por mes (monthly_store.py),
+    ordenados por mes: ratios y MoM se calculan acá.
+    """
+    rows = []
+    prev = None
+    for t in totals:
+        volumen = round2(t.monto or 0)
+
+        row = SimpleNamespace(
+            anio=t.mes_idx // 12,
+            mes=t.mes_idx % 12 + 1,
+            periodo=month_label(t.mes_idx),
+            cantidad_emisiones=t.emisiones,
+            sellers_que_emitieron=t.sellers_emitieron,
+            cantidad_pagos=t.pagos,
+            sellers_que_pagaron=t.sellers_pagaron,
+            cantidad_pagos_correctos=t.pagos_correctos,
+            sellers_pagos_correctos=t.sellers_pagos_correctos,
+            tasa_conversion_eventos_pct=_ratio(t.pagos, t.emisiones, 100.0),
+            tasa_conversion_sellers_pct=_ratio(t.sellers_pagaron, t.sellers_emitieron, 100.0),
+            volumen_pagos=volumen,
+            ticket_promedio_pago=_ratio(t.monto or 0, t.montos_informados),
+            emisiones_promedio_por_seller=_ratio(t.emisiones, t.sellers_emitieron),
+            pagos_promedio_por_seller=_ratio(t.pagos, t.sellers_pagaron),
+        )
+        # MoM equivalente a LAG() OVER (ORDER BY periodo): fila anterior, no mes calendario
+        row.mom_emisiones_pct = _pct_change(t.emisiones, prev.cantidad_emisiones if prev else None)
+        row.mom_pagos_pct = _pct_change(t.pagos, prev.cantidad_pagos if prev else None)
+        row.mom_sellers_emiten_pct = _pct_change(t.sellers_emitieron, prev.sellers_que_emitieron if prev else None)
+        row.mom_sellers_pagan_pct = _pct_change(t.sellers_pagaron, prev.sellers_que_pagaron if prev else None)
+        row.mom_volumen_pct = _pct_change(volumen, prev.volumen_pagos if prev else None)
+        rows.append(row)
+        prev = row
+    return rows
+
+
+def sellers_rows(cube, tipo):
+    """(periodo, total, nuevos, recurrentes) por mes para /api/metrics/sellers"""
+    return [
+        SimpleNamespace(periodo=month_label(mes_idx), total=total, nuevos=nuevos, recurrentes=total - nuevos)
+        for mes_idx, total, nuevos in cube.seller_index.new_vs_recurrent(tipo)
+    ]
+
+
+def recurrence_rows(cube, tipo):
+    """Filas equivalentes a las queries de /api/metrics/sellers/recurrence"""
+    return [
+        SimpleNamespace(
+            periodo=month_label(mes_idx),
+            sellers_total=total,
+            sellers_totalmente_nuevos=nuevos,
+            sellers_recurrentes=recurrentes,
+            sellers_sin_recurrencia=sin_recurrencia,
+        )
+        for mes_idx, total, nuevos, recurrentes, sin_recurrencia in cube.seller_index.recurrence(tipo)
+    ]
+
+
+def cohort_rows(cube, n_cohorts=6, depth=3):
+    """
+    Cohortes por primer mes con cualquier actividad, de la más reciente a la más vieja:
+    (cohort_mes, sellers_cohort, mes_0..mes_depth). n_cohorts=0 devuelve todas.
+    """
+    cohorts = cube.seller_index.cohorts(ACTIVIDAD, depth)[::-1]
+    if n_cohorts:
+        cohorts = cohorts[:n_cohorts]
+    return [
+        SimpleNamespace(
+            cohort_mes=month_label(mes_idx),
+            sellers_cohort=size,
+            **{f'mes_{k}': n for k, n in enumerate(retained)},
+        )
+        for mes_idx, size, retained in cohorts
+    ]
+
+
+def mtd_rows(cube, n_months, today):
+    """Acumulados diarios (MTD) de los últimos n_months meses calendario, hasta today inclusive"""
+    rows = []
+    current = month_index(today)
+    for mes_idx in range(current - n_months + 1, current + 1):
+        anio, mes = mes_idx // 12, mes_idx % 12 + 1
+        last_day = today.day if mes_idx == current else calendar.monthrange(anio, mes)[1]
+
+        nuevos_emision = cube.first_days.get(('emision', mes_idx), {})
+        nuevos_pago = cube.first_days.get(('pago', mes_idx), {})
+        emisiones_dia = cube.daily.get(('emision', mes_idx), {})
+        pagos_dia = cube.daily.get(('pago', mes_idx), {})
+
+        emisiones_acum = pagos_acum = sellers_emisiones_acum = sellers_pagos_acum = 0
+        for dia in range(1, last_day + 1):
+            emisiones_acum += emisiones_dia[dia][0] if dia in emisiones_dia else 0
+            pagos_acum += pagos_dia[dia][0] if dia in pagos_dia else 0
+            sellers_emisiones_acum += nuevos_emision.get(dia, 0)
+            sellers_pagos_acum += nuevos_pago.get(dia, 0)
+            rows.append(SimpleNamespace(
+                mes=month_label(mes_idx),
+                dia=dia,
+                emisiones_acum=emisiones_acum,
+                pagos_acum=pagos_acum,
+                sellers_emisiones_acum=sellers_emisiones_acum,
+                sellers_pagos_acum=sellers_pagos_acum,
+            ))
+    return rows
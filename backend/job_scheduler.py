@@ -0,0 +1,224 @@
+"""
+Planificador de jobs del warehouse por proceso.
+
+Todos los jobs pasan por JobScheduler.submit, que devuelve un ScheduledJob con la misma
+interfaz que bigquery.QueryJob (.result(timeout), .cancel() y los atributos de métricas).
+Al esperar el resultado el job:
+
+  1. espera un lugar entre los max_concurrent jobs en curso, en orden de prioridad
+     (INTERACTIVE antes que BACKGROUND y BATCH) y de llegada;
+  2. toma un token del bucket (rate jobs/s con ráfagas de hasta burst) antes de lanzarse;
+  3. si BigQuery responde con un error de cuota o rate limit, reintenta con backoff
+     exponencial con jitter, hasta max_retries veces.
+
+Bajo carga los requests hacen cola (acotada por su deadline) en lugar de fallar con 403.
+La prioridad se toma del contexto de quien lanza el job (ver priority).
+"""
+import contextvars
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+INTERACTIVE, BACKGROUND, BATCH = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background', BATCH: 'batch'}
+
+# Sin contexto explícito (revalidación de caché, precalentamiento) los jobs son de fondo
+_current_priority = contextvars.ContextVar('job_priority', default=BACKGROUND)
+
+_QUOTA_REASONS = ('quotaExceeded', 'rateLimitExceeded', 'jobRateLimitExceeded')
+
+
+@contextmanager
+def priority(level):
+    """Prioridad de los jobs lanzados dentro del bloque"""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def is_quota_error(error):
+    """403/429 de BigQuery por cuota o rate limit (reintentables)"""
+    code = getattr(error, 'code', None)
+    reasons = [e.get('reason') for e in getattr(error, 'errors', None) or [] if isinstance(e, dict)]
+    if code in (403, 429) and any(r in _QUOTA_REASONS for r in reasons):
+        return True
+    message = str(error)
+    return ('403' in message or '429' in message) and ('Quota' in message or 'rate limit' in message.lower())
+
+
+class JobCancelled(Exception):
+    """El job se canceló antes de terminar (mientras esperaba turno o en el warehouse)."""
+
+
+class ScheduledJob:
+    """Job encolado en el planificador; delega los atributos de métricas en el job real."""
+
+    def __init__(self, scheduler, submit_fn, level):
+        self._scheduler = scheduler
+        self._submit_fn = submit_fn
+        self.priority = level
+        self.retries = 0
+        self.scheduler_wait_ms = None
+        self._job = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # job_id, created, started, total_bytes_processed, ... del último intento
+        job = self.__dict__.get('_job')
+        if job is None:
+            raise AttributeError(name)
+        return getattr(job, name)
+
+    def result(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        scheduler = self._scheduler
+        queued_at = time.monotonic()
+        scheduler._acquire(self, deadline)
+        try:
+            scheduler._take_token(self, deadline)
+            self.scheduler_wait_ms = round((time.monotonic() - queued_at) * 1000, 1)
+            attempt = 0
+            while True:
+                with self._lock:
+                    if self._cancelled.is_set():
+                        raise JobCancelled("Job cancelado antes de lanzarse")
+                    self._job = self._submit_fn()
+                try:
+                    remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                    return self._job.result(timeout=remaining)
+                except Exception as e:
+                    if not is_quota_error(e) or attempt >= scheduler.max_retries or self._cancelled.is_set():
+                        raise
+                    scheduler._count('quota_errors')
+                    # Backoff exponencial con jitter completo, sin pasarse del deadline
+                    backoff = random.uniform(0, min(scheduler.max_backoff, scheduler.base_backoff * 2 ** attempt))
+                    if deadline is not None and time.monotonic() + backoff >= deadline:
+                        raise
+                    if self._cancelled.wait(backoff):
+                        raise JobCancelled("Job cancelado durante el backoff") from e
+                    attempt += 1
+                    self.retries = attempt
+                    scheduler._count('retries')
+                    scheduler._take_token(self, deadline)
+        finally:
+            scheduler._release()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled.set()
+            job = self._job
+        self._scheduler._wake()
+        if job is not None:
+            return job.cancel()
+        return True
+
+
+class JobScheduler:
+    """Límite de jobs concurrentes, token bucket de lanzamientos y reintentos por cuota."""
+
+    def __init__(self, max_concurrent=12, rate=10.0, burst=20, max_retries=4,
+                 base_backoff=1.0, max_backoff=30.0):
+        self.max_concurrent = max_concurrent
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._waiting = []  # heap de (prioridad, orden de llegada, job)
+        self._order = itertools.count()
+        self._running = 0
+        self._tokens = float(burst)
+        self._tokens_at = time.monotonic()
+        self._token_lock = threading.Lock()
+        self._stats = {'submitted': 0, 'retries': 0, 'quota_errors': 0, 'throttled': 0, 'timeouts': 0}
+
+    def submit(self, submit_fn):
+        """ScheduledJob que lanzará submit_fn() (-> job del warehouse) cuando le toque"""
+        self._count('submitted')
+        return ScheduledJob(self, submit_fn, _current_priority.get())
+
+    @contextmanager
+    def slot(self, level=BATCH):
+        """Ocupa un lugar (y un token) durante el bloque, para trabajo que no es un job de submit"""
+        job = ScheduledJob(self, None, level)
+        self._acquire(job, None)
+        try:
+            self._take_token(job, None)
+            yield
+        finally:
+            self._release()
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _acquire(self, job, deadline):
+        """Espera un lugar libre; sale antes de turno solo por cancelación o deadline"""
+        with self._cond:
+            entry = (job.priority, next(self._order), job)
+            heapq.heappush(self._waiting, entry)
+            try:
+                while not (self._waiting[0] is entry and self._running < self.max_concurrent):
+                    if job._cancelled.is_set():
+                        raise JobCancelled("Job cancelado mientras esperaba turno")
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise TimeoutError("Job sin turno dentro del deadline")
+                    self._cond.wait(remaining)
+                heapq.heappop(self._waiting)
+                self._running += 1
+            except BaseException:
+                if entry in self._waiting:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                raise
+            finally:
+                self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    def _take_token(self, job, deadline):
+        while True:
+            with self._token_lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._tokens_at) * self.rate)
+                self._tokens_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_s = (1 - self._tokens) / self.rate
+            self._count('throttled')
+            if deadline is not None and time.monotonic() + wait_s >= deadline:
+                self._count('timeouts')
+                raise TimeoutError("Job sin token de lanzamiento dentro del deadline")
+            if job._cancelled.wait(wait_s):
+                raise JobCancelled("Job cancelado mientras esperaba token")
+
+    def status(self):
+        with self._cond:
+            queued = {}
+            for level, _, _ in self._waiting:
+                queued[PRIORITY_NAMES[level]] = queued.get(PRIORITY_NAMES[level], 0) + 1
+            return {
+                'max_concurrent': self.max_concurrent,
+                'rate_per_s': self.rate,
+                'burst': self.burst,
+                'running': self._running,
+                'queued': queued,
+                **self._stats,
+            }
@@ -0,0 +1,110 @@
+"""
+Agregados mensuales persistidos para /api/metrics/monthly.
+
+Los totales de cada mes (queries.monthly_aggregates) se guardan en SQLite. Un refresco
+solo consulta desde el mes del refresco anterior (o el mes en curso, si es más viejo)
+menos late_months (pagos con EVENT_DATE retroactivo que llegan después del cierre); los
+meses más viejos quedan congelados. Si pasó más de un mes entre refrescos, la ventana
+cubre también los meses intermedios.
+Así los bytes escaneados por refresco son constantes en lugar de crecer con la historia.
+La primera vez (o si cambia el warehouse de origen) se carga la historia completa.
+"""
+import sqlite3
+import threading
+from datetime import date, datetime
+from types import SimpleNamespace
+
+from fact_cube import month_index
+
+COLUMNS = (
+    'eventos', 'emisiones', 'sellers_emitieron', 'pagos', 'sellers_pagaron',
+    'pagos_correctos', 'sellers_pagos_correctos', 'monto', 'montos_informados',
+)
+
+
+class MonthlyStore:
+    """Totales por mes (índice año * 12 + mes - 1) en SQLite, con refresco incremental."""
+
+    def __init__(self, path, late_months=1, source=''):
+        self.path = path
+        self.late_months = late_months
+        self.source = source
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS monthly_aggregates (
+              mes_idx INTEGER PRIMARY KEY,
+              {', '.join(f'{c} {"REAL" if c == "monto" else "INTEGER"}' for c in COLUMNS)},
+              refreshed_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        self._last_refresh = None
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def window_start(self, today, last_refresh=None):
+        """Primer día del mes más viejo que todavía se recalcula (last_refresh: fecha del refresco anterior)"""
+        idx = min(month_index(today), month_index(last_refresh or today)) - self.late_months
+        return date(idx // 12, idx % 12 + 1, 1)
+
+    def refresh(self, fetch, today):
+        """
+        fetch(desde) devuelve las filas de queries.monthly_aggregates(desde); desde=None
+        pide la historia completa. Reemplaza los meses >= desde con lo que devuelva.
+        """
+        with self._lock:
+            loaded_at = self._meta('loaded_at')
+            full = self._meta('source') != self.source or loaded_at is None
+            desde = None if full else self.window_start(today, datetime.fromisoformat(loaded_at).date())
+            rows = fetch(desde)
+            now = datetime.now().isoformat()
+            with self._conn:
+                if full:
+                    self._conn.execute("DELETE FROM monthly_aggregates")
+                else:
+                    self._conn.execute("DELETE FROM monthly_aggregates WHERE mes_idx >= ?",
+                                       (month_index(desde),))
+                self._conn.executemany(
+                    f"INSERT OR REPLACE INTO monthly_aggregates (mes_idx, {', '.join(COLUMNS)}, refreshed_at) "
+                    f"VALUES ({', '.join('?' * (len(COLUMNS) + 2))})",
+                    [(month_index(r.mes), *(_sqlite_value(getattr(r, c)) for c in COLUMNS), now) for r in rows]
+                )
+                self._set_meta('source', self.source)
+                self._set_meta('loaded_at', now)
+            self._last_refresh = {
+                'at': now,
+                'full': full,
+                'desde': desde.isoformat() if desde else None,
+                'months': len(rows),
+            }
+            return self._last_refresh
+
+    def totals(self):
+        """Totales de todos los meses guardados, ordenados por mes"""
+        with self._lock:
+            cursor = self._conn.execute(
+                f"SELECT mes_idx, {', '.join(COLUMNS)} FROM monthly_aggregates ORDER BY mes_idx"
+            )
+            return [SimpleNamespace(mes_idx=row[0], **dict(zip(COLUMNS, row[1:]))) for row in cursor]
+
+    def status(self):
+        with self._lock:
+            months = self._conn.execute("SELECT COUNT(*) FROM monthly_aggregates").fetchone()[0]
+            return {
+                'path': self.path,
+                'late_months': self.late_months,
+                'months': months,
+                'loaded_at': self._meta('loaded_at'),
+                'last_refresh': self._last_refresh,
+            }
+
+
+def _sqlite_value(value):
+    # SUM de NUMERIC llega como Decimal; SQLite guarda float
+    return float(value) if value is not None and not isinstance(value, (int, float)) else value
@@ -0,0 +1,147 @@
+"""
+Cubo de pendings para la pestaña de notificaciones.
+
+Una sola query (queries.pendings_cube, un job por refresco) trae las celdas de DIM_PENDINGS
+(período de creación, período de publicación, event, reason) y de los pagos reales de
+BT_MP_DAS_TAX_EVENTS (período del evento, período fiscal, from_value), cada una con sus
+sellers distintos. A partir del cubo se derivan en Python summary, monthly (filter=event y
+filter=fiscal) y comparison con la misma salida que las queries individuales que
+reemplaza: los conteos se suman y los sellers distintos se obtienen uniendo los conjuntos.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+from types import SimpleNamespace
+
+from fact_cube import round2
+
+PAGADA = ('success', 'success_web')
+
+Notificacion = namedtuple(
+    'Notificacion', 'periodo_creacion periodo_publicacion event reason eventos dias_total dias_informados sellers'
+)
+Pago = namedtuple('Pago', 'periodo_evento periodo_fiscal es_from_value eventos sellers')
+
+
+def round1(value):
+    """ROUND(x, 1) de BigQuery: redondeo half away from zero"""
+    if value is None:
+        return None
+    return float(Decimal(str(value)).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP))
+
+
+def _ratio_pct(num, den):
+    """ROUND(num * 100.0 / NULLIF(den, 0), 2)"""
+    return round2(num * 100.0 / den) if den else None
+
+
+def _totals(cells, periodo=None):
+    """(eventos, sellers distintos) de cells, agrupados por periodo(celda) si se indica"""
+    grouped = {}
+    for cell in cells:
+        total = grouped.setdefault(periodo(cell) if periodo else None, [0, set()])
+        total[0] += cell.eventos
+        total[1].update(cell.sellers)
+    return {k: (eventos, len(sellers)) for k, (eventos, sellers) in grouped.items()}
+
+
+class PendingsCube:
+    """Resultado de queries.pendings_cube() separado en notificaciones y pagos."""
+
+    def __init__(self, rows):
+        self.notificaciones = []
+        self.pagos = []
+        for row in rows:
+            if row.fuente == 'pendings':
+                self.notificaciones.append(Notificacion(
+                    row.periodo_creacion, row.periodo_publicacion, row.event, row.reason,
+                    row.eventos, row.dias_total or 0, row.dias_informados or 0, frozenset(row.sellers or ()),
+                ))
+            else:
+                self.pagos.append(Pago(
+                    row.periodo_evento, row.periodo_fiscal, row.es_from_value, row.eventos,
+                    frozenset(row.sellers or ()),
+                ))
+
+    def notificaciones_where(self, event, reasons=None):
+        return [n for n in self.notificaciones if n.event == event and (reasons is None or n.reason in reasons)]
+
+    def pagos_from_value(self):
+        return [p for p in self.pagos if p.es_from_value]
+
+
+def summary_row(cube):
+    """Fila equivalente a la query de /api/pendings/summary"""
+    enviadas = sum(n.eventos for n in cube.notificaciones_where('created', ('success',)))
+    pagadas = cube.notificaciones_where('deleted', PAGADA)
+    total_pagadas = sum(n.eventos for n in pagadas)
+    descartadas = sum(n.eventos for n in cube.notificaciones_where('deleted', ('dismiss',)))
+    _, sellers_unicos = _totals(cube.notificaciones).get(None, (0, 0))
+    dias_informados = sum(n.dias_informados for n in pagadas)
+    dias_promedio = sum(n.dias_total for n in pagadas) / dias_informados if dias_informados else None
+
+    total_pagos, sellers_pagos = _totals(cube.pagos).get(None, (0, 0))
+    total_from_value, sellers_from_value = _totals(cube.pagos_from_value()).get(None, (0, 0))
+
+    return SimpleNamespace(
+        total_enviadas=enviadas,
+        total_pagadas_desde_notif=total_pagadas,
+        total_descartadas=descartadas,
+        total_pagos_reales=total_pagos,
+        total_pagos_from_value=total_from_value,
+        sellers_pagos_from_value=sellers_from_value,
+        sellers_unicos=sellers_unicos,
+        sellers_pagos_reales=sellers_pagos,
+        tasa_conversion_notif=_ratio_pct(total_pagadas, enviadas),
+        tasa_conversion_pagos=_ratio_pct(total_pagadas, total_pagos),
+        tasa_from_value=_ratio_pct(total_from_value, total_pagos),
+        tiempo_promedio_dias=round1(dias_promedio),
+    )
+
+
+def monthly_rows(cube, filter_type):
+    """
+    Filas de /api/pendings/monthly: notificaciones por período de created_at y pagos por
+    período fiscal (filter_type 'fiscal') o de EVENT_DATE (cualquier otro valor).
+    """
+    periodo_pago = (lambda p: p.periodo_fiscal) if filter_type == 'fiscal' else (lambda p: p.periodo_evento)
+    enviadas = _totals(cube.notificaciones_where('created'), lambda n: n.periodo_creacion)
+    pagos = _totals(cube.pagos, periodo_pago)
+    from_value = _totals(cube.pagos_from_value(), periodo_pago)
+
+    rows = []
+    for periodo in sorted((set(enviadas) | set(pagos)) - {None}):
+        total_enviadas, sellers_enviadas = enviadas.get(periodo, (0, 0))
+        total_pagos, sellers_pagos = pagos.get(periodo, (0, 0))
+        total_from_value, sellers_from_value = from_value.get(periodo, (0, 0))
+        rows.append(SimpleNamespace(
+            periodo=periodo,
+            notificaciones_enviadas=total_enviadas,
+            sellers_enviadas=sellers_enviadas,
+            pagos_reales=total_pagos,
+            sellers_pagos_reales=sellers_pagos,
+            pagos_from_value=total_from_value,
+            sellers_from_value=sellers_from_value,
+            tasa_conversion_total=_ratio_pct(total_pagos, total_enviadas),
+            tasa_from_value=_ratio_pct(total_from_value, total_pagos),
+        ))
+    return rows
+
+
+def comparison_rows(cube):
+    """Filas de /api/pendings/comparison: pagadas desde notificación (por published) vs pagos por EVENT_DATE"""
+    notif = _totals(cube.notificaciones_where('deleted', PAGADA), lambda n: n.periodo_publicacion)
+    pagos = _totals(cube.pagos, lambda p: p.periodo_evento)
+
+    rows = []
+    for periodo in sorted((set(notif) | set(pagos)) - {None}):
+        total_notif, sellers_notif = notif.get(periodo, (0, 0))
+        total_pagos, sellers_pagos = pagos.get(periodo, (0, 0))
+        rows.append(SimpleNamespace(
+            periodo=periodo,
+            pagos_desde_notif=total_notif,
+            sellers_notif=sellers_notif,
+            pagos_reales_tax=total_pagos,
+            sellers_tax=sellers_pagos,
+            pct_notif_vs_real=_ratio_pct(total_notif, total_pagos),
+        ))
+    return rows
@@ -0,0 +1,98 @@
+"""
+Sketches diarios de cuantiles para percentiles de latencia en rangos de fechas arbitrarios.
+
+Los percentiles no se pueden promediar entre días o meses, así que cada rango nuevo
+requeriría ordenar otra vez las latencias crudas. DailyQuantiles guarda, por día y tipo,
+un histograma de buckets logarítmicos (DDSketch): el bucket i cubre (gamma^(i-1), gamma^i]
+con gamma = (1 + alpha) / (1 - alpha), así cualquier cuantil se estima con error relativo
+<= alpha. Los histogramas se fusionan sumando conteos, exacto e independiente del orden.
+
+El bucketing lo hace el warehouse (queries.pendings_latency devuelve conteos por día, tipo
+y bucket); acá se guardan las sumas acumuladas por día, así cualquier rango se responde en
+O(buckets) en proceso, sin volver a BigQuery.
+"""
+import math
+
+import numpy as np
+
+
+class LogBuckets:
+    """
+    Buckets logarítmicos de [min_value, max_value] con error relativo alpha. La columna 0
+    es el bucket de ceros (valores <= min_value); los mayores a max_value van al último.
+    """
+
+    def __init__(self, alpha=0.01, min_value=1 / 1440, max_value=730):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.min_value = min_value
+        self.first = self.index(min_value)
+        self.size = self.index(max_value) - self.first + 2
+
+    def index(self, value):
+        """Índice del bucket de value (> 0); mismo cálculo que el SQL: CEIL(LN(x) / LN(gamma))"""
+        return math.ceil(math.log(value) / math.log(self.gamma))
+
+    def column(self, index):
+        """Columna del histograma del bucket index (None = bucket de ceros)"""
+        if index is None:
+            return 0
+        return min(max(index - self.first + 1, 1), self.size - 1)
+
+    def value(self, column):
+        """Valor representativo de la columna: punto medio relativo del bucket"""
+        if column == 0:
+            return 0.0
+        return 2 * self.gamma ** (column - 1 + self.first) / (self.gamma + 1)
+
+
+class DailyQuantiles:
+    """Histogramas de buckets logarítmicos por (tipo, día), fusionables por rango."""
+
+    def __init__(self, rows, buckets):
+        """rows: (dia, tipo, bucket, muestras) de queries.pendings_latency()"""
+        self.buckets = buckets
+        by_tipo = {}
+        for row in rows:
+            by_tipo.setdefault(row.tipo, []).append((row.dia.toordinal(), buckets.column(row.bucket), int(row.muestras)))
+
+        # tipo -> (días ordinales, sumas acumuladas por día: fila k = días [0, k))
+        self._tipos = {}
+        for tipo, cells in by_tipo.items():
+            ordinals = np.unique(np.array([c[0] for c in cells], np.int64))
+            counts = np.zeros((len(ordinals) + 1, buckets.size), np.int64)
+            np.add.at(
+                counts,
+                (np.searchsorted(ordinals, [c[0] for c in cells]) + 1, [c[1] for c in cells]),
+                [c[2] for c in cells],
+            )
+            self._tipos[tipo] = (ordinals, np.cumsum(counts, axis=0))
+
+    def span(self):
+        """(primer día, último día) con datos, en ordinales"""
+        ordinals = [t[0] for t in self._tipos.values() if len(t[0])]
+        if not ordinals:
+            return None
+        return int(min(o[0] for o in ordinals)), int(max(o[-1] for o in ordinals))
+
+    def histogram(self, tipo, desde, hasta):
+        """Histograma fusionado del tipo entre desde y hasta (fechas, inclusive)"""
+        if tipo not in self._tipos:
+            return np.zeros(self.buckets.size, np.int64)
+        ordinals, cumulative = self._tipos[tipo]
+        lo = int(np.searchsorted(ordinals, desde.toordinal(), side='left'))
+        hi = int(np.searchsorted(ordinals, hasta.toordinal(), side='right'))
+        return cumulative[max(hi, lo)] - cumulative[lo]
+
+    def quantiles(self, tipo, desde, hasta, qs):
+        """(muestras, [valor de cada cuantil de qs, en 0..1]) del tipo en el rango; None sin muestras"""
+        histogram = self.histogram(tipo, desde, hasta)
+        total = int(histogram.sum())
+        if not total:
+            return 0, [None] * len(qs)
+        # Cuantil q = muestra de rango q * (total - 1): primera columna cuyo acumulado lo supera
+        columns = np.searchsorted(np.cumsum(histogram), [q * (total - 1) for q in qs], side='right')
+        return total, [self.buckets.value(int(c)) for c in columns]
+
+    def nbytes(self):
+        return int(sum(o.nbytes + c.nbytes for o, c in self._tipos.values()))
@@ -0,0 +1,495 @@
+"""
+Constructores de las queries SQL del dashboard.
+
+Cada función devuelve un Query (texto + parámetros) en dialecto BigQuery. Los valores que
+vienen del request nunca se interpolan en el SQL: viajan como parámetros con nombre
+(ScalarQueryParameter en BigQuery, ver warehouse.py). Los filtros por mes se
+expresan como rangos sobre EVENT_DATE (columna de partición) para que BigQuery pueda
+podar particiones en lugar de escanear la tabla entera.
+"""
+from datetime import date, timedelta
+import calendar
+import re
+
+EVENTS_TABLE = '`WHOWNER.BT_MP_DAS_TAX_EVENTS`'
+PENDINGS_TABLE = '`meli-bi-data.SBOX_SBOXMERCH.DIM_PENDINGS`'
+PENDINGS_CONTENT_ID = 'mp.sellers.generic_pendings.das_payment_pendings'
+
+# Los pendings de pago DAS existen desde el período fiscal 2025-12
+PENDINGS_PERIODO_FISCAL_DESDE = 202512
+PENDINGS_PAGOS_DESDE = date(2025, 12, 1)
+
+# Período fiscal (YEAR/MONTH son STRING en la tabla) como 'YYYY-MM'
+FISCAL_PERIOD_EXPR = "CONCAT(YEAR, '-', LPAD(CAST(MONTH AS STRING), 2, '0'))"
+
+_PERIODO_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+
+class Query:
+    """Texto SQL + parámetros con nombre (name, tipo BigQuery, valor)."""
+
+    __slots__ = ('sql', 'params')
+
+    def __init__(self, sql, params=()):
+        self.sql = sql
+        # Solo se declaran los parámetros que la query usa efectivamente
+        self.params = tuple(p for p in params if re.search(rf'@{p[0]}\b', sql))
+
+    @property
+    def key(self):
+        """Clave para coalescer ejecuciones idénticas (mismo SQL y mismos valores)"""
+        return (self.sql, self.params)
+
+
+def parse_periodo(periodo):
+    """Valida 'YYYY-MM' y devuelve (primer_dia, ultimo_dia) del mes. ValueError si es inválido."""
+    if not isinstance(periodo, str) or not _PERIODO_RE.match(periodo):
+        raise ValueError(f"Período inválido: {periodo!r} (formato esperado YYYY-MM)")
+    anio, mes = int(periodo[:4]), int(periodo[5:])
+    return date(anio, mes, 1), date(anio, mes, calendar.monthrange(anio, mes)[1])
+
+
+def parse_date_range(desde, hasta):
+    """Valida 'YYYY-MM-DD' (ambos inclusive) y devuelve (desde, hasta) como date. ValueError si es inválido."""
+    try:
+        inicio, fin = date.fromisoformat(desde), date.fromisoformat(hasta)
+    except (TypeError, ValueError):
+        raise ValueError(f"Rango inválido: {desde!r}..{hasta!r} (formato esperado YYYY-MM-DD)") from None
+    if inicio > fin:
+        raise ValueError(f"Rango inválido: from {desde} es posterior a to {hasta}")
+    return inicio, fin
+
+
+def previous_periodo(periodo):
+    inicio, _ = parse_periodo(periodo)
+    return (inicio - timedelta(days=1)).strftime('%Y-%m')
+
+
+def warehouse_probe():
+    """Query mínima (no lee tablas) para probar si el warehouse volvió a aceptar jobs"""
+    return Query("SELECT 1 AS ok")
+
+
+def fact_cube():
+    """
+    Cubo de hechos de la pestaña General (ver fact_cube.py). CUS_CUST_ID es STRING: se
+    castea a INT64 como en daily_sellers; los ids no numéricos quedan NULL y no entran al
+    grano por seller (sí a los conteos diarios).
+    """
+    return Query(f"""
+    WITH base AS (
+      SELECT
+        SAFE_CAST(CUS_CUST_ID AS INT64) AS CUS_CUST_ID,
+        DATE_TRUNC(EVENT_DATE, MONTH) AS mes,
+        EXTRACT(DAY FROM EVENT_DATE) AS dia,
+        EXTRACT(DAY FROM EVENT_DATE) AS dia_evento,
+        CASE
+          WHEN EVENT_TYPE = 'Payment' THEN 'pago'
+          WHEN SERPRO_STATUS = 'success' THEN 'emision'
+          ELSE 'emision_otro'
+        END AS tipo,
+        -- Pago correcto: período fiscal (YEAR/MONTH) = mes inmediatamente anterior a EVENT_DATE
+        EVENT_TYPE = 'Payment'
+          AND {FISCAL_PERIOD_EXPR} = FORMAT_DATE('%Y-%m', DATE_SUB(DATE_TRUNC(EVENT_DATE, MONTH), INTERVAL 1 MONTH))
+          AS es_pago_correcto,
+        TOTAL_AMOUNT
+      FROM {EVENTS_TABLE}
+      WHERE EVENT_DATE IS NOT NULL
+        AND EVENT_DATE <= CURRENT_DATE()
+        AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
+    )
+    SELECT
+      GROUPING(CUS_CUST_ID) AS es_fila_diaria,
+      tipo,
+      mes,
+      dia,
+      CUS_CUST_ID,
+      COUNT(*) AS eventos,
+      COUNTIF(es_pago_correcto) AS pagos_correctos,
+      SUM(TOTAL_AMOUNT) AS monto_total,
+      COUNT(TOTAL_AMOUNT) AS montos_informados,
+      MIN(dia_evento) AS primer_dia
+    FROM base
+    GROUP BY GROUPING SETS ((tipo, mes, dia), (tipo, mes, CUS_CUST_ID))
+    """)
+
+
+def monthly_aggregates(desde=None):
+    """
+    Totales por mes calendario (EVENT_DATE) para /api/metrics/monthly (ver monthly_store.py).
+    Con desde solo se leen los meses desde esa fecha: el scan no crece con la historia.
+    """
+    desde_filter = "AND EVENT_DATE >= @desde" if desde is not None else ""
+    return Query(f"""
+    WITH base AS (
+      SELECT
+        CUS_CUST_ID,
+        DATE_TRUNC(EVENT_DATE, MONTH) AS mes,
+        EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success' AS es_emision,
+        EVENT_TYPE = 'Payment' AS es_pago,
+        -- Pago correcto: período fiscal (YEAR/MONTH) = mes inmediatamente anterior a EVENT_DATE
+        EVENT_TYPE = 'Payment'
+          AND {FISCAL_PERIOD_EXPR} = FORMAT_DATE('%Y-%m', DATE_SUB(DATE_TRUNC(EVENT_DATE, MONTH), INTERVAL 1 MONTH))
+          AS es_pago_correcto,
+        TOTAL_AMOUNT
+      FROM {EVENTS_TABLE}
+      WHERE EVENT_DATE IS NOT NULL
+        AND EVENT_DATE <= CURRENT_DATE()
+        AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
+        {desde_filter}
+    )
+    SELECT
+      mes,
+      COUNT(*) AS eventos,
+      COUNTIF(es_emision) AS emisiones,
+      COUNT(DISTINCT IF(es_emision, CUS_CUST_ID, NULL)) AS sellers_emitieron,
+      COUNTIF(es_pago) AS pagos,
+      COUNT(DISTINCT IF(es_pago, CUS_CUST_ID, NULL)) AS sellers_pagaron,
+      COUNTIF(es_pago_correcto) AS pagos_correctos,
+      COUNT(DISTINCT IF(es_pago_correcto, CUS_CUST_ID, NULL)) AS sellers_pagos_correctos,
+      SUM(IF(es_pago, TOTAL_AMOUNT, NULL)) AS monto,
+      COUNT(IF(es_pago, TOTAL_AMOUNT, NULL)) AS montos_informados
+    FROM base
+    GROUP BY mes
+    ORDER BY mes
+    """, [('desde', 'DATE', desde)])
+
+
+def event_snapshot(desde=None):
+    """Columnas de eventos que usan las queries, para el snapshot local (ver event_snapshot.py)"""
+    desde_filter = "AND EVENT_DATE >= @desde" if desde is not None else ""
+    return Query(f"""
+    SELECT
+      SAFE_CAST(CUS_CUST_ID AS INT64) AS CUS_CUST_ID,
+      EVENT_DATE,
+      EVENT_TYPE,
+      SERPRO_STATUS,
+      FROM_VALUE,
+      YEAR,
+      MONTH,
+      CAST(TOTAL_AMOUNT AS FLOAT64) AS TOTAL_AMOUNT
+    FROM {EVENTS_TABLE}
+    WHERE EVENT_DATE IS NOT NULL
+      AND EVENT_DATE <= CURRENT_DATE()
+      AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
+      {desde_filter}
+    """, [('desde', 'DATE', desde)])
+
+
+def daily_sellers():
+    """
+    Sellers distintos y eventos por día y tipo, base de los conteos por rango de fechas
+    (ver distinct_sketch.py). Los pendings se fechan por created_at. Los ids de ambas
+    tablas se castean a INT64: las ramas del UNION ALL deben tener el mismo tipo.
+    """
+    return Query(f"""
+    SELECT
+      EVENT_DATE AS dia,
+      CASE
+        WHEN EVENT_TYPE = 'Payment' THEN 'pago'
+        WHEN SERPRO_STATUS = 'success' THEN 'emision'
+        ELSE 'emision_otro'
+      END AS tipo,
+      COUNT(*) AS eventos,
+      ARRAY_AGG(DISTINCT SAFE_CAST(CUS_CUST_ID AS INT64) IGNORE NULLS) AS sellers
+    FROM {EVENTS_TABLE}
+    WHERE EVENT_DATE IS NOT NULL
+      AND EVENT_DATE <= CURRENT_DATE()
+      AND EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
+    GROUP BY dia, tipo
+
+    UNION ALL
+
+    SELECT
+      DATE(created_at) AS dia,
+      'pendings' AS tipo,
+      COUNT(*) AS eventos,
+      ARRAY_AGG(DISTINCT SAFE_CAST(user_id AS INT64) IGNORE NULLS) AS sellers
+    FROM {PENDINGS_TABLE}
+    WHERE content_id = @content_id
+      AND created_at IS NOT NULL
+    GROUP BY dia
+    """, [('content_id', 'STRING', PENDINGS_CONTENT_ID)])
+
+
+def month_detail(periodo, filter_type):
+    """
+    Métricas de current + previous + top_periodos en una sola query.
+    filter_type 'event' agrupa por EVENT_DATE; 'fiscal' por período fiscal (YEAR/MONTH).
+    """
+    periodo_anterior = previous_periodo(periodo)
+    inicio_actual, fin_actual = parse_periodo(periodo)
+    inicio_anterior, _ = parse_periodo(periodo_anterior)
+    params = [
+        ('periodo', 'STRING', periodo),
+        ('periodo_anterior', 'STRING', periodo_anterior),
+        ('inicio_anterior', 'DATE', inicio_anterior),
+        ('inicio_actual', 'DATE', inicio_actual),
+        ('fin_actual', 'DATE', fin_actual),
+    ]
+
+    if filter_type == 'fiscal':
+        # Sin cota sobre EVENT_DATE: hay pagos con fecha anterior al período fiscal o sin
+        # fecha, y todos cuentan para su período.
+        slot_expr = FISCAL_PERIOD_EXPR
+        filter_clause = f"{slot_expr} IN (@periodo, @periodo_anterior)"
+        cur_cond = f"{slot_expr} = @periodo"
+        prev_cond = f"{slot_expr} = @periodo_anterior"
+    else:
+        filter_clause = "EVENT_DATE BETWEEN @inicio_anterior AND @fin_actual"
+        cur_cond = "EVENT_DATE >= @inicio_actual"
+        prev_cond = "EVENT_DATE < @inicio_actual"
+
+    top_periodos_cte = ""
+    top_periodos_join = "NULL as top_periodos"
+    cross_join = ""
+    if filter_type == 'event':
+        top_periodos_cte = f"""
+        ,fiscal_groups AS (
+          SELECT
+            {FISCAL_PERIOD_EXPR} as periodo_fiscal,
+            COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') as emisiones,
+            COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
+              THEN CUS_CUST_ID END) as sellers
+          FROM base
+          WHERE slot = 'current' AND YEAR IS NOT NULL AND MONTH IS NOT NULL
+          GROUP BY periodo_fiscal
+        ),
+        top_fiscal AS (
+          SELECT ARRAY_AGG(
+            STRUCT(periodo_fiscal, emisiones, sellers)
+            ORDER BY emisiones DESC
+          ) as top_list
+          FROM (
+            SELECT *, ROW_NUMBER() OVER (ORDER BY emisiones DESC) as posicion
+            FROM fiscal_groups
+          ) ranked
+          WHERE posicion <= 10
+        )"""
+        top_periodos_join = "tf.top_list as top_periodos"
+        cross_join = "CROSS JOIN top_fiscal tf"
+
+    return Query(f"""
+    WITH base AS (
+      SELECT
+        EVENT_TYPE, SERPRO_STATUS, CUS_CUST_ID, TOTAL_AMOUNT, YEAR, MONTH, EVENT_DATE,
+        CASE
+          WHEN {cur_cond} THEN 'current'
+          WHEN {prev_cond} THEN 'previous'
+        END as slot
+      FROM {EVENTS_TABLE}
+      WHERE {filter_clause}
+    ),
+    metrics AS (
+      SELECT
+        slot,
+        COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
+          THEN CUS_CUST_ID END) as sellers_emitieron,
+        COUNT(DISTINCT CASE WHEN EVENT_TYPE = 'Payment'
+          THEN CUS_CUST_ID END) as sellers_pagaron,
+        COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success') as cantidad_emisiones,
+        COUNTIF(EVENT_TYPE = 'Payment') as cantidad_pagos,
+        COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'error') as emisiones_error,
+        COUNTIF(EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'already_paid') as emisiones_ya_pagadas,
+        ROUND(SUM(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT ELSE 0 END), 2) as volumen_total,
+        ROUND(AVG(CASE WHEN EVENT_TYPE = 'Payment' THEN TOTAL_AMOUNT END), 2) as ticket_promedio,
+        MIN(EVENT_DATE) as fecha_primera_actividad,
+        MAX(EVENT_DATE) as fecha_ultima_actividad
+      FROM base
+      WHERE slot IS NOT NULL
+      GROUP BY slot
+    ){top_periodos_cte}
+    SELECT m.*, {top_periodos_join}
+    FROM metrics m
+    {cross_join}
+    """, params)
+
+
+def nextsteps_engagement():
+    """Distribución de sellers por días activos"""
+    return Query(f"""
+    SELECT
+      COUNTIF(dias_activos = 1) as sellers_1_dia,
+      COUNTIF(dias_activos BETWEEN 2 AND 3) as sellers_2_3_dias,
+      COUNTIF(dias_activos BETWEEN 4 AND 7) as sellers_4_7_dias,
+      COUNTIF(dias_activos >= 8) as sellers_8_plus_dias
+    FROM (
+      SELECT
+        CUS_CUST_ID,
+        COUNT(DISTINCT DATE(EVENT_DATE)) as dias_activos
+      FROM {EVENTS_TABLE}
+      WHERE EVENT_TYPE IN ('SERPRO-Emission', 'Payment')
+        AND EVENT_DATE <= CURRENT_DATE()
+      GROUP BY CUS_CUST_ID
+    )
+    """)
+
+
+def nextsteps_pending():
+    """Distribución de sellers por períodos fiscales emitidos y no pagados"""
+    return Query(f"""
+    WITH emisiones AS (
+      SELECT
+        CUS_CUST_ID,
+        {FISCAL_PERIOD_EXPR} as periodo_fiscal
+      FROM {EVENTS_TABLE}
+      WHERE EVENT_TYPE = 'SERPRO-Emission' AND SERPRO_STATUS = 'success'
+        AND YEAR IS NOT NULL AND MONTH IS NOT NULL
+      GROUP BY CUS_CUST_ID, periodo_fiscal
+    ),
+    pagos AS (
+      SELECT
+        CUS_CUST_ID,
+        {FISCAL_PERIOD_EXPR} as periodo_fiscal
+      FROM {EVENTS_TABLE}
+      WHERE EVENT_TYPE = 'Payment'
+        AND YEAR IS NOT NULL AND MONTH IS NOT NULL
+      GROUP BY CUS_CUST_ID, periodo_fiscal
+    ),
+    pendientes_por_seller AS (
+      SELECT
+        e.CUS_CUST_ID,
+        COUNT(*) as periodos_pendientes
+      FROM emisiones e
+      LEFT JOIN pagos p ON e.CUS_CUST_ID = p.CUS_CUST_ID AND e.periodo_fiscal = p.periodo_fiscal
+      WHERE p.periodo_fiscal IS NULL
+        AND e.periodo_fiscal <= FORMAT_DATE('%Y-%m', DATE_SUB(CURRENT_DATE(), INTERVAL 1 MONTH))
+      GROUP BY e.CUS_CUST_ID
+    )
+    SELECT
+      COUNTIF(periodos_pendientes = 0) as sellers_0_pendientes,
+      COUNTIF(periodos_pendientes = 1) as sellers_1_pendiente,
+      COUNTIF(periodos_pendientes BETWEEN 2 AND 3) as sellers_2_3_pendientes,
+      COUNTIF(periodos_pendientes BETWEEN 4 AND 6) as sellers_4_6_pendientes,
+      COUNTIF(periodos_pendientes >= 7) as sellers_7_plus_pendientes,
+      ROUND(AVG(periodos_pendientes), 2) as promedio_pendientes
+    FROM pendientes_por_seller
+    """)
+
+
+def _pendings_params():
+    return [
+        ('content_id', 'STRING', PENDINGS_CONTENT_ID),
+        ('pagos_desde', 'DATE', PENDINGS_PAGOS_DESDE),
+        ('periodo_fiscal_desde', 'INT64', PENDINGS_PERIODO_FISCAL_DESDE),
+    ]
+
+
+# Pagos reales del período en que existen pendings. La cota sobre EVENT_DATE poda
+# particiones; la condición fiscal es la que define el universo.
+_PAGOS_PENDINGS_WHERE = """EVENT_TYPE = 'Payment'
+        AND EVENT_DATE IS NOT NULL
+        AND EVENT_DATE BETWEEN @pagos_desde AND CURRENT_DATE()
+        AND SAFE_CAST(YEAR AS INT64) * 100 + SAFE_CAST(MONTH AS INT64) >= @periodo_fiscal_desde"""
+
+
+def pendings_cube():
+    """
+    Cubo de pendings (ver pendings_cube.py): un solo job para summary, monthly y comparison.
+    Una fila por celda, con los sellers distintos de la celda como array (fusionables en proceso):
+      - fuente 'pendings': (período de created_at, período de published, event, reason)
+      - fuente 'pagos': (período de EVENT_DATE, período fiscal, FROM_VALUE = 'pending')
+    """
+    return Query(f"""
+    SELECT
+      'pendings' AS fuente,
+      FORMAT_TIMESTAMP('%Y-%m', created_at) AS periodo_creacion,
+      FORMAT_TIMESTAMP('%Y-%m', published) AS periodo_publicacion,
+      event,
+      reason,
+      CAST(NULL AS STRING) AS periodo_evento,
+      CAST(NULL AS STRING) AS periodo_fiscal,
+      CAST(NULL AS BOOL) AS es_from_value,
+      COUNT(*) AS eventos,
+      SUM(TIMESTAMP_DIFF(published, created_at, DAY)) AS dias_total,
+      COUNT(TIMESTAMP_DIFF(published, created_at, DAY)) AS dias_informados,
+      ARRAY_AGG(DISTINCT CAST(user_id AS STRING) IGNORE NULLS) AS sellers
+    FROM {PENDINGS_TABLE}
+    WHERE content_id = @content_id
+    GROUP BY periodo_creacion, periodo_publicacion, event, reason
+
+    UNION ALL
+
+    SELECT
+      'pagos' AS fuente,
+      NULL AS periodo_creacion,
+      NULL AS periodo_publicacion,
+      NULL AS event,
+      NULL AS reason,
+      FORMAT_DATE('%Y-%m', EVENT_DATE) AS periodo_evento,
+      {FISCAL_PERIOD_EXPR} AS periodo_fiscal,
+      IFNULL(FROM_VALUE = 'pending', FALSE) AS es_from_value,
+      COUNT(*) AS eventos,
+      NULL AS dias_total,
+      NULL AS dias_informados,
+      ARRAY_AGG(DISTINCT CAST(CUS_CUST_ID AS STRING) IGNORE NULLS) AS sellers
+    FROM {EVENTS_TABLE}
+    WHERE {_PAGOS_PENDINGS_WHERE}
+    GROUP BY periodo_evento, periodo_fiscal, es_from_value
+    """, _pendings_params())
+
+
+def pendings_latency(gamma, latencia_minima):
+    """
+    Latencias (en días) hasta el pago, como histograma de buckets logarítmicos por día y tipo
+    (ver quantile_sketch.py): el bucketing se hace acá y no viajan las latencias crudas.
+      - pagada_desde_notif: created_at -> published de los deleted success/success_web.
+      - pago_real: created_at del pending enviado -> primer Payment del seller desde ese día.
+    Cada muestra se fecha por el día del pago. bucket NULL = latencia <= latencia_minima.
+    """
+    return Query(f"""
+    WITH pagadas_desde_notif AS (
+      SELECT
+        DATE(published) AS dia,
+        'pagada_desde_notif' AS tipo,
+        TIMESTAMP_DIFF(published, created_at, SECOND) / 86400 AS dias
+      FROM {PENDINGS_TABLE}
+      WHERE content_id = @content_id
+        AND event = 'deleted'
+        AND reason IN ('success', 'success_web')
+        AND published >= created_at
+    ),
+    enviadas AS (
+      SELECT DISTINCT
+        SAFE_CAST(user_id AS INT64) AS seller,
+        created_at
+      FROM {PENDINGS_TABLE}
+      WHERE content_id = @content_id
+        AND event = 'created'
+        AND reason = 'success'
+        AND created_at IS NOT NULL
+    ),
+    pagos AS (
+      SELECT
+        SAFE_CAST(CUS_CUST_ID AS INT64) AS seller,
+        EVENT_DATE
+      FROM {EVENTS_TABLE}
+      WHERE {_PAGOS_PENDINGS_WHERE}
+    ),
+    pagos_reales AS (
+      SELECT
+        MIN(p.EVENT_DATE) AS dia,
+        'pago_real' AS tipo,
+        DATE_DIFF(MIN(p.EVENT_DATE), DATE(e.created_at), DAY) AS dias
+      FROM enviadas e
+      JOIN pagos p
+        ON p.seller = e.seller
+        AND p.EVENT_DATE >= DATE(e.created_at)
+      GROUP BY e.seller, e.created_at
+    ),
+    latencias AS (
+      SELECT dia, tipo, dias FROM pagadas_desde_notif
+      UNION ALL
+      SELECT dia, tipo, dias FROM pagos_reales
+    )
+    SELECT
+      dia,
+      tipo,
+      IF(dias <= @latencia_minima, NULL, CAST(CEIL(LN(dias) / LN(@gamma)) AS INT64)) AS bucket,
+      COUNT(*) AS muestras
+    FROM latencias
+    GROUP BY dia, tipo, bucket
+    """, _pendings_params() + [
+        ('gamma', 'FLOAT64', gamma),
+        ('latencia_minima', 'FLOAT64', latencia_minima),
+    ])
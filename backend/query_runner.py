@@ -0,0 +1,257 @@
+"""
+Ejecución de queries contra el warehouse.
+
+SingleFlight coalesce llamadas concurrentes idénticas: mientras una query con el
+mismo texto está en vuelo, los siguientes llamadores esperan el resultado de ese
+mismo job en lugar de lanzar otro job de BigQuery.
+
+run_all lanza todos los jobs de un endpoint por adelantado y los espera en paralelo
+con un deadline común, así la latencia del endpoint es la del job más lento y no la
+suma de todos.
+
+query_budget fija para el request en curso un deadline y una función que indica si el
+cliente se desconectó. run_all los respeta: al vencer el deadline o irse el cliente
+abandona los jobs, y los que nadie más espera se cancelan para no seguir facturando.
+"""
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+from contextlib import contextmanager
+
+# Cada cuánto se revisa si el cliente sigue conectado mientras se esperan jobs
+DISCONNECT_POLL_SECONDS = 0.5
+
+
+class QueryDeadlineExceeded(Exception):
+    """Los jobs de un endpoint no terminaron dentro de su deadline."""
+
+
+class QueryCancelled(Exception):
+    """El cliente se desconectó antes de que terminaran los jobs del request."""
+
+
+class _Budget:
+    __slots__ = ('deadline', 'cancelled')
+
+    def __init__(self, deadline, cancelled):
+        self.deadline = deadline
+        self.cancelled = cancelled
+
+
+_current_budget = contextvars.ContextVar('query_budget', default=None)
+
+
+@contextmanager
+def query_budget(timeout=None, cancelled=None):
+    """
+    Deadline (segundos desde ahora) y cancelled() -> bool para las queries del bloque.
+    Se combina con el presupuesto de afuera: gana el deadline más cercano.
+    """
+    parent = _current_budget.get()
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    if parent is not None:
+        if parent.deadline is not None:
+            deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+        cancelled = cancelled or parent.cancelled
+    token = _current_budget.set(_Budget(deadline, cancelled))
+    try:
+        yield
+    finally:
+        _current_budget.reset(token)
+
+
+def current_deadline():
+    """Deadline (time.monotonic) del request en curso, o None si no tiene"""
+    budget = _current_budget.get()
+    return budget.deadline if budget is not None else None
+
+
+class SharedQuery:
+    """Job en vuelo compartido por todos los llamadores que pidieron la misma query."""
+
+    def __init__(self, on_done, on_result=None, deadline=None):
+        self.job = None
+        self.error = None
+        self.callers = 1
+        self.submitted_at = time.monotonic()
+        self.deadline = deadline  # monotonic; acota la espera del job (ver _result)
+        self._rows = None
+        self._done = False
+        self._submitted = threading.Event()
+        self._lock = threading.Lock()
+        self._callers_lock = threading.Lock()
+        self._on_done = on_done
+        self._on_result = on_result
+
+    def rows(self):
+        """Espera el job y devuelve las filas; se materializan una sola vez para todos."""
+        self._submitted.wait()
+        with self._lock:
+            if not self._done:
+                if self.error is None:
+                    try:
+                        self._rows = self._result()
+                    except TimeoutError:
+                        # Vencer job.result(timeout=...) no detiene el job en BigQuery
+                        self._cancel_job()
+                        self.error = QueryDeadlineExceeded(
+                            f"Job {getattr(self.job, 'job_id', '')} sin terminar dentro del deadline; cancelado"
+                        )
+                    except Exception as e:
+                        self.error = e
+                self._done = True
+                self._on_done()
+                if self._on_result is not None:
+                    wall_ms = (time.monotonic() - self.submitted_at) * 1000
+                    try:
+                        self._on_result(self.job, self.error, wall_ms)
+                    except Exception as e:
+                        print(f"Error registrando métricas de query: {e}")
+        if self.error is not None:
+            raise self.error
+        return self._rows
+
+    def _result(self):
+        """
+        Filas del job esperando hasta self.deadline; al vencer se relee, porque un
+        llamador que se sumó después pudo extenderlo (TimeoutError si de verdad venció)
+        """
+        while True:
+            try:
+                return list(self.job.result(timeout=self._timeout()))
+            except TimeoutError:
+                if self.deadline is not None and time.monotonic() >= self.deadline:
+                    raise
+
+    def extend_deadline(self, deadline):
+        """Un llamador nuevo: el job espera hasta el deadline más lejano (None = sin límite)"""
+        if self.deadline is not None:
+            self.deadline = None if deadline is None else max(self.deadline, deadline)
+
+    def _timeout(self):
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def _cancel_job(self):
+        try:
+            self.job.cancel()
+            return True
+        except Exception as e:
+            print(f"No se pudo cancelar el job: {e}")
+            return False
+
+    def abandon(self):
+        """
+        El llamador ya no necesita el resultado. Si nadie más lo espera y el job sigue
+        corriendo, se cancela para no seguir consumiendo cuota.
+        """
+        with self._callers_lock:
+            self.callers -= 1
+            if self.callers > 0 or self._done or self.job is None:
+                return False
+        return self._cancel_job()
+
+
+class SingleFlight:
+    """Registro de queries en vuelo indexadas por clave (texto de la query)."""
+
+    def __init__(self):
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.stats = {'executed': 0, 'coalesced': 0}
+
+    def submit(self, key, submit_fn, on_result=None, deadline=None):
+        """
+        Devuelve el SharedQuery en vuelo para key, o lanza uno nuevo con submit_fn().
+        submit_fn solo se invoca si no había otro llamador esperando la misma query;
+        on_result(job, error, wall_ms) se llama una vez cuando el job termina.
+        deadline (time.monotonic) acota la espera del job; None = sin límite.
+        """
+        with self._lock:
+            shared = self._inflight.get(key)
+            if shared is not None:
+                with shared._callers_lock:
+                    shared.callers += 1
+                    shared.extend_deadline(deadline)
+                self.stats['coalesced'] += 1
+                return shared
+            shared = SharedQuery(
+                on_done=lambda: self._forget(key, shared), on_result=on_result, deadline=deadline
+            )
+            self._inflight[key] = shared
+            self.stats['executed'] += 1
+
+        try:
+            shared.job = submit_fn()
+        except Exception as e:
+            shared.error = e
+        finally:
+            shared._submitted.set()
+        return shared
+
+    def _forget(self, key, shared):
+        with self._lock:
+            if self._inflight.get(key) is shared:
+                del self._inflight[key]
+
+
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix='query')
+
+
+def run_all(submit, queries, timeout=None, on_cancel=None):
+    """
+    Ejecuta en paralelo las queries de un endpoint (dict nombre -> query).
+
+    submit(query) debe devolver un SharedQuery (ver SingleFlight.submit). Todos los jobs
+    se lanzan antes de esperar ninguno; si alguno falla, se supera el timeout (segundos;
+    por defecto el deadline de query_budget) o el cliente se desconecta, se abandonan los
+    demás (cancelando los que nadie más espera) y se propaga el error.
+    on_cancel(motivo, jobs_cancelados) se llama al abandonar por 'deadline' o 'disconnect'.
+    Devuelve dict nombre -> lista de filas.
+    """
+    start = time.monotonic()
+    budget = _current_budget.get()
+    if timeout is None and budget is not None and budget.deadline is not None:
+        timeout = max(0.0, budget.deadline - start)
+    cancelled = budget.cancelled if budget is not None else None
+    deadline = None if timeout is None else start + timeout
+
+    handles = {name: submit(query) for name, query in queries.items()}
+    futures = {name: _executor.submit(handle.rows) for name, handle in handles.items()}
+
+    reason = None
+    while True:
+        wait_s = None if deadline is None else max(0, deadline - time.monotonic())
+        if cancelled is not None:
+            wait_s = DISCONNECT_POLL_SECONDS if wait_s is None else min(wait_s, DISCONNECT_POLL_SECONDS)
+        done, pending = wait(futures.values(), timeout=wait_s, return_when=FIRST_EXCEPTION)
+        failed = next((f for f in done if f.exception() is not None), None)
+        if failed is not None or not pending:
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            reason = 'deadline'
+            break
+        if cancelled is not None and cancelled():
+            reason = 'disconnect'
+            break
+
+    if failed is not None or pending:
+        n_cancelled = sum(
+            1 for name, future in futures.items() if future not in done and handles[name].abandon()
+        )
+        error = failed.exception() if failed is not None else None
+        if isinstance(error, QueryDeadlineExceeded):
+            # El propio job venció su timeout (ver SharedQuery.rows) y ya fue cancelado
+            reason, n_cancelled = 'deadline', n_cancelled + 1
+        if reason is not None and on_cancel is not None:
+            on_cancel(reason, n_cancelled)
+        if error is not None:
+            raise error
+        pending_names = ', '.join(n for n, f in futures.items() if f in pending)
+        if reason == 'disconnect':
+            raise QueryCancelled(f"Cliente desconectado; queries abandonadas: {pending_names}")
+        raise QueryDeadlineExceeded(f"Queries sin terminar tras {round(timeout, 1)}s: {pending_names}")
+
+    return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,176 @@
+"""
+Métricas de costo y latencia de cada job que lanza el backend.
+
+Por job se registra endpoint, job id, bytes procesados/facturados, slot millis, cache hit,
+tiempo en cola y de ejecución; por endpoint, los requests que abandonaron sus jobs por
+deadline o por desconexión del cliente. Por cálculo de endpoint se registra el tiempo total y el
+tiempo de post-procesamiento en Python (total menos la espera de las queries). Todo vive
+en ring buffers acotados y se resume con percentiles por endpoint.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+_current_scope = contextvars.ContextVar('query_stats_scope', default=None)
+
+
+class _Scope:
+    __slots__ = ('endpoint', 'query_ms', 'parent')
+
+    def __init__(self, endpoint, parent):
+        self.endpoint = endpoint
+        self.query_ms = 0.0
+        self.parent = parent
+
+
+def _ms_between(start, end):
+    if start is None or end is None:
+        return None
+    return round((end - start).total_seconds() * 1000, 1)
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """Percentiles nearest-rank de una lista (ignora None)"""
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    result = {}
+    for p in points:
+        rank = max(1, -(-p * len(values) // 100))  # ceil(p * n / 100)
+        result[f'p{p}'] = values[rank - 1]
+    result['max'] = values[-1]
+    return result
+
+
+class QueryStats:
+    """Ring buffers de jobs y de cálculos de endpoint, con resumen por endpoint."""
+
+    def __init__(self, max_records=500):
+        self._jobs = deque(maxlen=max_records)
+        self._computes = deque(maxlen=max_records)
+        self._cancellations = {}
+        self._lock = threading.Lock()
+
+    def current_endpoint(self):
+        scope = _current_scope.get()
+        return scope.endpoint if scope else None
+
+    @contextmanager
+    def scope(self, endpoint):
+        """Atribuye al endpoint los jobs lanzados dentro del bloque y mide su post-procesamiento"""
+        parent = _current_scope.get()
+        scope = _Scope(endpoint, parent)
+        token = _current_scope.set(scope)
+        start = time.monotonic()
+        ok = False
+        try:
+            yield scope
+            ok = True
+        finally:
+            _current_scope.reset(token)
+            total_ms = (time.monotonic() - start) * 1000
+            if parent is not None:
+                # Para el scope padre todo el cálculo anidado cuenta como espera de datos
+                parent.query_ms += total_ms
+            with self._lock:
+                self._computes.append({
+                    'endpoint': endpoint,
+                    'timestamp': datetime.now().isoformat(),
+                    'total_ms': round(total_ms, 1),
+                    'query_wait_ms': round(scope.query_ms, 1),
+                    'postprocess_ms': round(max(0.0, total_ms - scope.query_ms), 1),
+                    'ok': ok,
+                })
+
+    @contextmanager
+    def waiting(self):
+        """Mide el tiempo que el scope actual pasa esperando resultados del warehouse"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            scope = _current_scope.get()
+            if scope is not None:
+                scope.query_ms += (time.monotonic() - start) * 1000
+
+    def record_job(self, endpoint, job, error, wall_ms):
+        created = getattr(job, 'created', None)
+        started = getattr(job, 'started', None)
+        ended = getattr(job, 'ended', None)
+        record = {
+            'endpoint': endpoint,
+            'job_id': getattr(job, 'job_id', None),
+            'timestamp': datetime.now().isoformat(),
+            'total_bytes_processed': getattr(job, 'total_bytes_processed', None),
+            'total_bytes_billed': getattr(job, 'total_bytes_billed', None),
+            'slot_millis': getattr(job, 'slot_millis', None),
+            'cache_hit': getattr(job, 'cache_hit', None),
+            'queue_ms': _ms_between(created, started),
+            'execution_ms': _ms_between(started, ended),
+            'wall_ms': round(wall_ms, 1),
+            'scheduler_wait_ms': getattr(job, 'scheduler_wait_ms', None),
+            'retries': getattr(job, 'retries', None),
+            'error': str(error) if error is not None else None,
+        }
+        with self._lock:
+            self._jobs.append(record)
+
+    def record_cancellation(self, endpoint, reason, jobs_cancelled):
+        """Request que abandonó sus jobs por deadline o desconexión del cliente"""
+        with self._lock:
+            counters = self._cancellations.setdefault(
+                endpoint, {'deadline': 0, 'disconnect': 0, 'jobs_cancelled': 0}
+            )
+            counters[reason] += 1
+            counters['jobs_cancelled'] += jobs_cancelled
+
+    def clear(self):
+        with self._lock:
+            self._jobs.clear()
+            self._computes.clear()
+            self._cancellations.clear()
+
+    def snapshot(self, limit=50):
+        with self._lock:
+            jobs = list(self._jobs)
+            computes = list(self._computes)
+            cancellations = {endpoint: dict(c) for endpoint, c in self._cancellations.items()}
+
+        endpoints = {}
+        for record in jobs:
+            endpoints.setdefault(record['endpoint'], {'jobs': []})['jobs'].append(record)
+        for record in computes:
+            endpoints.setdefault(record['endpoint'], {'jobs': []}).setdefault('computes', []).append(record)
+        for endpoint in cancellations:
+            endpoints.setdefault(endpoint, {'jobs': []})
+
+        summary = {}
+        for endpoint, data in endpoints.items():
+            ep_jobs = data['jobs']
+            ep_computes = data.get('computes', [])
+            cache_flags = [j['cache_hit'] for j in ep_jobs if j['cache_hit'] is not None]
+            summary[str(endpoint)] = {
+                'jobs': len(ep_jobs),
+                'errors': sum(1 for j in ep_jobs if j['error']),
+                'total_bytes_processed': sum(j['total_bytes_processed'] or 0 for j in ep_jobs),
+                'total_bytes_billed': sum(j['total_bytes_billed'] or 0 for j in ep_jobs),
+                'slot_millis': sum(j['slot_millis'] or 0 for j in ep_jobs),
+                'cache_hit_ratio': round(sum(cache_flags) / len(cache_flags), 4) if cache_flags else None,
+                'bytes_billed': percentiles([j['total_bytes_billed'] for j in ep_jobs]),
+                'queue_ms': percentiles([j['queue_ms'] for j in ep_jobs]),
+                'execution_ms': percentiles([j['execution_ms'] for j in ep_jobs]),
+                'wall_ms': percentiles([j['wall_ms'] for j in ep_jobs]),
+                'computes': len(ep_computes),
+                'total_ms': percentiles([c['total_ms'] for c in ep_computes]),
+                'postprocess_ms': percentiles([c['postprocess_ms'] for c in ep_computes]),
+                'cancellations': cancellations.get(endpoint),
+            }
+
+        return {
+            'endpoints': summary,
+            'recent_jobs': jobs[-limit:][::-1],
+            'recent_computes': computes[-limit:][::-1],
+        }
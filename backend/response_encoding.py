@@ -0,0 +1,115 @@
+"""
+Serialización y compresión de las respuestas JSON de los endpoints con caché.
+
+Los cuerpos se serializan con orjson y se comprimen (br o gzip, según Accept-Encoding)
+una sola vez por entrada de caché: se guardan junto al resultado (ver
+ResultCache.derived), así un hit solo copia bytes.
+
+Las listas de filas de las respuestas se arman como Columns, directo de las filas del
+resultado: un array por campo, sin un dict por fila. Con ?format=columnar se devuelven
+así, manteniendo el anidamiento: {'periodo': [...], 'pagos': {'cantidad': [...]}}; sin
+él se arma el array de objetos al serializar.
+"""
+import gzip
+
+import orjson
+
+try:
+    import brotli
+except ImportError:  # opcional: sin brotli se ofrece solo gzip
+    brotli = None
+
+# Por debajo de este tamaño comprimir no ahorra nada
+MIN_COMPRESS_BYTES = 1024
+
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def _extract(rows, fields):
+    return {
+        name: _extract(rows, field) if isinstance(field, dict) else [field(row) for row in rows]
+        for name, field in fields.items()
+    }
+
+
+def _as_rows(columns, length):
+    """Columnas (posiblemente anidadas) -> lista de dicts con el mismo anidamiento"""
+    names = list(columns)
+    values = [_as_rows(c, length) if isinstance(c, dict) else c for c in columns.values()]
+    return [dict(zip(names, row)) for row in zip(*values)] if names else [{} for _ in range(length)]
+
+
+class Columns:
+    """Lista de filas guardada por columnas: {campo: [valores]}, anidado para campos objeto."""
+
+    __slots__ = ('columns', 'length')
+
+    def __init__(self, columns, length):
+        self.columns = columns
+        self.length = length
+
+    @classmethod
+    def from_rows(cls, rows, fields):
+        """fields: {campo: fn(fila)} o, para un campo objeto, un dict anidado de campos"""
+        rows = list(rows)
+        return cls(_extract(rows, fields), len(rows))
+
+    def __len__(self):
+        return self.length
+
+    def column(self, *path):
+        """Valores del campo path, p. ej. column('pagos', 'cantidad')"""
+        column = self.columns
+        for name in path:
+            column = column[name]
+        return column
+
+    def rows(self):
+        return _as_rows(self.columns, self.length)
+
+
+def _rows_default(obj):
+    if isinstance(obj, Columns):
+        return obj.rows()
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def _columnar_default(obj):
+    if isinstance(obj, Columns):
+        return obj.columns
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def dumps(payload, columnar=False):
+    """JSON de payload; las Columns van como array de objetos o, con columnar, por columnas"""
+    return orjson.dumps(payload, default=_columnar_default if columnar else _rows_default)
+
+
+def negotiate(accept_encoding):
+    """Mejor codificación soportada por el cliente ('br', 'gzip' o 'identity')"""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        token, *params = part.split(';')
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(token.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in accepted:
+            return encoding
+    return 'identity'
+
+
+def encode(body, encoding):
+    """(bytes, Content-Encoding o None) del cuerpo JSON body en la codificación pedida"""
+    if encoding == 'identity' or len(body) < MIN_COMPRESS_BYTES:
+        return body, None
+    if encoding == 'br':
+        return brotli.compress(body, quality=5), 'br'
+    return gzip.compress(body, compresslevel=6, mtime=0), 'gzip'
@@ -0,0 +1,124 @@
+"""
+Snapshot en disco de las respuestas de los endpoints, para arrancar sin caché fría.
+
+Después de cada precalentamiento se guarda la última respuesta 200 de cada combinación
+endpoint + parámetros en un único archivo JSON comprimido con gzip (escritura atómica). Un
+proceso nuevo lo carga en background al arrancar: las respuestas entran como stale, así se
+sirven al instante y el primer acceso las recalcula en background.
+"""
+import gzip
+import os
+import threading
+import time
+from datetime import datetime
+
+import orjson
+
+from response_encoding import Columns
+
+FORMAT_VERSION = 3
+
+# Las Columns se guardan por columnas, marcadas con esta clave, y se reconstruyen al cargar
+_COLUMNS_KEY = '__columns__'
+
+
+def _as_tuple(value):
+    """Listas de JSON -> tuplas (las claves de caché son tuplas anidadas)"""
+    return tuple(_as_tuple(v) for v in value) if isinstance(value, list) else value
+
+
+def _encode(obj):
+    if isinstance(obj, Columns):
+        return {_COLUMNS_KEY: obj.columns, 'length': obj.length}
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def _decode(value):
+    """Payload leído del snapshot, con las Columns reconstruidas"""
+    if isinstance(value, dict):
+        if _COLUMNS_KEY in value:
+            return Columns(value[_COLUMNS_KEY], value['length'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(v) for v in value]
+    return value
+
+
+class ResponseSnapshot:
+    """Archivo path con las respuestas de namespace (otro warehouse = snapshot ignorado)."""
+
+    def __init__(self, path, namespace=''):
+        self.path = path
+        self.namespace = namespace
+        self.loaded = threading.Event()
+        self._lock = threading.Lock()
+        self._status = {'loaded_entries': 0, 'saved_at': None, 'load_error': None,
+                        'last_save': None, 'save_error': None}
+
+    def save(self, entries):
+        """entries: lista de (clave, (payload, status), created_at, tags). Devuelve la cantidad guardada"""
+        start = time.time()
+        body = orjson.dumps({
+            'format': FORMAT_VERSION,
+            'namespace': self.namespace,
+            'saved_at': start,
+            'entries': [[key, list(value), created_at, tags] for key, value, created_at, tags in entries],
+        }, default=_encode)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(gzip.compress(body, compresslevel=6))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            with self._lock:
+                self._status['save_error'] = str(e)
+            raise
+        with self._lock:
+            self._status['saved_at'] = start
+            self._status['save_error'] = None
+            self._status['last_save'] = {
+                'entries': len(entries),
+                'bytes': os.path.getsize(self.path),
+                'duration_s': round(time.time() - start, 2),
+            }
+        return len(entries)
+
+    def load(self, restore):
+        """
+        Lee el snapshot y llama restore(clave, (payload, status), created_at, tags) por entrada.
+        Sin archivo, o de otro namespace o formato, no carga nada. Marca loaded al terminar.
+        """
+        try:
+            if not os.path.exists(self.path):
+                return 0
+            with open(self.path, 'rb') as f:
+                data = orjson.loads(gzip.decompress(f.read()))
+            if data.get('format') != FORMAT_VERSION or data.get('namespace') != self.namespace:
+                return 0
+            for key, value, created_at, tags in data['entries']:
+                restore(_as_tuple(key), (_decode(value[0]), value[1]), created_at, tags)
+            with self._lock:
+                self._status['saved_at'] = data['saved_at']
+                self._status['loaded_entries'] = len(data['entries'])
+            return len(data['entries'])
+        except Exception as e:
+            print(f"Error cargando el snapshot de respuestas {self.path}: {e}")
+            with self._lock:
+                self._status['load_error'] = str(e)
+            return 0
+        finally:
+            self.loaded.set()
+
+    def load_in_background(self, restore):
+        threading.Thread(target=self.load, args=(restore,), name='response-snapshot', daemon=True).start()
+
+    def status(self):
+        with self._lock:
+            saved_at = self._status['saved_at']
+            return {
+                'path': self.path,
+                'loaded': self.loaded.is_set(),
+                'saved_at': datetime.fromtimestamp(saved_at).isoformat() if saved_at else None,
+                'age_s': round(time.time() - saved_at) if saved_at else None,
+                **{k: v for k, v in self._status.items() if k != 'saved_at'},
+            }
@@ -0,0 +1,224 @@
+"""
+Almacenes compartidos para la caché de resultados (ver cache.py).
+
+Con varios workers de gunicorn (o varias instancias) cada proceso tiene su propia caché en
+memoria; el almacén compartido hace que un resultado calculado por un worker lo usen los
+demás, y que solo uno lance el job de cada refresco:
+
+  - cada publicación reemplaza la entrada de forma atómica y le asigna una versión
+    creciente por clave, así un worker sabe si lo que tiene en memoria quedó viejo;
+  - un lease por clave (con vencimiento, por si el worker muere) indica quién está
+    calculando; los demás esperan su publicación en lugar de repetir el job.
+
+SQLiteCacheStore (por defecto) usa un archivo compartido por los workers del host;
+RedisCacheStore sirve entre hosts con cualquier servidor que hable el protocolo de Redis.
+Los valores se guardan con pickle: el almacén debe ser solo accesible por el backend.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+StoredEntry = namedtuple('StoredEntry', 'version created_at fresh_until stale_until value')
+
+
+def store_key(key):
+    """Clave de caché (tupla) -> id estable entre procesos"""
+    return hashlib.sha1(repr(key).encode()).hexdigest()
+
+
+def dumps(value):
+    return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    return pickle.loads(data)
+
+
+def _owner():
+    return f"{os.getpid()}:{threading.get_ident()}:{uuid.uuid4().hex[:8]}"
+
+
+class SQLiteCacheStore:
+    """Entradas y leases en un archivo SQLite (modo WAL) compartido por los procesos del host."""
+
+    name = 'sqlite'
+
+    def __init__(self, path, namespace=''):
+        self.path = path
+        self.namespace = namespace
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS entries (
+                  key TEXT PRIMARY KEY,
+                  version INTEGER NOT NULL,
+                  created_at REAL NOT NULL,
+                  fresh_until REAL NOT NULL,
+                  stale_until REAL NOT NULL,
+                  value BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS leases (
+                  key TEXT PRIMARY KEY,
+                  owner TEXT NOT NULL,
+                  expires_at REAL NOT NULL
+                );
+            """)
+
+    def _conn(self):
+        # Una conexión por thread: sqlite3 no comparte conexiones entre threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _key(self, key):
+        return f"{self.namespace}:{store_key(key)}"
+
+    def get(self, key, since_version=0):
+        """StoredEntry de key si existe, vigente y con versión > since_version; si no None"""
+        row = self._conn().execute(
+            "SELECT version, created_at, fresh_until, stale_until, value FROM entries "
+            "WHERE key = ? AND version > ? AND stale_until > ?",
+            (self._key(key), since_version, time.time())
+        ).fetchone()
+        return StoredEntry(*row[:4], loads(row[4])) if row else None
+
+    def version(self, key):
+        row = self._conn().execute("SELECT version FROM entries WHERE key = ? AND stale_until > ?",
+                                   (self._key(key), time.time())).fetchone()
+        return row[0] if row else 0
+
+    def publish(self, key, value, ttl, stale_ttl):
+        """Reemplaza la entrada de forma atómica; devuelve (versión, created_at)"""
+        data = dumps(value)
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT version FROM entries WHERE key = ?", (self._key(key),)).fetchone()
+            # Versiones derivadas del reloj: no retroceden aunque se borre la entrada vencida
+            version = max((row[0] if row else 0) + 1, int(now * 1000))
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, version, created_at, fresh_until, stale_until, value) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self._key(key), version, now, now + ttl, now + ttl + stale_ttl, data)
+            )
+            conn.execute("DELETE FROM entries WHERE stale_until < ?", (now,))
+        return version, now
+
+    def acquire_lease(self, key, ttl):
+        """Owner del lease si se obtuvo, None si otro proceso lo tiene vigente"""
+        owner = _owner()
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.expires_at < ?",
+                (self._key(key), owner, now + ttl, now)
+            )
+        return owner if cursor.rowcount == 1 else None
+
+    def release_lease(self, key, owner):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (self._key(key), owner))
+
+    def status(self):
+        conn = self._conn()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+        leases = conn.execute("SELECT COUNT(*) FROM leases WHERE expires_at > ?", (time.time(),)).fetchone()[0]
+        return {'backend': self.name, 'path': self.path, 'entries': entries, 'bytes': size, 'leases': leases}
+
+
+# Publicación atómica: incrementa la versión (la clave de versión no vence, así nunca
+# retrocede) y escribe la entrada en un solo paso
+_PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[2])
+redis.call('HSET', KEYS[1], 'version', version, 'created_at', ARGV[1], 'fresh_until', ARGV[2],
+           'stale_until', ARGV[3], 'value', ARGV[4])
+redis.call('PEXPIRE', KEYS[1], ARGV[5])
+return version
+"""
+
+# Libera el lease solo si sigue siendo de quien lo pidió
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisCacheStore:
+    """Entradas (hash por clave) y leases (SET NX PX) en un servidor con protocolo Redis."""
+
+    name = 'redis'
+
+    def __init__(self, url, namespace=''):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_STORE=redis requiere el paquete redis (pip install redis)") from e
+        self.url = url
+        self.namespace = namespace
+        self.client = redis.Redis.from_url(url)
+        self._publish = self.client.register_script(_PUBLISH_SCRIPT)
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+
+    def _key(self, key, kind='entry'):
+        return f"dashcache:{self.namespace}:{kind}:{store_key(key)}"
+
+    def get(self, key, since_version=0):
+        version = self.version(key)
+        if version <= since_version:
+            return None
+        fields = self.client.hmget(self._key(key), 'version', 'created_at', 'fresh_until', 'stale_until', 'value')
+        if fields[0] is None or fields[4] is None:
+            return None
+        entry = StoredEntry(int(fields[0]), float(fields[1]), float(fields[2]), float(fields[3]), loads(fields[4]))
+        return entry if entry.stale_until > time.time() else None
+
+    def version(self, key):
+        version = self.client.hget(self._key(key), 'version')
+        return int(version) if version is not None else 0
+
+    def publish(self, key, value, ttl, stale_ttl):
+        now = time.time()
+        version = self._publish(
+            keys=[self._key(key), self._key(key, 'version')],
+            args=[now, now + ttl, now + ttl + stale_ttl, dumps(value), int((ttl + stale_ttl) * 1000)],
+        )
+        return int(version), now
+
+    def acquire_lease(self, key, ttl):
+        owner = _owner()
+        acquired = self.client.set(self._key(key, 'lease'), owner, nx=True, px=int(ttl * 1000))
+        return owner if acquired else None
+
+    def release_lease(self, key, owner):
+        self._release(keys=[self._key(key, 'lease')], args=[owner])
+
+    def status(self):
+        return {'backend': self.name, 'url': self.url.split('@')[-1]}
+
+
+def store_from_env(namespace=''):
+    """Almacén compartido según CACHE_STORE (sqlite por defecto, redis, o memory = sin compartir)"""
+    backend = os.environ.get('CACHE_STORE', 'sqlite').lower()
+    if backend == 'memory':
+        return None
+    if backend == 'sqlite':
+        return SQLiteCacheStore(os.environ.get('CACHE_STORE_PATH', 'response_cache.sqlite'), namespace)
+    if backend == 'redis':
+        return RedisCacheStore(os.environ.get('CACHE_STORE_URL', 'redis://localhost:6379/0'), namespace)
+    raise ValueError(f"CACHE_STORE desconocido: {backend!r} (usar sqlite, redis o memory)")
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos de BT_MP_DAS_TAX_EVENTS y DIM_PENDINGS.
+
+Escribe Parquet con las columnas que usan las queries, en el layout que lee
+DuckDBWarehouse (un directorio por tabla con un archivo por chunk):
+
+    python synthetic_data.py --rows 10000000 --out data
+    WAREHOUSE=duckdb WAREHOUSE_DATA_DIR=data python run_server.py
+
+Modelo:
+  - Cada seller se da de alta en un mes (más altas en meses recientes con growth) y
+    abandona con probabilidad churn por mes; además saltea meses con probabilidad gap.
+  - Las emisiones se reparten uniformemente entre los (seller, mes) activos. Cada
+    emisión exitosa se paga con probabilidad conversion unos días después, con el mismo
+    período fiscal (YEAR/MONTH) que la emisión: el mes anterior, o uno más viejo con
+    probabilidad late_share.
+  - Desde queries.PENDINGS_PAGOS_DESDE, una fracción pending_share de los pagos llega
+    desde una notificación (FROM_VALUE = 'pending') y genera sus filas 'created' y
+    'deleted' en DIM_PENDINGS; las emisiones no pagadas reciben notificaciones con
+    probabilidad notify_rate, que se descartan con probabilidad dismiss_rate.
+
+Todo se genera vectorizado con numpy por chunks de chunk_rows filas, así la memoria no
+depende del total y 100M de filas tardan minutos.
+"""
+import argparse
+import os
+import shutil
+import time
+from datetime import date
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import queries
+
+EVENTS_DIR = 'BT_MP_DAS_TAX_EVENTS'
+PENDINGS_DIR = 'DIM_PENDINGS'
+
+DEFAULTS = {
+    'rows': 1_000_000,
+    'sellers': None,          # por defecto rows // 25
+    'months': 18,
+    'end': None,              # por defecto hoy
+    'churn': 0.08,
+    'growth': 0.03,
+    'gap': 0.15,
+    'success_share': 0.8,
+    'already_paid_share': 0.08,
+    'conversion': 0.7,
+    'late_share': 0.1,
+    'max_payment_lag_days': 10,
+    'pending_share': 0.3,
+    'notify_rate': 0.5,
+    'dismiss_rate': 0.2,
+    'other_content_share': 0.1,
+    'chunk_rows': 2_000_000,
+    'seed': 42,
+}
+
+_EVENT_TYPES = pa.array(['SERPRO-Emission', 'Payment'])
+_STATUSES = pa.array(['success', 'error', 'already_paid'])
+_PENDING_EVENTS = pa.array(['created', 'deleted'])
+_PENDING_REASONS = pa.array(['success', 'success_web', 'dismiss', 'error'])
+_CONTENT_IDS = pa.array([queries.PENDINGS_CONTENT_ID, 'mp.sellers.generic_pendings.other_pendings'])
+_PENDING = pa.array(['pending'])
+
+_SELLER_ID_OFFSET = 100_000_000
+_SECONDS_PER_DAY = 86_400
+
+
+def _month_index(d):
+    return d.year * 12 + d.month - 1
+
+
+def _month_start(index):
+    return np.datetime64(f"{index // 12:04d}-{index % 12 + 1:02d}-01", 'D')
+
+
+def _take(values, indices, mask=None):
+    """Columna de strings (values[indices]) con nulls donde mask es True"""
+    return pc.take(values, pa.array(indices, mask=mask))
+
+
+class _Sellers:
+    """(seller, mes) activos: alta, vida útil por churn y meses salteados por gap."""
+
+    def __init__(self, rng, n_sellers, n_months, churn, growth, gap):
+        weights = (1 + growth) ** np.arange(n_months)
+        self.start = rng.choice(n_months, size=n_sellers, p=weights / weights.sum())
+        if churn > 0:
+            life = rng.geometric(churn, size=n_sellers)
+        else:
+            life = np.full(n_sellers, n_months)
+        self.life = np.minimum(life, n_months - self.start)
+        self.cum = np.cumsum(self.life)
+        self.gap = gap
+
+    def sample(self, rng, n):
+        """n pares (seller, mes_offset) uniformes sobre los (seller, mes) activos no salteados"""
+        k = rng.integers(0, self.cum[-1], size=int(n / (1 - self.gap)) + 1)
+        seller = np.searchsorted(self.cum, k, side='right')
+        month = self.start[seller] + (k - (self.cum[seller] - self.life[seller]))
+        # Meses salteados: hash determinístico de (seller, mes), igual en todos los chunks
+        h = ((seller.astype(np.uint64) * np.uint64(2654435761) + month.astype(np.uint64) * np.uint64(40503))
+             % np.uint64(1 << 32)) / float(1 << 32)
+        keep = h >= self.gap
+        return seller[keep][:n], month[keep][:n]
+
+
+def _events_chunk(rng, sellers, n_rows, first_month, month_starts, end, cfg):
+    n_emis = max(1, int(n_rows / (1 + cfg['success_share'] * cfg['conversion'])))
+
+    seller, month = sellers.sample(rng, n_emis)
+    n_emis = len(seller)
+    days_in_month = (month_starts[1:] - month_starts[:-1]).astype(np.int64)
+    emis_date = month_starts[month] + (rng.random(n_emis) * days_in_month[month]).astype(np.int64)
+
+    status = np.searchsorted(
+        np.cumsum([cfg['success_share'], 1 - cfg['success_share'] - cfg['already_paid_share']]),
+        rng.random(n_emis), side='right'
+    )
+    late = np.where(rng.random(n_emis) < cfg['late_share'], rng.integers(1, 12, size=n_emis), 0)
+    fiscal = first_month + month - 1 - late
+
+    # Pagos: emisiones exitosas convertidas, unos días después, sin pasar de end
+    paid = (status == 0) & (rng.random(n_emis) < cfg['conversion'])
+    pay_date = emis_date + rng.integers(0, cfg['max_payment_lag_days'] + 1, size=n_emis)
+    paid &= pay_date <= end
+    pay_idx = np.flatnonzero(paid)
+    n_pay = len(pay_idx)
+
+    pay_date = pay_date[pay_idx]
+    from_pending = (pay_date >= np.datetime64(queries.PENDINGS_PAGOS_DESDE, 'D')) & (
+        rng.random(n_pay) < cfg['pending_share']
+    )
+    amount = np.round(rng.lognormal(np.log(76.0), 0.35, size=n_pay), 2)
+
+    is_payment = np.concatenate([np.zeros(n_emis, bool), np.ones(n_pay, bool)])
+    fiscal_all = np.concatenate([fiscal, fiscal[pay_idx]])
+    events = pa.table({
+        # STRING como en BigQuery (user_id de DIM_PENDINGS sí es INT64)
+        'CUS_CUST_ID': pc.cast(pa.array(np.concatenate([seller, seller[pay_idx]]) + _SELLER_ID_OFFSET), pa.string()),
+        'EVENT_DATE': pa.array(np.concatenate([emis_date, pay_date])),
+        'EVENT_TYPE': _take(_EVENT_TYPES, is_payment.astype(np.int8)),
+        'SERPRO_STATUS': _take(_STATUSES, np.concatenate([status, np.zeros(n_pay, np.int64)]), mask=is_payment),
+        'YEAR': pc.cast(pa.array(fiscal_all // 12), pa.string()),
+        'MONTH': pc.cast(pa.array(fiscal_all % 12 + 1), pa.string()),
+        'TOTAL_AMOUNT': pa.array(np.concatenate([np.zeros(n_emis), amount]), mask=~is_payment),
+        'FROM_VALUE': _take(_PENDING, np.zeros(n_emis + n_pay, np.int8),
+                            mask=~np.concatenate([np.zeros(n_emis, bool), from_pending])),
+    })
+
+    # Emisiones exitosas no pagadas desde que existen pendings: candidatas a notificación
+    unpaid = (status == 0) & ~paid & (emis_date >= np.datetime64(queries.PENDINGS_PAGOS_DESDE, 'D'))
+    notified = np.flatnonzero(unpaid & (rng.random(n_emis) < cfg['notify_rate']))
+    pendings = _pendings_chunk(
+        rng,
+        paid_users=seller[pay_idx][from_pending],
+        paid_at=pay_date[from_pending],
+        notified_users=seller[notified],
+        notified_at=emis_date[notified],
+        end=end,
+        cfg=cfg,
+    )
+    return events, pendings
+
+
+def _timestamps(days, rng):
+    """Instante aleatorio dentro de cada día"""
+    offsets = rng.integers(0, _SECONDS_PER_DAY, size=len(days)).astype('timedelta64[s]')
+    return days.astype('datetime64[s]') + offsets
+
+
+def _pendings_chunk(rng, paid_users, paid_at, notified_users, notified_at, end, cfg):
+    """
+    Filas de DIM_PENDINGS: por cada pago desde notificación, un 'created' y un 'deleted'
+    (success/success_web); por cada notificación no pagada, un 'created' y, si se
+    descartó, un 'deleted' con reason 'dismiss'.
+    """
+    desde = np.datetime64(queries.PENDINGS_PAGOS_DESDE, 'D')
+    n_paid, n_notif = len(paid_users), len(notified_users)
+
+    paid_deleted = _timestamps(paid_at, rng)
+    lag = rng.exponential(3 * _SECONDS_PER_DAY, size=n_paid).astype('timedelta64[s]')
+    paid_created = np.maximum(paid_deleted - lag, desde.astype('datetime64[s]'))
+
+    notif_created = _timestamps(notified_at + 1, rng)
+    dismissed = rng.random(n_notif) < cfg['dismiss_rate']
+    dismiss_at = notif_created + rng.exponential(5 * _SECONDS_PER_DAY, size=n_notif).astype('timedelta64[s]')
+    dismissed &= dismiss_at < (end + 1).astype('datetime64[s]')
+    dismissed_idx = np.flatnonzero(dismissed)
+
+    user = np.concatenate([paid_users, paid_users, notified_users, notified_users[dismissed_idx]])
+    created_at = np.concatenate([paid_created, paid_created, notif_created, notif_created[dismissed_idx]])
+    published = np.concatenate([paid_created, paid_deleted, notif_created, dismiss_at[dismissed_idx]])
+    event = np.concatenate([
+        np.zeros(n_paid, np.int8), np.ones(n_paid, np.int8),
+        np.zeros(n_notif, np.int8), np.ones(len(dismissed_idx), np.int8),
+    ])
+    reason = np.concatenate([
+        np.zeros(n_paid, np.int8),
+        np.where(rng.random(n_paid) < 0.2, 1, 0).astype(np.int8),  # success_web
+        np.where(rng.random(n_notif) < 0.03, 3, 0).astype(np.int8),  # envíos fallidos
+        np.full(len(dismissed_idx), 2, np.int8),
+    ])
+    content = (rng.random(len(user)) < cfg['other_content_share']).astype(np.int8)
+
+    return pa.table({
+        'user_id': pa.array(user + _SELLER_ID_OFFSET),
+        'event': _take(_PENDING_EVENTS, event),
+        'reason': _take(_PENDING_REASONS, reason),
+        'content_id': _take(_CONTENT_IDS, content),
+        'created_at': pa.array(created_at).cast(pa.timestamp('us', tz='UTC')),
+        'published': pa.array(published).cast(pa.timestamp('us', tz='UTC')),
+    })
+
+
+def generate(out_dir, progress=print, **overrides):
+    """
+    Genera las dos tablas en out_dir (reemplaza las existentes). Los parámetros y sus
+    valores por defecto están en DEFAULTS. Devuelve un resumen con filas y tiempos.
+    """
+    unknown = set(overrides) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Parámetros desconocidos: {', '.join(sorted(unknown))}")
+    cfg = dict(DEFAULTS, **{k: v for k, v in overrides.items() if v is not None})
+    end = np.datetime64(cfg['end'] or date.today(), 'D')
+    end_month = _month_index(end.astype(object))
+    first_month = end_month - cfg['months'] + 1
+    month_starts = np.array(
+        [_month_start(i) for i in range(first_month, end_month + 1)] + [end + 1], dtype='datetime64[D]'
+    )
+    n_sellers = cfg['sellers'] or max(10, cfg['rows'] // 25)
+
+    events_dir = os.path.join(out_dir, EVENTS_DIR)
+    pendings_dir = os.path.join(out_dir, PENDINGS_DIR)
+    for path in (events_dir, pendings_dir):
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+    start = time.monotonic()
+    sellers = _Sellers(np.random.default_rng([cfg['seed'], 0]), n_sellers, cfg['months'],
+                       cfg['churn'], cfg['growth'], cfg['gap'])
+    total_events = total_pendings = 0
+    n_chunks = -(-cfg['rows'] // cfg['chunk_rows'])
+    for chunk in range(n_chunks):
+        n_rows = min(cfg['chunk_rows'], cfg['rows'] - chunk * cfg['chunk_rows'])
+        rng = np.random.default_rng([cfg['seed'], chunk + 1])
+        events, pendings = _events_chunk(rng, sellers, n_rows, first_month, month_starts, end, cfg)
+        pq.write_table(events, os.path.join(events_dir, f'part-{chunk:05d}.parquet'))
+        pq.write_table(pendings, os.path.join(pendings_dir, f'part-{chunk:05d}.parquet'))
+        total_events += events.num_rows
+        total_pendings += pendings.num_rows
+        if progress:
+            progress(f"chunk {chunk + 1}/{n_chunks}: {total_events:,} eventos, "
+                     f"{total_pendings:,} pendings ({time.monotonic() - start:.1f}s)")
+
+    return {
+        'out_dir': os.path.abspath(out_dir),
+        'events': total_events,
+        'pendings': total_pendings,
+        'sellers': n_sellers,
+        'months': [str(month_starts[0]), str(end)],
+        'seconds': round(time.monotonic() - start, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--out', default='data', help='directorio de salida (WAREHOUSE_DATA_DIR)')
+    for name, default in DEFAULTS.items():
+        flag = '--' + name.replace('_', '-')
+        if name == 'end':
+            parser.add_argument(flag, type=date.fromisoformat, help='último EVENT_DATE (YYYY-MM-DD)')
+        elif isinstance(default, float):
+            parser.add_argument(flag, type=float, help=f'default {default}')
+        else:
+            parser.add_argument(flag, type=int, help=f'default {default}')
+    args = vars(parser.parse_args())
+    out_dir = args.pop('out')
+    summary = generate(out_dir, **args)
+    print(f"✅ {summary['events']:,} eventos y {summary['pendings']:,} pendings en {summary['out_dir']} "
+          f"({summary['seconds']}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,346 @@
+"""
+Backends de warehouse sobre los que corren las queries del dashboard.
+
+Todas las queries (queries.Query, dialecto BigQuery con parámetros @nombre) pasan por
+warehouse.submit(query), que devuelve un job con la interfaz mínima que usa el backend:
+.result(), .cancel() y los atributos de métricas de query_stats (job_id, created, ...).
+
+- BigQueryWarehouse: producción. El cliente se crea en el primer submit, así importar
+  app.py no requiere credenciales.
+- DuckDBWarehouse: local. Corre las mismas queries (traducidas con sqlglot) sobre
+  archivos Parquet con DuckDB. Sirve para benchmarks, tests de carga y regresión en una
+  laptop o CI, y para servir desde un snapshot local durante incidentes de BigQuery.
+- SnapshotWarehouse: eventos desde una copia Arrow local sincronizada incrementalmente
+  (event_snapshot.py), pendings desde BigQuery.
+
+Se elige con WAREHOUSE=bigquery|duckdb|snapshot (ver warehouse_from_env).
+"""
+import base64
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+
+import queries
+
+
+class BigQueryWarehouse:
+    """Ejecuta las queries en BigQuery."""
+
+    name = 'bigquery'
+
+    def __init__(self, project=None):
+        self.project = project
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client()
+            return self._client
+
+    def _create_client(self):
+        from google.cloud import bigquery
+
+        # En producción usa GOOGLE_CREDENTIALS_B64 (service account en base64)
+        # En local usa Application Default Credentials (gcloud auth)
+        creds_b64 = os.environ.get('GOOGLE_CREDENTIALS_B64')
+        if creds_b64:
+            from google.oauth2 import service_account
+            creds_json = json.loads(base64.b64decode(creds_b64).decode('utf-8'))
+            credentials = service_account.Credentials.from_service_account_info(
+                creds_json,
+                scopes=['https://www.googleapis.com/auth/bigquery']
+            )
+            return bigquery.Client(credentials=credentials, project=self.project or 'meli-bi-data')
+        return bigquery.Client(project=self.project)
+
+    def submit(self, query):
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter(name, type_, value) for name, type_, value in query.params
+        ])
+        return self.client.query(query.sql, job_config=job_config)
+
+    def fetch_arrow(self, query):
+        """Resultado de la query como iterable de RecordBatch de Arrow (para volúmenes grandes)"""
+        return self.submit(query).result().to_arrow_iterable()
+
+    def table_versions(self):
+        """Última modificación y cantidad de filas de cada tabla fuente (metadata, sin escanear datos)"""
+        versions = {}
+        for table in (queries.EVENTS_TABLE, queries.PENDINGS_TABLE):
+            info = self.client.get_table(table.strip('`'))
+            versions[table] = f"{info.modified.isoformat()}:{info.num_rows}" if info.modified else None
+        return versions
+
+    def describe(self):
+        return {'backend': self.name, 'project': self.project}
+
+
+class Row(dict):
+    """Fila de DuckDB con el mismo acceso que bigquery.Row: row.col, row['col'] y row[i]"""
+
+    def __init__(self, columns, values):
+        super().__init__(zip(columns, values))
+        self._values = values
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return self._values[key]
+        return super().__getitem__(key)
+
+    def values(self):
+        return self._values
+
+
+class LocalJob:
+    """
+    Job de DuckDB con la interfaz de bigquery.QueryJob que usa el backend.
+    La query se ejecuta en el thread que llama a result(); cancel() la interrumpe.
+    """
+
+    total_bytes_processed = None
+    total_bytes_billed = None
+    slot_millis = None
+    cache_hit = False
+
+    def __init__(self, warehouse, sql, params):
+        self.job_id = f"duckdb_{uuid.uuid4().hex[:12]}"
+        self.created = datetime.now(timezone.utc)
+        self.started = None
+        self.ended = None
+        self._warehouse = warehouse
+        self._sql = sql
+        self._params = params
+        self._cursor = None
+        self._cancelled = False
+        self._lock = threading.Lock()
+
+    def result(self, timeout=None):
+        with self._lock:
+            if self._cancelled:
+                raise RuntimeError(f"Job {self.job_id} cancelado")
+            self._cursor = self._warehouse._cursor()
+            self.started = datetime.now(timezone.utc)
+        try:
+            self._cursor.execute(self._sql, self._params)
+            columns = [d[0] for d in self._cursor.description]
+            return [Row(columns, values) for values in self._cursor.fetchall()]
+        finally:
+            self.ended = datetime.now(timezone.utc)
+            with self._lock:
+                self._cursor.close()
+                self._cursor = None
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            if self._cursor is not None:
+                self._cursor.interrupt()
+        return True
+
+
+class DuckDBWarehouse:
+    """
+    Ejecuta las queries con DuckDB sobre Parquet.
+
+    data_dir contiene un Parquet (o un directorio de Parquets) por tabla, con el nombre
+    de la tabla: BT_MP_DAS_TAX_EVENTS(.parquet) y DIM_PENDINGS(.parquet). Las tablas se
+    exponen con los mismos nombres calificados que en BigQuery.
+    """
+
+    name = 'duckdb'
+
+    # Nombre calificado en BigQuery -> nombre del archivo/directorio en data_dir
+    TABLES = {
+        queries.EVENTS_TABLE: 'BT_MP_DAS_TAX_EVENTS',
+        queries.PENDINGS_TABLE: 'DIM_PENDINGS',
+    }
+
+    def __init__(self, data_dir):
+        self._connect()
+        self.data_dir = os.path.abspath(data_dir)
+        for table, file_name in self.TABLES.items():
+            source = self._source(file_name).replace("'", "''")
+            self._register(table, f"read_parquet('{source}')")
+
+    def _connect(self):
+        try:
+            import duckdb
+            import sqlglot
+        except ImportError as e:
+            raise RuntimeError(
+                f"WAREHOUSE={self.name} requiere duckdb y sqlglot (pip install -r requirements-local.txt)"
+            ) from e
+        self._sqlglot = sqlglot
+        self._con = duckdb.connect(':memory:')
+        # BigQuery evalúa DATE(timestamp) y CURRENT_DATE() en UTC
+        self._con.execute("SET TimeZone = 'UTC'")
+        self._translated = {}
+        self._lock = threading.Lock()
+
+    def _source(self, file_name):
+        base = os.path.join(self.data_dir, file_name)
+        if os.path.isdir(base):
+            return os.path.join(base, '**', '*.parquet')
+        if os.path.exists(base + '.parquet'):
+            return base + '.parquet'
+        raise FileNotFoundError(f"No se encontró {base}.parquet ni {base}/ en WAREHOUSE_DATA_DIR")
+
+    def _register(self, table, source):
+        """Expone source (expresión de tabla de DuckDB) con el nombre calificado de BigQuery"""
+        # `proyecto.dataset.tabla` -> catálogo.esquema.tabla; `dataset.tabla` -> esquema.tabla
+        parts = table.strip('`').split('.')
+        quoted = ['"' + p.replace('"', '""') + '"' for p in parts]
+        if len(parts) == 3:
+            self._con.execute(f"ATTACH IF NOT EXISTS ':memory:' AS {quoted[0]}")
+        self._con.execute(f"CREATE SCHEMA IF NOT EXISTS {'.'.join(quoted[:-1])}")
+        self._con.execute(f"CREATE OR REPLACE VIEW {'.'.join(quoted)} AS SELECT * FROM {source}")
+
+    def _cursor(self):
+        with self._lock:
+            return self._con.cursor()
+
+    def translate(self, sql):
+        """SQL de BigQuery -> SQL de DuckDB (memoizado: las queries son un conjunto fijo)"""
+        translated = self._translated.get(sql)
+        if translated is None:
+            translated = self._sqlglot.transpile(sql, read='bigquery', write='duckdb')[0]
+            self._translated[sql] = translated
+        return translated
+
+    def submit(self, query):
+        params = {name: value for name, _, value in query.params}
+        return LocalJob(self, self.translate(query.sql), params)
+
+    def fetch_arrow(self, query):
+        """Resultado de la query como iterable de RecordBatch de Arrow (para volúmenes grandes)"""
+        cursor = self._cursor()
+        try:
+            cursor.execute(self.translate(query.sql), {name: value for name, _, value in query.params})
+            yield from cursor.fetch_record_batch(1 << 20)
+        finally:
+            cursor.close()
+
+    def table_versions(self):
+        """Última modificación y cantidad de filas (footer de los Parquet) de cada tabla"""
+        import pyarrow.parquet as pq
+
+        versions = {}
+        for table, file_name in self.TABLES.items():
+            base = os.path.join(self.data_dir, file_name)
+            if os.path.isdir(base):
+                paths = [os.path.join(root, f) for root, _, files in os.walk(base)
+                         for f in files if f.endswith('.parquet')]
+            else:
+                paths = [base + '.parquet']
+            paths = [p for p in paths if os.path.exists(p)]
+            if not paths:
+                versions[table] = None
+                continue
+            mtime = max(os.stat(p).st_mtime_ns for p in paths)
+            rows = sum(pq.read_metadata(p).num_rows for p in paths)
+            versions[table] = f"{mtime}:{rows}"
+        return versions
+
+    def describe(self):
+        return {'backend': self.name, 'data_dir': self.data_dir}
+
+
+class SnapshotWarehouse(DuckDBWarehouse):
+    """
+    Lee BT_MP_DAS_TAX_EVENTS del snapshot local (event_snapshot.py) con DuckDB y delega el
+    resto en remote: las queries que tocan DIM_PENDINGS, y todas mientras el snapshot no
+    tenga su primera sincronización. La latencia de las queries de eventos deja de
+    depender de la cola de BigQuery.
+    """
+
+    name = 'snapshot'
+
+    # Nombre con el que cada cursor ve la tabla Arrow mapeada en memoria
+    ARROW_NAME = 'event_snapshot_arrow'
+
+    def __init__(self, snapshot, remote):
+        self._connect()
+        self.snapshot = snapshot
+        self.remote = remote
+        self._view_ready = False
+
+    def _cursor(self):
+        # Las tablas Arrow registradas son por conexión: cada cursor fija la versión del
+        # snapshot vigente al empezar su query, aunque una sincronización la reemplace
+        cursor = super()._cursor()
+        cursor.register(self.ARROW_NAME, self.snapshot.table())
+        return cursor
+
+    def _ensure_view(self):
+        with self._lock:
+            if not self._view_ready:
+                self._con.register(self.ARROW_NAME, self.snapshot.table())
+                self._register(queries.EVENTS_TABLE, self.ARROW_NAME)
+                self._con.unregister(self.ARROW_NAME)
+                self._view_ready = True
+
+    def is_local(self, query):
+        return queries.PENDINGS_TABLE not in query.sql and self.snapshot.ready()
+
+    def submit(self, query):
+        if not self.is_local(query):
+            return self.remote.submit(query)
+        self._ensure_view()
+        return super().submit(query)
+
+    def fetch_arrow(self, query):
+        if not self.is_local(query):
+            return self.remote.fetch_arrow(query)
+        self._ensure_view()
+        return super().fetch_arrow(query)
+
+    def sync(self):
+        """Trae al snapshot las filas nuevas de remote (no hace nada si las tablas no cambiaron)"""
+        return self.snapshot.sync(
+            lambda desde: self.remote.fetch_arrow(queries.event_snapshot(desde)),
+            versions=self.remote.table_versions(),
+        )
+
+    def table_versions(self):
+        return self.remote.table_versions()
+
+    def describe(self):
+        return {'backend': self.name, 'remote': self.remote.describe(), 'snapshot': self.snapshot.path}
+
+
+def warehouse_from_env():
+    """Backend configurado por WAREHOUSE (bigquery por defecto) y WAREHOUSE_DATA_DIR"""
+    backend = os.environ.get('WAREHOUSE', 'bigquery').lower()
+    if backend == 'bigquery':
+        return BigQueryWarehouse(project=os.environ.get('BIGQUERY_PROJECT'))
+    if backend == 'duckdb':
+        return DuckDBWarehouse(os.environ.get('WAREHOUSE_DATA_DIR', 'data'))
+    if backend == 'snapshot':
+        from event_snapshot import EventSnapshot
+
+        # Origen del snapshot: BigQuery, o duckdb para probarlo sobre Parquet locales
+        remote_backend = os.environ.get('EVENT_SNAPSHOT_REMOTE', 'bigquery').lower()
+        if remote_backend == 'duckdb':
+            remote = DuckDBWarehouse(os.environ.get('WAREHOUSE_DATA_DIR', 'data'))
+        else:
+            remote = BigQueryWarehouse(project=os.environ.get('BIGQUERY_PROJECT'))
+        snapshot = EventSnapshot(
+            os.environ.get('EVENT_SNAPSHOT_PATH', 'event_snapshot'),
+            late_months=int(os.environ.get('EVENT_SNAPSHOT_LATE_ARRIVAL_MONTHS', 1)),
+            source=repr(sorted(remote.describe().items())),
+        )
+        return SnapshotWarehouse(snapshot, remote)
+    raise ValueError(f"WAREHOUSE desconocido: {backend} (usar bigquery, duckdb o snapshot)")
@@ -18,15 +18,16 @@ function App() {
         setLoading(true);
         setError(null);
 
-        const [monthlyResponse, sellersResponse, sellersRecurrenceResponse] = await Promise.all([
-          axios.get(`${API_URL}/api/metrics/monthly`),
-          axios.get(`${API_URL}/api/metrics/sellers`),
-          axios.get(`${API_URL}/api/metrics/sellers/recurrence`)
-        ]);
-
-        setMonthlyData(monthlyResponse.data);
-        setSellersData(sellersResponse.data);
-        setSellersRecurrenceData(sellersRecurrenceResponse.data);
+        // Los tres paneles en un solo request (comparten el scan del cubo en el backend)
+        const response = await axios.get(`${API_URL}/api/batch?panels=monthly,sellers,recurrence`);
+        const { panels, status } = response.data;
+        if (Object.values(status).some((code) => code !== 200)) {
+          throw new Error(`Error en paneles: ${JSON.stringify(status)}`);
+        }
+
+        setMonthlyData(panels.monthly);
+        setSellersData(panels.sellers);
+        setSellersRecurrenceData(panels.recurrence);
       } catch (err) {
         console.error('Error fetching data:', err);
         setError('Error al cargar los datos. Por favor, verifica que el backend esté corriendo.');
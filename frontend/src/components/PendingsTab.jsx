@@ -20,19 +20,15 @@ function PendingsTab() {
     setError(null);
 
     try {
-      const [summaryResponse, monthlyResponse] = await Promise.all([
-        fetch(`${API_URL}/api/pendings/summary`),
-        fetch(`${API_URL}/api/pendings/monthly`),
-      ]);
-      if (!summaryResponse.ok) throw new Error('Error al cargar resumen de notificaciones');
-      if (!monthlyResponse.ok) throw new Error('Error al cargar datos mensuales');
+      const response = await fetch(`${API_URL}/api/batch?panels=pendings_summary,pendings_monthly`);
+      if (!response.ok) throw new Error('Error al cargar datos de notificaciones');
 
-      const [summaryJson, monthlyJson] = await Promise.all([
-        summaryResponse.json(),
-        monthlyResponse.json(),
-      ]);
-      setSummaryData(summaryJson);
-      setMonthlyData(monthlyJson.data);
+      const { panels, status } = await response.json();
+      if (status.pendings_summary !== 200) throw new Error('Error al cargar resumen de notificaciones');
+      if (status.pendings_monthly !== 200) throw new Error('Error al cargar datos mensuales');
+
+      setSummaryData(panels.pendings_summary);
+      setMonthlyData(panels.pendings_monthly.data);
     } catch (err) {
       setError(err.message);
     } finally {